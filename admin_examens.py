@@ -6,15 +6,24 @@
 
 # ========== IMPORTS ==========
 import streamlit as st
-import json
+import csv
+import io
 import time
 import pandas as pd
 import plotly.express as px
+from bisect import bisect_left
 from datetime import datetime, date, timedelta
 
+from collections import Counter
+
+import numpy as np
+
+from scheduling import ConflictGraph, LocalSearch, OccupancyIndex, SlotBitmap, dsatur
+from ui_theme import freshness_caption
+
 # Importez vos fonctions de base de données depuis vos modules
 try:
-    from connection import execute_query  # Ajustez selon votre structure
+    from connection import execute_query, get_conn  # Ajustez selon votre structure
     from queries import (
         get_occupation_salles,
         get_stats_departement,
@@ -22,13 +31,22 @@ try:
         detecter_tous_les_conflits,
         get_planning_examens,
         valider_examen,
-        valider_tout_le_planning
+        valider_tout_le_planning,
+        fetch_kpis,
+        get_fraicheur_vues,
+        export_planning,
+        export_convocations
     )
+    from query_cache import invalidate_cache, get_query_cache
+    from jobs import STATUTS_ACTIFS, soumettre_job, get_job, list_jobs, annuler_job
 except ImportError:
     # Si les imports échouent, définissez des fonctions vides pour le test
     def execute_query(query, params=None, fetch=False):
         st.error("Fonction execute_query non disponible")
         return []
+
+    def get_conn():
+        raise RuntimeError("Connexion non disponible")
     
     # Définissez les autres fonctions avec des valeurs par défaut
     def get_occupation_salles():
@@ -50,9 +68,43 @@ except ImportError:
         st.info(f"Validation simulée pour l'examen {exam_id}")
         return True
     
-    def valider_tout_le_planning():
+    def valider_tout_le_planning(on_progress=None, user_id=None):
         st.info("Validation globale simulée")
         return True
+    
+    def fetch_kpis(kpis, defaults=None):
+        defaults = defaults or {}
+        return {name: defaults.get(name, 0) for name in kpis}
+    
+    def get_fraicheur_vues():
+        return {}
+
+    def export_planning(fmt="csv"):
+        return b""
+
+    def export_convocations(fmt="csv"):
+        return b""
+
+    def invalidate_cache(*tables):
+        pass
+
+    def get_query_cache():
+        raise RuntimeError("Cache non disponible")
+
+    STATUTS_ACTIFS = ("EN_ATTENTE", "EN_COURS")
+
+    def soumettre_job(type_job, parametres=None, user_id=None):
+        st.error("File de travaux non disponible")
+        return None
+
+    def get_job(job_id, with_result=False):
+        return None
+
+    def list_jobs(type_job=None, limit=20):
+        return []
+
+    def annuler_job(job_id):
+        return False
 
 # ========== CLASSE PRINCIPALE D'OPTIMISATION ==========
 
@@ -60,17 +112,34 @@ class ExamScheduleOptimizer:
     """
     Algorithme d'optimisation automatique des emplois du temps
     Objectif: Générer un planning optimal en < 45 secondes
+    
+    Moteurs :
+    - "coloration" : graphe des modules partageant des étudiants, colorié par
+      DSATUR (une couleur = un jour) -> aucun étudiant avec 2 examens le même jour
+    - "glouton" : ordre de priorité, au plus un examen par formation et par jour
     """
     
-    def __init__(self, start_date: date, end_date: date, department_id: int = None):
+    ENGINES = ("coloration", "glouton")
+    
+    def __init__(self, start_date: date, end_date: date, department_id: int = None,
+                 engine: str = "coloration"):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Moteur inconnu : {engine}")
         self.start_date = start_date
         self.end_date = end_date
         self.department_id = department_id
+        self.engine = engine
         self.conflicts = []
         self.generated_schedule = []
+        self.existing_exams = []  # examens actifs déjà en base, réservés dans les index
+        self.graph = None
+        self.search = None
         
-    def load_data(self):
-        """Charge toutes les données nécessaires depuis la BD"""
+    def load_data(self, verbose=True):
+        """
+        Charge toutes les données nécessaires depuis la BD
+        verbose=False : pas de message Streamlit (worker.py)
+        """
         start_time = time.time()
         
         # Appeler la fonction SQL d'optimisation
@@ -99,11 +168,45 @@ class ExamScheduleOptimizer:
             ORDER BY departement_id
         """)
         
+        # Examens actifs déjà planifiés sur la période (sonde GiST sur creneau) :
+        # les contraintes d'exclusion refuseraient tout chevauchement. Les
+        # bornes sur date_heure (durée de 240 min au plus) limitent la
+        # lecture aux partitions annuelles de la période
+        self.existing_exams = execute_query("""
+            SELECT id, salle_id, professeur_id, date_heure, duree_minutes
+            FROM examens
+            WHERE statut IN ('Planifie', 'Confirme')
+              AND creneau && tsrange(%(debut)s, %(fin)s)
+              AND date_heure > %(debut)s::TIMESTAMP - INTERVAL '240 minutes'
+              AND date_heure < %(fin)s
+        """, {"debut": self.start_date, "fin": self.end_date + timedelta(days=1)})
+        
         load_time = time.time() - start_time
-        st.info(f"⚡ Données chargées en {load_time:.2f}s")
+        if verbose:
+            st.info(f"⚡ Données chargées en {load_time:.2f}s")
         
         return len(self.modules_data or []) > 0
     
+    @classmethod
+    def from_job_result(cls, job):
+        """
+        Planning calculé par worker.py (travail 'generation', lu avec son
+        résultat) : prêt pour l'affichage et save_schedule sans recalcul
+        """
+        params = job['parametres']
+        result = job.get('resultat') or {}
+        optimizer = cls(
+            date.fromisoformat(params['date_debut']), date.fromisoformat(params['date_fin']),
+            params.get('departement_id'), engine=params.get('engine', 'coloration')
+        )
+        optimizer.modules_data = []
+        optimizer.generated_schedule = [
+            dict(e, exam_time=datetime.fromisoformat(e['exam_time'])) for e in result.get('schedule', [])
+        ]
+        optimizer.conflicts = result.get('conflicts', [])
+        optimizer.job_summary = dict(result, schedule=None, conflicts=None, job_id=job['id'], worker=job.get('worker'))
+        return optimizer
+
     def generate_schedule(self):
         """
         Génère le planning optimisé automatiquement
@@ -116,20 +219,11 @@ class ExamScheduleOptimizer:
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        # Étape 1: Tri par priorité (30% du temps)
-        status_text.text("📊 Calcul des priorités...")
-        modules_sorted = self._sort_modules_by_priority()
-        progress_bar.progress(30)
+        def progress(percent, message):
+            status_text.text(message)
+            progress_bar.progress(percent)
         
-        # Étape 2: Attribution des salles (40% du temps)
-        status_text.text("🏫 Attribution des salles...")
-        schedule_with_rooms = self._assign_rooms(modules_sorted)
-        progress_bar.progress(70)
-        
-        # Étape 3: Résolution des conflits (30% du temps)
-        status_text.text("⚠️ Résolution des conflits...")
-        final_schedule = self._resolve_conflicts(schedule_with_rooms)
-        progress_bar.progress(100)
+        final_schedule = self.build_schedule(progress)
         
         generation_time = time.time() - start_time
         
@@ -144,6 +238,116 @@ class ExamScheduleOptimizer:
         self.generated_schedule = final_schedule
         return final_schedule
     
+    def build_schedule(self, progress=None):
+        """
+        Étapes de génération, sans interface (utilisable hors Streamlit)
+        progress(pourcentage, message) est appelé au début de chaque étape
+        """
+        progress = progress or (lambda percent, message: None)
+        
+        # Étape 1: Tri par priorité (30% du temps)
+        progress(0, "📊 Calcul des priorités...")
+        modules_sorted = self._sort_modules_by_priority()
+        
+        # Graphe des conflits étudiants (coloration + détection des conflits)
+        progress(15, "🕸️ Graphe des conflits étudiants...")
+        self._build_conflict_graph(modules_sorted)
+        
+        # Étape 2: Attribution des jours et des salles (40% du temps)
+        if self.engine == "coloration":
+            progress(30, "🎨 Coloration des jours et attribution des salles...")
+            schedule_with_rooms = self._assign_by_coloring(modules_sorted)
+        else:
+            progress(30, "🏫 Attribution des salles...")
+            schedule_with_rooms = self._assign_rooms(modules_sorted)
+        
+        # Étape 3: Résolution des conflits (30% du temps)
+        progress(70, "⚠️ Résolution des conflits...")
+        final_schedule = self._resolve_conflicts(schedule_with_rooms)
+        progress(100, "✅ Planning généré")
+        
+        self.generated_schedule = final_schedule
+        return final_schedule
+    
+    def improve_schedule(self, budget_seconds: float, on_progress=None, weights=None, seed=None):
+        """
+        Phase d'amélioration optionnelle (recuit simulé, cf. scheduling.LocalSearch)
+        après build_schedule. Le planning final est la meilleure solution trouvée
+        dans le budget ; self.search reste consultable (coûts, itérations).
+        """
+        if self.graph is None:
+            raise ValueError("build_schedule doit être appelé avant improve_schedule")
+        
+        modules = self._graph_modules
+        self.search = self._local_search(weights, seed)
+        self.search.run(budget_seconds, on_progress)
+        
+        # Index et planning reconstruits à partir de la meilleure solution
+        self._prepare_indexes()
+        for module, placement in zip(modules, self.search.best_assignment()):
+            if placement:
+                self._place(module, placement[0], self._room_by_id[placement[1]])
+        
+        schedule = [self._entries[m['module_id']] for m in modules if m['module_id'] in self._entries]
+        self.conflicts = self._detect_conflicts(schedule)
+        self.generated_schedule = schedule
+        return schedule
+    
+    def schedule_cost(self, weights=None) -> float:
+        """Coût du planning courant selon l'objectif de LocalSearch (plus bas = meilleur)"""
+        return self._local_search(weights).cost
+    
+    def _local_search(self, weights=None, seed=None):
+        assignment = []
+        for module in self._graph_modules:
+            entry = self._entries.get(module['module_id'])
+            assignment.append((entry['exam_time'], entry['room_id']) if entry else None)
+        
+        return LocalSearch(
+            self._graph_modules, self.rooms or [], self.graph, self._slots, self.occupancy, assignment,
+            groups=[self._group_of(m) for m in self._graph_modules], weights=weights, seed=seed
+        )
+    
+    def adopt_schedule(self, entries):
+        """
+        Reprend un planning calculé ailleurs (ex. composantes générées en parallèle).
+        Chaque examen est conservé s'il reste compatible avec ceux déjà repris
+        (par ordre de priorité), sinon il est replacé ; les modules absents
+        sont placés à la suite.
+        """
+        modules_sorted = self._sort_modules_by_priority()
+        self._build_conflict_graph(modules_sorted)
+        self._prepare_indexes()
+        
+        by_module = {e['module_id']: e for e in entries}
+        pending = []
+        for module in modules_sorted:
+            entry = by_module.get(module['module_id'])
+            room = self._room_by_id.get(entry['room_id']) if entry else None
+            if (room is not None and entry['exam_time'].date() in self._day_index
+                    and room.get('capacite', 0) >= module.get('student_count', 0)
+                    and self._is_slot_available(entry['exam_time'], room['id'], module)
+                    and not self._neighbour_days(self._node_of[module['module_id']])
+                        >> self._day_index[entry['exam_time'].date()] & 1):
+                self._place(module, entry['exam_time'], room)
+            else:
+                pending.append(module)
+        
+        # Réparation : salles disputées entre composantes, conflits transverses
+        for module in pending:
+            best_room = self._find_best_room(module.get('student_count', 0))
+            if best_room is None:
+                continue
+            forbidden = self._neighbour_days(self._node_of[module['module_id']])
+            placement = self._find_available_slot(module, best_room, forbidden)
+            if placement:
+                self._place(module, *placement)
+        
+        self.repaired = len(pending)
+        schedule = [self._entries[m['module_id']] for m in modules_sorted if m['module_id'] in self._entries]
+        self.generated_schedule = self._resolve_conflicts(schedule)
+        return self.generated_schedule
+    
     def _sort_modules_by_priority(self):
         """Trie les modules par priorité"""
         if not self.modules_data:
@@ -177,9 +381,86 @@ class ExamScheduleOptimizer:
         
         return score
     
+    def _prepare_indexes(self):
+        """
+        Index d'occupation (salles, professeurs, formations) et grille des
+        créneaux, construits une seule fois pour toute la génération
+        """
+        self.occupancy = OccupancyIndex()
+        self._slots = self._candidate_slots()
+        self._day_index = {day: d for d, (day, _) in enumerate(self._slots)}
+        self._entries = {}  # module_id -> examen placé
+        self._room_by_id = {r['id']: r for r in (self.rooms or [])}
+        self._rooms_by_capacity = sorted(
+            (r for r in (self.rooms or []) if r.get('capacite', 0) > 0),
+            key=lambda x: x.get('capacite', 0)
+        )
+        self._capacities = [r['capacite'] for r in self._rooms_by_capacity]
+        self._room_pos = {id(r): i for i, r in enumerate(self._rooms_by_capacity)}
+        # Salles occupées au début de chaque créneau (bit = rang par capacité)
+        self._room_busy = SlotBitmap(
+            [t for _, slot_times in self._slots for t in slot_times],
+            len(self._rooms_by_capacity)
+        )
+        self._reserve_existing()
+    
+    def _reserve_existing(self):
+        """Salles et professeurs des examens déjà en base (fixes, hors planning généré)"""
+        positions = {r['id']: self._room_pos[id(r)] for r in self._rooms_by_capacity}
+        for exam in self.existing_exams or []:
+            exam_end = exam['date_heure'] + timedelta(minutes=exam['duree_minutes'])
+            self.occupancy.place(exam['salle_id'], exam['date_heure'], exam_end, exam['professeur_id'])
+            if exam['salle_id'] in positions:
+                self._room_busy.mark(positions[exam['salle_id']], exam['date_heure'], exam_end)
+    
+    def _group_of(self, module):
+        """
+        Groupe soumis à "un examen par jour" : la formation, sauf en mode
+        coloration où le graphe garantit déjà la contrainte par étudiant
+        """
+        if self.engine == "coloration" and module.get('student_ids'):
+            return None
+        return module.get('formation_id')
+    
+    def _place(self, module, time_slot, room):
+        """Enregistre l'examen dans les index et retourne sa ligne de planning"""
+        exam_end = time_slot + timedelta(minutes=module.get('duration_minutes', 120))
+        self.occupancy.place(
+            room['id'], time_slot, exam_end,
+            module.get('professor_id'), self._group_of(module)
+        )
+        if id(room) in self._room_pos:
+            self._room_busy.mark(self._room_pos[id(room)], time_slot, exam_end)
+        
+        entry = {
+            'module_id': module['module_id'],
+            'module_name': module['module_name'],
+            'room_id': room['id'],
+            'room_name': room['nom'],
+            'professor_id': module.get('professor_id'),
+            'exam_time': time_slot,
+            'duration_minutes': module.get('duration_minutes', 120),
+            'student_count': module.get('student_count', 0),
+            'priority_score': module.get('priority_score', 0)
+        }
+        self._entries[module['module_id']] = entry
+        return entry
+    
+    def _unplace(self, module, entry, room):
+        """Retire un examen des index (déplacement lors de la résolution)"""
+        exam_end = entry['exam_time'] + timedelta(minutes=entry['duration_minutes'])
+        self.occupancy.release(
+            entry['room_id'], entry['exam_time'], exam_end,
+            module.get('professor_id'), self._group_of(module)
+        )
+        if id(room) in self._room_pos:
+            self._room_busy.unmark(self._room_pos[id(room)], entry['exam_time'], exam_end)
+        del self._entries[module['module_id']]
+    
     def _assign_rooms(self, modules):
         """Attribue les salles optimales"""
         schedule = []
+        self._prepare_indexes()
         
         for module in modules:
             student_count = module.get('student_count', 0)
@@ -188,24 +469,47 @@ class ExamScheduleOptimizer:
             best_room = self._find_best_room(student_count)
             
             if best_room:
-                # Trouver un créneau disponible
-                time_slot = self._find_available_slot(module, best_room)
+                # Trouver un créneau disponible (salle idéale d'abord, puis
+                # les autres salles suffisantes par capacité croissante)
+                placement = self._find_available_slot(module, best_room)
                 
-                if time_slot:
-                    schedule.append({
-                        'module_id': module['module_id'],
-                        'module_name': module['module_name'],
-                        'room_id': best_room['id'],
-                        'room_name': best_room['nom'],
-                        'professor_id': module.get('professor_id'),
-                        'exam_time': time_slot,
-                        'duration_minutes': module.get('duration_minutes', 120),
-                        'student_count': student_count,
-                        'priority_score': module.get('priority_score', 0)
-                    })
+                if placement:
+                    schedule.append(self._place(module, *placement))
         
         return schedule
     
+    def _build_conflict_graph(self, modules):
+        """Graphe des modules partageant au moins un étudiant (sommet i = modules[i])"""
+        self._graph_modules = modules
+        self._node_of = {m['module_id']: i for i, m in enumerate(modules)}
+        self.graph = ConflictGraph.from_student_lists([m.get('student_ids') or [] for m in modules])
+        return self.graph
+    
+    def _assign_by_coloring(self, modules):
+        """
+        DSATUR sur le graphe des conflits : chaque module reçoit le premier jour
+        non utilisé par ses voisins où un créneau, une salle et le professeur
+        sont libres (une couleur = un jour de la grille)
+        """
+        self._prepare_indexes()
+        best_rooms = [self._find_best_room(m.get('student_count', 0)) for m in modules]
+        
+        def try_colour(v, forbidden_days):
+            module = modules[v]
+            if best_rooms[v] is None:
+                return None
+            placement = self._find_available_slot(module, best_rooms[v], forbidden_days)
+            if placement is None:
+                return None
+            self._place(module, *placement)
+            return self._day_index[placement[0].date()]
+        
+        if self._slots:
+            dsatur(self.graph, try_colour, [m.get('priority_score', 0) for m in modules])
+        
+        # Ordre de priorité, comme le moteur glouton
+        return [self._entries[m['module_id']] for m in modules if m['module_id'] in self._entries]
+    
     def _find_best_room(self, student_count):
         """Trouve la meilleure salle pour un nombre d'étudiants"""
         if not self.rooms:
@@ -224,48 +528,83 @@ class ExamScheduleOptimizer:
                 return room
         
         # Sinon, prendre la plus petite salle suffisante
-        for room in sorted(self.rooms, key=lambda x: x.get('capacite', 0)):
+        rooms_by_capacity = getattr(self, '_rooms_by_capacity', None)
+        if rooms_by_capacity is None:
+            rooms_by_capacity = sorted(self.rooms, key=lambda x: x.get('capacite', 0))
+        for room in rooms_by_capacity:
             if room.get('capacite', 0) >= student_count:
                 return room
         
         return None
     
-    def _find_available_slot(self, module, room):
-        """Trouve un créneau disponible"""
+    def _candidate_rooms(self, slot_time, best_room, student_count):
+        """Salle idéale puis salles suffisantes libres au début du créneau, par capacité croissante"""
+        best_pos = self._room_pos.get(id(best_room))
+        if best_pos is None or self._room_busy.is_free(best_pos, slot_time):
+            yield best_room
+        
+        first = bisect_left(self._capacities, student_count)
+        for pos in self._room_busy.free_bits(slot_time, first):
+            if pos != best_pos:
+                yield self._rooms_by_capacity[pos]
+    
+    def _candidate_slots(self):
+        """Grille des créneaux : [(jour, [8h, 10h, 14h, 16h]), ...] hors week-ends"""
+        slots = []
         current_date = self.start_date
         
         while current_date <= self.end_date:
             # Sauter les week-ends
-            if current_date.weekday() >= 5:
-                current_date += timedelta(days=1)
+            if current_date.weekday() < 5:
+                # Créneaux possibles: 8h, 10h, 14h, 16h
+                slots.append((current_date, [
+                    datetime.combine(current_date, datetime.min.time().replace(hour=hour))
+                    for hour in [8, 10, 14, 16]
+                ]))
+            current_date += timedelta(days=1)
+        
+        return slots
+    
+    def _find_available_slot(self, module, best_room, forbidden_days=0):
+        """
+        Trouve le premier créneau disponible et sa salle : (date_heure, salle)
+        forbidden_days : masque des jours exclus (bit d = self._slots[d])
+        """
+        professor_id = module.get('professor_id')
+        group_id = self._group_of(module)
+        student_count = module.get('student_count', 0)
+        
+        for d, (day, slot_times) in enumerate(self._slots):
+            if forbidden_days >> d & 1:
+                continue
+            # Formation déjà en examen ce jour / professeur au maximum
+            if not self.occupancy.day_is_free(day, professor_id, group_id):
                 continue
             
-            # Créneaux possibles: 8h, 10h, 14h, 16h
-            for hour in [8, 10, 14, 16]:
-                slot_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour))
-                
-                # Vérifier si le créneau est libre
-                if self._is_slot_available(slot_time, room['id'], module):
-                    return slot_time
-            
-            current_date += timedelta(days=1)
+            for slot_time in slot_times:
+                for room in self._candidate_rooms(slot_time, best_room, student_count):
+                    # Vérifier si le créneau est libre
+                    if self._is_slot_available(slot_time, room['id'], module):
+                        return slot_time, room
         
         return None
     
     def _is_slot_available(self, slot_time, room_id, module):
-        """Vérifie si un créneau est disponible"""
-        # Vérifier dans le planning généré
-        for exam in self.generated_schedule:
-            if exam['room_id'] == room_id:
-                exam_time = exam['exam_time']
-                exam_end = exam_time + timedelta(minutes=exam['duration_minutes'])
-                slot_end = slot_time + timedelta(minutes=module.get('duration_minutes', 120))
-                
-                # Chevauchement?
-                if not (slot_end <= exam_time or slot_time >= exam_end):
-                    return False
-        
-        return True
+        """Vérifie si un créneau est disponible (index d'occupation, O(log n))"""
+        slot_end = slot_time + timedelta(minutes=module.get('duration_minutes', 120))
+        return self.occupancy.can_place(
+            room_id, slot_time, slot_end,
+            module.get('professor_id'), self._group_of(module)
+        )
+    
+    def _neighbour_days(self, v):
+        """Masque des jours occupés par les modules voisins de v dans le graphe"""
+        mask = 0
+        for u in self.graph.neighbors(v).tolist():
+            entry = self._entries.get(self._graph_modules[u]['module_id'])
+            if entry:
+                mask |= 1 << self._day_index[entry['exam_time'].date()]
+        return mask
     
     def _resolve_conflicts(self, schedule):
         """Résout les conflits dans le planning"""
@@ -273,73 +612,190 @@ class ExamScheduleOptimizer:
         conflicts = self._detect_conflicts(schedule)
         
         if not conflicts:
+            self.conflicts = []
             return schedule
         
-        # Résolution simple: décaler les examens en conflit
-        resolved_schedule = schedule.copy()
-        
+        # Résolution simple: décaler l'examen le moins prioritaire de chaque
+        # conflit étudiant vers un jour libre pour tous ses voisins
         for conflict in conflicts:
-            # Logique de résolution à implémenter
-            pass
+            if conflict['type_conflit'] != 'Étudiant >1 examen/jour':
+                continue
+            
+            module_id = min(
+                conflict['module_ids'],
+                key=lambda m: self._graph_modules[self._node_of[m]].get('priority_score', 0)
+            )
+            v = self._node_of[module_id]
+            module = self._graph_modules[v]
+            entry = self._entries[module_id]
+            forbidden = self._neighbour_days(v)
+            if not forbidden >> self._day_index[entry['exam_time'].date()] & 1:
+                continue  # déjà résolu par un déplacement précédent
+            
+            room = self._room_by_id[entry['room_id']]
+            self._unplace(module, entry, room)
+            best_room = self._find_best_room(module.get('student_count', 0)) or room
+            placement = self._find_available_slot(module, best_room, forbidden)
+            # Aucun jour compatible : l'examen reste à sa place
+            self._place(module, *(placement or (entry['exam_time'], room)))
         
+        resolved_schedule = [self._entries[e['module_id']] for e in schedule]
+        self.conflicts = self._detect_conflicts(resolved_schedule)
         return resolved_schedule
     
     def _detect_conflicts(self, schedule):
         """Détecte tous les conflits"""
         conflicts = []
         
-        # Conflit 1: Étudiants avec > 1 examen/jour
+        # Conflit 1: Étudiants avec > 1 examen/jour (modules voisins le même jour)
+        if self.graph is not None and self.graph.n_edges:
+            day_of = np.full(self.graph.n, -1, dtype=np.int64)
+            for exam in schedule:
+                day_of[self._node_of[exam['module_id']]] = self._day_index[exam['exam_time'].date()]
+            
+            rows = np.repeat(np.arange(self.graph.n), self.graph.degrees())
+            cols = self.graph.indices
+            same_day = (rows < cols) & (day_of[rows] >= 0) & (day_of[rows] == day_of[cols])
+            
+            for u, v, shared in zip(rows[same_day].tolist(), cols[same_day].tolist(),
+                                    self.graph.weights[same_day].tolist()):
+                mu = self._graph_modules[u]['module_id']
+                mv = self._graph_modules[v]['module_id']
+                conflicts.append({
+                    'type_conflit': 'Étudiant >1 examen/jour',
+                    'details': f"Modules {mu} et {mv} le {self._slots[day_of[u]][0]} ({shared} étudiant(s) commun(s))",
+                    'severite': 'CRITIQUE',
+                    'module_ids': [mu, mv]
+                })
+        
         # Conflit 2: Professeurs avec > 3 examens/jour
+        per_prof_day = Counter(
+            (exam['professor_id'], exam['exam_time'].date())
+            for exam in schedule if exam.get('professor_id') is not None
+        )
+        for (professor_id, day), count in per_prof_day.items():
+            if count > self.occupancy.max_prof_per_day:
+                conflicts.append({
+                    'type_conflit': 'Professeur >3 examens/jour',
+                    'details': f"Professeur ID: {professor_id} a {count} examens le {day}",
+                    'severite': 'CRITIQUE',
+                    'module_ids': [e['module_id'] for e in schedule
+                                   if e.get('professor_id') == professor_id and e['exam_time'].date() == day]
+                })
+        
         # Conflit 3: Chevauchements de salles
+        by_room = {}
+        for exam in schedule:
+            by_room.setdefault(exam['room_id'], []).append(exam)
+        for room_id, exams in by_room.items():
+            exams.sort(key=lambda e: e['exam_time'])
+            for e1, e2 in zip(exams, exams[1:]):
+                if e2['exam_time'] < e1['exam_time'] + timedelta(minutes=e1['duration_minutes']):
+                    conflicts.append({
+                        'type_conflit': 'Chevauchement salle',
+                        'details': f"Salle ID: {room_id} - Modules {e1['module_id']} et {e2['module_id']} se chevauchent",
+                        'severite': 'ÉLEVÉ',
+                        'module_ids': [e1['module_id'], e2['module_id']]
+                    })
         
         return conflicts
     
-    def save_schedule(self):
-        """Sauvegarde le planning dans la BD"""
+    def save_schedule(self, user_id=None):
+        """
+        Sauvegarde le planning dans la BD : COPY dans la table de transit
+        examens_import puis importer_examens_import() (revalidation, insertion
+        ensembliste, une seule entrée d'audit), en une transaction
+        """
         if not self.generated_schedule:
             return False, "Aucun planning à sauvegarder"
-        
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for exam in self.generated_schedule:
+            writer.writerow([
+                exam['module_id'], exam['professor_id'], exam['room_id'],
+                exam['exam_time'].isoformat(sep=' '), exam['duration_minutes'],
+                exam.get('student_count')
+            ])
+        buffer.seek(0)
+
         try:
-            # Convertir en JSON pour la fonction SQL
-            schedule_json = json.dumps(self.generated_schedule, default=str)
-            
-            query = "SELECT save_optimized_schedule(%s::jsonb)"
-            result = execute_query(query, (schedule_json,), fetch=True)
-            
-            if result:
-                count = result[0].get('save_optimized_schedule', 0)
-                return True, f"✅ {count} examens sauvegardés"
-            
-            return False, "Erreur lors de la sauvegarde"
-            
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT preparer_import_examens()")
+                    cur.copy_expert(
+                        "COPY examens_import (module_id, professor_id, room_id, exam_time, "
+                        "duration_minutes, student_count) FROM STDIN WITH (FORMAT csv)",
+                        buffer
+                    )
+                    cur.execute("SELECT inseres, rejetes FROM importer_examens_import(%s)", (user_id,))
+                    inserted, rejected = cur.fetchone()
+                    cur.execute("""
+                        SELECT motif_rejet, COUNT(*) FROM examens_import
+                        WHERE motif_rejet IS NOT NULL
+                        GROUP BY motif_rejet ORDER BY COUNT(*) DESC
+                    """)
+                    reasons = cur.fetchall()
+                conn.commit()
+            invalidate_cache("examens")
+
+            message = f"✅ {inserted} examens sauvegardés"
+            if rejected:
+                details = ", ".join(f"{reason} : {count}" for reason, count in reasons)
+                message += f" — {rejected} refusés ({details})"
+            return True, message
+
         except Exception as e:
             return False, f"Erreur: {str(e)}"
 
 
+# ========== SUIVI DES TRAVAUX EN ARRIÈRE-PLAN (worker.py) ==========
+
+@st.fragment(run_every=2)
+def _suivi_job(job_id):
+    """Progression relue toutes les 2s ; rerun complet dès que le travail se termine"""
+    job = get_job(job_id)
+    if job is None or job["statut"] not in STATUTS_ACTIFS:
+        st.rerun()
+    if job["statut"] == "EN_ATTENTE":
+        label = "⏳ En attente d'un worker (python worker.py)"
+    else:
+        label = f"⚙️ {job['message'] or 'En cours'} — {job['worker']}"
+    st.progress(job["progression"], text=f"Travail #{job_id} : {label}")
+    if st.button("🛑 Annuler", key=f"annuler_job_{job_id}"):
+        annuler_job(job_id)
+        st.rerun()
+
+
+def suivre_job(state_key):
+    """
+    Suit le travail dont l'id est dans st.session_state[state_key].
+    Retourne le travail (avec son résultat) une fois terminé, None sinon.
+    """
+    job_id = st.session_state.get(state_key)
+    if not job_id:
+        return None
+    job = get_job(job_id)
+    if job is not None and job["statut"] in STATUTS_ACTIFS:
+        _suivi_job(job_id)
+        return None
+
+    del st.session_state[state_key]
+    if job is None:
+        return None
+    if job["statut"] == "TERMINE":
+        return get_job(job_id, with_result=True)
+    if job["statut"] == "ECHOUE":
+        st.error(f"❌ Travail #{job_id} en échec : {job['erreur']}")
+    else:
+        st.warning(f"🛑 Travail #{job_id} annulé")
+    return None
+
+
 def admin_dashboard():
     # Pas besoin de réimporter streamlit ici car déjà importé en haut
     # from datetime import datetime, timedelta  # Déjà importé en haut
     
-    # ----------------------------
-    # Helper sécurisé pour requêtes scalaires (CORRIGÉ POUR None)
-    # ----------------------------
-    def q1(sql: str, default=0):
-        rows = execute_query(sql)
-        if not rows:
-            return default
-        row = rows[0]
-        value = None
-        if hasattr(row, 'keys') and len(row) > 0:
-            value = list(row.values())[0]
-        elif hasattr(row, '__getitem__') and len(row) > 0:
-            value = row[0]
-        else:
-            value = row
-        # Gérer les NULL / None
-        if value is None:
-            return default
-        return value
-
     # ----------------------------
     # CSS personnalisé
     # ----------------------------
@@ -423,6 +879,16 @@ def admin_dashboard():
     st.sidebar.markdown("---")
     compact = st.sidebar.toggle("Mode compact", value=False)
 
+    try:
+        cache = get_query_cache().stats()
+        etat = "actif" if cache["enabled"] else "contourné"
+        st.sidebar.caption(
+            f"🗃️ Cache {etat} : {cache['hit_rate']:.0%} de succès "
+            f"({cache['hits']} / {cache['hits'] + cache['misses']}), {cache['entries']} entrée(s)"
+        )
+    except Exception:
+        pass
+
     # ----------------------------
     # Header
     # ----------------------------
@@ -451,38 +917,42 @@ def admin_dashboard():
 
         col1, col2, col3, col4, col5 = st.columns(5)
 
-        total_examens = q1("""
-            SELECT COUNT(*) FROM examens
-            WHERE statut IN ('Planifie', 'Confirme') AND date_heure >= CURRENT_DATE
-        """, 0)
-
-        taux_salles = q1("""
-            SELECT ROUND(
-                (SELECT COUNT(DISTINCT salle_id) FROM examens
-                 WHERE statut IN ('Planifie','Confirme') AND date_heure >= CURRENT_DATE) * 100.0 /
-                NULLIF((SELECT COUNT(*) FROM lieux_examen WHERE is_disponible = TRUE), 0),
-                2
-            )
-        """, 0.0)
-
-        conflits_total = q1("""
-            SELECT COUNT(*) FROM (SELECT * FROM detecter_conflits()) _
-        """, 0)
-
-        taux_confirmes = q1("""
-            SELECT ROUND(
-                COUNT(*) FILTER (WHERE statut = 'Confirme') * 100.0 / NULLIF(COUNT(*), 0),
-                2
-            ) FROM examens WHERE date_heure >= CURRENT_DATE
-        """, 0.0)
-
-        total_etudiants = q1("""
-            SELECT COUNT(DISTINCT i.etudiant_id)
-            FROM examens e
-            JOIN inscriptions i ON e.module_id = i.module_id
-            WHERE i.statut = 'Inscrit' AND e.statut IN ('Planifie','Confirme')
-              AND e.date_heure >= CURRENT_DATE
-        """, 0)
+        # Tous les KPIs en un seul aller-retour
+        kpis = fetch_kpis({
+            "total_examens": """
+                SELECT COUNT(*) FROM examens
+                WHERE statut IN ('Planifie', 'Confirme') AND date_heure >= CURRENT_DATE
+            """,
+            "taux_salles": """
+                SELECT ROUND(
+                    (SELECT COUNT(DISTINCT salle_id) FROM examens
+                     WHERE statut IN ('Planifie','Confirme') AND date_heure >= CURRENT_DATE) * 100.0 /
+                    NULLIF((SELECT COUNT(*) FROM lieux_examen WHERE is_disponible = TRUE), 0),
+                    2
+                )
+            """,
+            "conflits_total": "SELECT COUNT(*) FROM conflits_actifs",
+            "taux_confirmes": """
+                SELECT ROUND(
+                    COUNT(*) FILTER (WHERE statut = 'Confirme') * 100.0 / NULLIF(COUNT(*), 0),
+                    2
+                ) FROM examens WHERE date_heure >= CURRENT_DATE
+            """,
+            "total_etudiants": """
+                SELECT COUNT(DISTINCT i.etudiant_id)
+                FROM examens e
+                JOIN inscriptions i ON e.module_id = i.module_id
+                WHERE i.statut = 'Inscrit' AND e.statut IN ('Planifie','Confirme')
+                  AND e.date_heure >= CURRENT_DATE
+                  AND i.annee_academique >= premiere_annee_active()
+            """,
+        }, {"taux_salles": 0.0, "taux_confirmes": 0.0})
+
+        total_examens = kpis["total_examens"]
+        taux_salles = kpis["taux_salles"]
+        conflits_total = kpis["conflits_total"]
+        taux_confirmes = kpis["taux_confirmes"]
+        total_etudiants = kpis["total_etudiants"]
 
         with col1: kpi_card("📝 Examens", f"{int(total_examens):,}", "Planifiés ou confirmés", "ok")
         with col2: kpi_card("🏢 Salles", f"{float(taux_salles):.1f}%", "Utilisation", "ok" if float(taux_salles) >= 40 else "warn")
@@ -494,11 +964,13 @@ def admin_dashboard():
 
         # --- Occupation salles ---
         section_header("🏢 Occupation des salles")
+        fraicheur = get_fraicheur_vues()
         occ = get_occupation_salles()
         if not occ.empty:
             cols_show = [c for c in ["nom", "type", "capacite", "nb_examens_planifies", "pourcentage_utilisation"] if c in occ.columns]
             df_occ = occ[cols_show] if cols_show else occ
             st.dataframe(df_occ, use_container_width=True, height=300 if compact else 400)
+            freshness_caption(fraicheur.get("mv_occupation_salles"))
         else:
             st.info("Aucune donnée d'occupation.")
 
@@ -509,6 +981,7 @@ def admin_dashboard():
         stats = get_stats_departement()
         if not stats.empty:
             st.dataframe(stats, use_container_width=True, height=300 if compact else 400)
+            freshness_caption(fraicheur.get("mv_stats_departement"))
         else:
             st.info("Aucune statistique disponible.")
 
@@ -516,40 +989,51 @@ def admin_dashboard():
 
         # --- Vérification contraintes ---
         section_header("✅ Contraintes critiques")
-        violations = q1("""
-            SELECT
-              (SELECT COUNT(*) FROM (
-                SELECT etudiant_id, DATE(date_heure)
-                FROM examens e JOIN inscriptions i USING(module_id)
-                WHERE i.statut = 'Inscrit' AND e.statut IN ('Planifie','Confirme')
-                GROUP BY etudiant_id, DATE(date_heure)
-                HAVING COUNT(*) > 1
-              ) _) AS etu_viol,
-              (SELECT COUNT(*) FROM (
-                SELECT professeur_id, DATE(date_heure)
-                FROM examens
-                WHERE statut IN ('Planifie','Confirme')
-                GROUP BY professeur_id, DATE(date_heure)
-                HAVING COUNT(*) > 3
-              ) _) AS prof_viol,
-              (SELECT COUNT(*) FROM (
-                SELECT e.id
-                FROM examens e
-                JOIN lieux_examen l ON e.salle_id = l.id
-                JOIN (SELECT module_id, COUNT(*) nb FROM inscriptions WHERE statut='Inscrit' GROUP BY module_id) i ON e.module_id = i.module_id
-                WHERE e.statut IN ('Planifie','Confirme') AND i.nb > l.capacite
-              ) _) AS cap_viol
-        """, {"etu_viol": 0, "prof_viol": 0, "cap_viol": 0})
+        violations = fetch_kpis({
+            "etu_viol": """
+                SELECT COUNT(*) FROM (
+                  SELECT etudiant_id, DATE(date_heure)
+                  FROM examens e JOIN inscriptions i USING(module_id)
+                  WHERE i.statut = 'Inscrit' AND e.statut IN ('Planifie','Confirme')
+                    AND e.date_heure >= debut_annees_actives()
+                    AND i.annee_academique >= premiere_annee_active()
+                  GROUP BY etudiant_id, DATE(date_heure)
+                  HAVING COUNT(*) > 1
+                ) _
+            """,
+            "prof_viol": """
+                SELECT COUNT(*) FROM (
+                  SELECT professeur_id, DATE(date_heure)
+                  FROM examens
+                  WHERE statut IN ('Planifie','Confirme')
+                    AND date_heure >= debut_annees_actives()
+                  GROUP BY professeur_id, DATE(date_heure)
+                  HAVING COUNT(*) > 3
+                ) _
+            """,
+            "cap_viol": """
+                SELECT COUNT(*) FROM (
+                  SELECT e.id
+                  FROM examens e
+                  JOIN lieux_examen l ON e.salle_id = l.id
+                  JOIN (SELECT module_id, COUNT(*) nb FROM inscriptions
+                        WHERE statut='Inscrit' AND annee_academique >= premiere_annee_active()
+                        GROUP BY module_id) i ON e.module_id = i.module_id
+                  WHERE e.statut IN ('Planifie','Confirme') AND i.nb > l.capacite
+                    AND e.date_heure >= debut_annees_actives()
+                ) _
+            """,
+        })
 
         c1, c2, c3 = st.columns(3)
         with c1:
-            v = int(violations.get("etu_viol", 0)) if isinstance(violations, dict) else 0
+            v = int(violations["etu_viol"])
             st.success("✅ Étudiants : max 1/jour") if v == 0 else st.error(f"❌ {v} violations")
         with c2:
-            v = int(violations.get("prof_viol", 0)) if isinstance(violations, dict) else 0
+            v = int(violations["prof_viol"])
             st.success("✅ Profs : max 3/jour") if v == 0 else st.error(f"❌ {v} violations")
         with c3:
-            v = int(violations.get("cap_viol", 0)) if isinstance(violations, dict) else 0
+            v = int(violations["cap_viol"])
             st.success("✅ Capacité salles OK") if v == 0 else st.error(f"❌ {v} violations")
 
     # =====================================================
@@ -569,11 +1053,166 @@ def admin_dashboard():
             return
 
         st.markdown("### Options d'optimisation")
+        moteur = st.radio(
+            "Moteur",
+            ["🎨 Coloration (Python)", "📋 Glouton (Python)", "🗄️ SQL"],
+            horizontal=True
+        )
         opt1 = st.toggle("Optimiser occupation salles", True)
         opt2 = st.toggle("Équilibrer surveillances profs", True)
         opt3 = st.toggle("Priorité département", True)
+        budget = st.slider(
+            "⏱️ Budget d'amélioration (s)", 0, 60, 10,
+            help="Recherche locale après la génération : la meilleure solution trouvée dans le budget est conservée",
+            disabled=moteur == "🗄️ SQL"
+        )
+        parallele = st.toggle(
+            "⚡ Calcul parallèle (multi-processus)", False,
+            help="Découpe par composantes d'étudiants ou par département, plusieurs essais par groupe, puis fusion",
+            disabled=moteur == "🗄️ SQL"
+        )
+        redemarrages = st.number_input("Essais par groupe", 1, 16, 4, disabled=not parallele or moteur == "🗄️ SQL")
+        arriere_plan = st.toggle(
+            "📨 Exécuter en arrière-plan (worker)", False,
+            help="Le calcul est confié à un processus worker.py : la page reste utilisable et un rafraîchissement ne l'interrompt pas",
+            disabled=moteur == "🗄️ SQL"
+        )
+
+        lancer = moteur != "🗄️ SQL" and st.button("🚀 Lancer génération", type="primary", use_container_width=True)
+        engine = "coloration" if moteur.startswith("🎨") else "glouton"
+        if lancer and arriere_plan:
+            weights = {}
+            if not opt1:
+                weights["W_FILL"] = 0.0
+            if not opt2:
+                weights["W_PROF"] = 0.0
+            job_id = soumettre_job("generation", {
+                "date_debut": date_debut.isoformat(),
+                "date_fin": date_fin.isoformat(),
+                "engine": engine,
+                "budget": budget,
+                "weights": weights,
+                "parallele": parallele,
+                "redemarrages": int(redemarrages),
+            }, st.session_state.get("user", {}).get("id"))
+            if job_id:
+                st.session_state["admin_job_generation"] = job_id
+        elif lancer:
+            optimizer = ExamScheduleOptimizer(date_debut, date_fin, engine=engine)
+            try:
+                if not optimizer.load_data():
+                    st.info("Aucun module à planifier sur cette période.")
+                elif parallele:
+                    from parallel_scheduler import generate_parallel
+
+                    progress_bar = st.progress(0, text="⚡ Calcul parallèle...")
+                    optimizer = generate_parallel(
+                        optimizer.modules_data, optimizer.rooms, date_debut, date_fin,
+                        existing_exams=optimizer.existing_exams, engine=engine, restarts=int(redemarrages), budget_seconds=budget,
+                        on_progress=lambda done, total: progress_bar.progress(
+                            int(done * 100 / total), text=f"⚡ {done}/{total} tâches terminées"
+                        )
+                    )
+                    progress_bar.empty()
+                    stats = optimizer.parallel_stats
+                    st.success(
+                        f"✅ {stats['groups']} groupe(s) × {int(redemarrages)} essai(s) sur {stats['workers']} processus "
+                        f"en {stats['solve_time'] + stats['merge_time']:.1f}s — {stats['repaired']} examen(s) replacé(s) à la fusion"
+                    )
+                    st.session_state["admin_optimizer"] = optimizer
+                else:
+                    optimizer.generate_schedule()
+
+                    if budget > 0:
+                        section_header("📉 Amélioration continue", "Coût du planning (plus bas = meilleur)")
+                        chart = st.empty()
+                        caption = st.empty()
+                        history = []
+
+                        def on_progress(elapsed, cost, best):
+                            history.append({"temps (s)": round(elapsed, 2), "coût courant": cost, "meilleur": best})
+                            chart.line_chart(pd.DataFrame(history).set_index("temps (s)"))
+                            caption.caption(f"⏱️ {elapsed:.1f}s / {budget}s — meilleur coût : {best:,.1f}")
+
+                        weights = {}
+                        if not opt1:
+                            weights["W_FILL"] = 0.0
+                        if not opt2:
+                            weights["W_PROF"] = 0.0
+                        optimizer.improve_schedule(budget, on_progress, weights=weights)
 
-        if st.button("🚀 Lancer génération", type="primary", use_container_width=True):
+                        search = optimizer.search
+                        gain = (search.initial_cost - search.best_cost) / search.initial_cost * 100 if search.initial_cost else 0
+                        st.success(f"✅ Coût {search.initial_cost:,.1f} → {search.best_cost:,.1f} (-{gain:.1f}%) en {search.iterations:,} itérations")
+
+                    st.session_state["admin_optimizer"] = optimizer
+            except Exception as e:
+                st.error(f"Erreur lors de la génération : {str(e)}")
+
+        job = suivre_job("admin_job_generation") if moteur != "🗄️ SQL" else None
+        if job is not None:
+            st.session_state["admin_optimizer"] = ExamScheduleOptimizer.from_job_result(job)
+            result = job["resultat"] or {}
+            st.success(f"✅ Travail #{job['id']} terminé par {job['worker']} en {result.get('duree', 0):.1f}s")
+            validation = result.get("validation")
+            if validation:
+                st.caption(
+                    "🧮 Avec les examens déjà en base : "
+                    f"{validation['etudiant']} conflit(s) étudiant, {validation['professeur']} professeur, "
+                    f"{validation['salle']} salle, {validation['examen']} capacité"
+                )
+
+        optimizer = st.session_state.get("admin_optimizer")
+        if moteur != "🗄️ SQL" and optimizer is not None and optimizer.generated_schedule:
+            df = pd.DataFrame(optimizer.generated_schedule)
+            # Planning repris d'un travail : pas de graphe ni de modules en mémoire
+            summary = getattr(optimizer, "job_summary", None) or {}
+            n_modules = summary.get("modules", len(optimizer.modules_data or []))
+            n_edges = summary.get("edges", optimizer.graph.n_edges if optimizer.graph is not None else None)
+            c1, c2, c3 = st.columns(3)
+            with c1: kpi_card("📝 Examens placés", f"{len(df):,}", f"sur {n_modules:,} modules")
+            with c2: kpi_card("⚠️ Conflits", f"{len(optimizer.conflicts)}", "Planning généré", "ok" if not optimizer.conflicts else "danger")
+            with c3: kpi_card("🕸️ Graphe", f"{n_edges:,}" if n_edges is not None else "—", "Paires de modules liées")
+            st.dataframe(df, use_container_width=True, height=400)
+
+            col_a, col_b = st.columns(2)
+            with col_a:
+                st.download_button(
+                    "📥 Télécharger planning (CSV)",
+                    df.to_csv(index=False).encode("utf-8"),
+                    "planning_genere.csv",
+                    "text/csv",
+                    use_container_width=True
+                )
+            with col_b:
+                if st.button("💾 Enregistrer le planning", use_container_width=True):
+                    ok, message = optimizer.save_schedule(st.session_state.get("user", {}).get("id"))
+                    if ok:
+                        st.success(message)
+                        del st.session_state["admin_optimizer"]
+                    else:
+                        st.error(message)
+
+        if moteur != "🗄️ SQL":
+            with st.expander("📋 Travaux de génération récents"):
+                recents = pd.DataFrame(list_jobs("generation"))
+                if recents.empty:
+                    st.caption("Aucun travail soumis.")
+                else:
+                    st.dataframe(
+                        recents[["id", "statut", "progression", "message", "worker", "cree_par", "created_at", "finished_at"]],
+                        use_container_width=True, hide_index=True
+                    )
+                    termines = recents.loc[recents["statut"] == "TERMINE", "id"].tolist()
+                    if termines:
+                        choix = st.selectbox("Planning calculé", termines, format_func=lambda i: f"Travail #{i}")
+                        if st.button("📂 Charger ce planning"):
+                            job = get_job(choix, with_result=True)
+                            if job is not None:
+                                st.session_state["admin_optimizer"] = ExamScheduleOptimizer.from_job_result(job)
+                                st.rerun()
+
+        if moteur == "🗄️ SQL" and st.button("🚀 Lancer génération", type="primary", use_container_width=True):
             with st.spinner("Génération en cours..."):
                 start_time = datetime.now()
                 try:
@@ -601,7 +1240,20 @@ def admin_dashboard():
     elif page == "⚠️ Conflits":
         section_header("🔍 Analyse des conflits")
 
-        if st.button("🔍 Détecter les conflits", type="primary", use_container_width=True):
+        col_a, col_b = st.columns(2)
+        with col_a:
+            detecter = st.button("🔍 Détecter les conflits", type="primary", use_container_width=True)
+        with col_b:
+            if st.button("📨 Analyser en arrière-plan", use_container_width=True):
+                job_id = soumettre_job("conflits", {}, st.session_state.get("user", {}).get("id"))
+                if job_id:
+                    st.session_state["admin_job_conflits"] = job_id
+
+        job = suivre_job("admin_job_conflits")
+        if job is not None:
+            st.session_state["conflits"] = pd.DataFrame((job["resultat"] or {}).get("conflits", []))
+
+        if detecter:
             with st.spinner("Détection en cours..."):
                 conflits = detecter_tous_les_conflits()
                 st.session_state["conflits"] = conflits
@@ -636,7 +1288,7 @@ def admin_dashboard():
         with col2: kpi_card("⏳ Planifiés", f"{planifies:,}", tone="warn" if planifies > 0 else "ok")
         with col3: kpi_card("✅ Confirmés", f"{confirmes:,}")
 
-        tab1, tab2 = st.tabs(["Validation individuelle", "Validation globale"])
+        tab1, tab2, tab3 = st.tabs(["Validation individuelle", "Validation globale", "📥 Exports"])
 
         with tab1:
             st.dataframe(planning.head(300), use_container_width=True, height=400)
@@ -655,12 +1307,39 @@ def admin_dashboard():
                 st.warning(f"Vous allez confirmer **{planifies}** examens planifiés.")
                 if st.checkbox("Je confirme la validation globale"):
                     if st.button("🚀 Valider tout le planning", type="primary"):
-                        if valider_tout_le_planning():
+                        barre = st.progress(0, text="Validation par lots...")
+                        if valider_tout_le_planning(
+                            lambda faits, total: barre.progress(faits / total, text=f"✅ {faits:,} / {total:,} examens confirmés"),
+                            st.session_state.get("user", {}).get("id")
+                        ):
                             st.success("✅ Planning entièrement validé !")
                             st.rerun()
                         else:
                             st.error("❌ Erreur lors de la validation globale.")
 
+        with tab3:
+            # Fichiers produits au clic seulement (data=callable), en flux depuis la base
+            fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key="export_format")
+            mime = "text/csv" if fmt == "csv" else "application/vnd.apache.parquet"
+            col_a, col_b = st.columns(2)
+            with col_a:
+                st.download_button(
+                    "📥 Planning complet",
+                    lambda: export_planning(fmt),
+                    f"planning_examens.{fmt}",
+                    mime,
+                    use_container_width=True
+                )
+            with col_b:
+                st.download_button(
+                    "📥 Convocations étudiants",
+                    lambda: export_convocations(fmt),
+                    f"convocations_examens.{fmt}",
+                    mime,
+                    use_container_width=True
+                )
+            st.caption("Convocations : une ligne par étudiant et par examen.")
+
 # Point d'entrée pour tester
 if __name__ == "__main__":
     admin_dashboard()
\ No newline at end of file
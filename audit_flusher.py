@@ -0,0 +1,173 @@
+"""
+audit_flusher.py - Versement en tâche de fond de la file d'audit
+Les triggers d'audit (bdd.sql, PARTIE 19) écrivent dans file_audit ; un
+thread par processus appelle vider_file_audit() à intervalle régulier pour
+verser les entrées dans audit_log, par lots.
+Le même thread entretient les partitions mensuelles de audit_log (PARTIE
+20) : création des mois à venir, suppression des mois expirés, exportés
+d'abord en CSV compressé si audit_archive_dir est renseigné, ainsi que
+les partitions annuelles d'examens et d'inscriptions (PARTIE 21), et
+purge les notifications expirées (PARTIE 22).
+Paramètres optionnels dans st.secrets["postgres"] :
+    audit_flush_interval         secondes entre deux passages (2)
+    audit_flush_batch            entrées versées par transaction (5000)
+    audit_maintenance_interval   secondes entre deux entretiens des partitions (3600)
+    audit_retention_days         jours d'audit conservés (90)
+    audit_archive_dir            répertoire des partitions exportées (aucun export)
+"""
+
+import gzip
+import os
+import threading
+import time
+
+import streamlit as st
+from psycopg2 import sql
+
+from connection import get_pool
+
+
+class AuditFlusher(threading.Thread):
+    """Thread démon : vide file_audit dans audit_log"""
+
+    def __init__(self, pool, interval=2.0, batch=5000, maintenance_interval=3600.0,
+                 retention_days=90, archive_dir=None):
+        super().__init__(name="audit-flusher", daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.batch = batch
+        self.maintenance_interval = maintenance_interval
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.flushed = 0
+        self.archived = []
+        self.errors = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        next_maintenance = 0.0
+        while not self._stop_event.wait(self.interval):
+            self.flush_once()
+            if time.monotonic() >= next_maintenance:
+                self.maintain()
+                next_maintenance = time.monotonic() + self.maintenance_interval
+
+    def flush_once(self) -> int:
+        """Un passage, lot après lot jusqu'à file vide ; retourne le nombre d'entrées versées"""
+        total = 0
+        try:
+            with self.pool.connection() as conn:
+                while not self._stop_event.is_set():
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT vider_file_audit(%s)", (self.batch,))
+                        count = cur.fetchone()[0]
+                    conn.commit()
+                    total += count
+                    if count < self.batch:
+                        break
+        except Exception as e:
+            self._fail(e)
+
+        self.flushed += total
+        return total
+
+    def maintain(self) -> list:
+        """
+        Partitions des mois (audit) et de l'année (examens, inscriptions) à
+        venir, puis rétention ; retourne les partitions supprimées. Un seul
+        processus à la fois (verrou consultatif). Chaque étape a sa propre
+        transaction : un échec n'annule pas les autres étapes.
+        """
+        removed = []
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(hashtext('maintenance_audit'))")
+                    locked = cur.fetchone()[0]
+                conn.commit()
+                if not locked:
+                    return removed
+                try:
+                    for statement in ("SELECT creer_partitions_audit()",
+                                      "SELECT creer_partitions_annuelles()",
+                                      "SELECT purger_notifications_expirees()"):
+                        self._step(conn, statement)
+
+                    expired = self._step(
+                        conn, "SELECT partition FROM partitions_audit_expirees(%s * INTERVAL '1 day')",
+                        (self.retention_days,)
+                    ) or []
+
+                    # Une partition n'est supprimée qu'une fois son export terminé
+                    for (partition,) in expired:
+                        try:
+                            if self.archive_dir:
+                                self._export(conn, partition)
+                            with conn.cursor() as cur:
+                                cur.execute("SELECT supprimer_partition_audit(%s)", (partition,))
+                            conn.commit()
+                            removed.append(partition)
+                        except Exception as e:
+                            conn.rollback()
+                            self._fail(e)
+                finally:
+                    # Transaction éventuellement en échec : annulée avant de libérer
+                    # le verrou (de session), sinon il resterait pris
+                    conn.rollback()
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(hashtext('maintenance_audit'))")
+                    conn.commit()
+        except Exception as e:
+            self._fail(e)
+
+        self.archived.extend(removed)
+        return removed
+
+    def _step(self, conn, statement, params=None):
+        """Une étape d'entretien, validée seule ; retourne ses lignes (None en cas d'échec)"""
+        try:
+            with conn.cursor() as cur:
+                cur.execute(statement, params)
+                rows = cur.fetchall()
+            conn.commit()
+            return rows
+        except Exception as e:
+            conn.rollback()
+            self._fail(e)
+            return None
+
+    def _fail(self, error):
+        # Pas d'affichage Streamlit hors du thread de rendu
+        self.errors += 1
+        self.last_error = str(error)
+
+    def _export(self, conn, partition):
+        """COPY de la partition vers <archive_dir>/<partition>.csv.gz (fichier complet ou rien)"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{partition}.csv.gz")
+        with gzip.open(path + ".part", "wb") as f, conn.cursor() as cur:
+            cur.copy_expert(
+                sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(partition)), f
+            )
+        conn.commit()
+        os.replace(path + ".part", path)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+@st.cache_resource(show_spinner=False)
+def start_audit_flusher() -> AuditFlusher:
+    """Démarre le thread une seule fois par processus (toutes sessions confondues)"""
+    cfg = st.secrets["postgres"]
+    flusher = AuditFlusher(
+        get_pool(),
+        interval=float(cfg.get("audit_flush_interval", 2)),
+        batch=int(cfg.get("audit_flush_batch", 5000)),
+        maintenance_interval=float(cfg.get("audit_maintenance_interval", 3600)),
+        retention_days=int(cfg.get("audit_retention_days", 90)),
+        archive_dir=cfg.get("audit_archive_dir"),
+    )
+    flusher.start()
+    return flusher
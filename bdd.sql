@@ -9,6 +9,7 @@ CREATE SCHEMA public;
 -- 2. تفعيل الامتدادات
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "btree_gin";
+CREATE EXTENSION IF NOT EXISTS "btree_gist";
 CREATE EXTENSION IF NOT EXISTS "pg_trgm";
 
 -- 3. منح الصلاحيات
@@ -138,6 +139,10 @@ CREATE TABLE examens (
     salle_id INT NOT NULL REFERENCES lieux_examen(id) ON DELETE CASCADE,
     date_heure TIMESTAMP NOT NULL,
     duree_minutes INT NOT NULL CHECK (duree_minutes BETWEEN 60 AND 240),
+    -- Occupation [début, fin) : chevauchements testés par && (index GiST, PARTIE 12)
+    creneau TSRANGE GENERATED ALWAYS AS (
+        tsrange(date_heure, date_heure + duree_minutes * INTERVAL '1 minute')
+    ) STORED,
     type_examen VARCHAR(30) DEFAULT 'Final' CHECK (type_examen IN ('Final', 'Partiel', 'Rattrapage', 'Controle')),
     statut VARCHAR(20) DEFAULT 'Planifie' CHECK (statut IN ('Planifie', 'Confirme', 'Annule', 'Termine')),
     max_etudiants INT,
@@ -1311,8 +1316,8 @@ BEGIN
         f.nom,
         f.departement_id,
         COALESCE(m.responsable_id, 
-            (SELECT id FROM professeurs 
-             WHERE departement_id = f.departement_id 
+            (SELECT p.id FROM professeurs p 
+             WHERE p.departement_id = f.departement_id 
              LIMIT 1)),
         COUNT(DISTINCT i.etudiant_id)::BIGINT,
         ARRAY_AGG(DISTINCT i.etudiant_id),
@@ -1376,12 +1381,11 @@ BEGIN
         RETURN TRUE;
     END IF;
     
-    -- 3. التحقق من تعارض القاعة
+    -- 3. التحقق من تعارض القاعة أو الأستاذ (sonde GiST sur creneau)
     SELECT EXISTS(
         SELECT 1 FROM examens e
-        WHERE e.salle_id = p_room_id
-            AND e.date_heure < p_exam_date + (p_duration_minutes || ' minutes')::INTERVAL
-            AND e.date_heure + (e.duree_minutes || ' minutes')::INTERVAL > p_exam_date
+        WHERE (e.salle_id = p_room_id OR e.professeur_id = p_professor_id)
+            AND e.creneau && tsrange(p_exam_date, p_exam_date + p_duration_minutes * INTERVAL '1 minute')
             AND e.statut IN ('Planifie', 'Confirme')
     ) INTO v_has_conflict;
     
@@ -1685,4 +1689,3174 @@ BEGIN
     ORDER BY COUNT(i.etudiant_id) DESC
     LIMIT 20;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+-- ============================================
+-- PARTIE 10: CONFLITS MAINTENUS INCRÉMENTALEMENT
+-- ============================================
+-- Les conflits ne sont plus recalculés à chaque appel : des triggers sur
+-- examens, inscriptions et lieux_examen ne recalculent que les
+-- étudiants/jours, professeurs/jours, salles/jours et examens touchés.
+-- detecter_conflits() devient une simple lecture de conflits_actifs.
+
+CREATE TABLE IF NOT EXISTS conflits_actifs (
+    id BIGSERIAL PRIMARY KEY,
+    type_conflit VARCHAR(50) NOT NULL,
+    entite VARCHAR(20) NOT NULL CHECK (entite IN ('etudiant', 'professeur', 'salle', 'examen')),
+    entite_id INT NOT NULL,
+    jour DATE NOT NULL,
+    examens_ids INT[] NOT NULL,
+    nb INT NOT NULL,
+    details TEXT NOT NULL,
+    severite VARCHAR(20) NOT NULL CHECK (severite IN ('CRITIQUE', 'ÉLEVÉ', 'MOYEN', 'FAIBLE')),
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_conflits_actifs_entite ON conflits_actifs(entite, entite_id, jour);
+CREATE INDEX IF NOT EXISTS idx_conflits_actifs_severite ON conflits_actifs(severite, type_conflit);
+
+-- Étudiant >1 examen/jour (NULL = tous)
+CREATE OR REPLACE FUNCTION rafraichir_conflits_etudiants(p_etudiants INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'etudiant'
+      AND (p_etudiants IS NULL OR entite_id = ANY(p_etudiants))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Étudiant >1 examen/jour',
+        'etudiant',
+        i.etudiant_id,
+        DATE(e.date_heure),
+        ARRAY_AGG(DISTINCT e.id),
+        COUNT(DISTINCT e.id),
+        'Étudiant ID: ' || i.etudiant_id || ' a ' || COUNT(DISTINCT e.id) || ' examens le ' || DATE(e.date_heure),
+        'CRITIQUE'
+    FROM inscriptions i
+    JOIN examens e ON i.module_id = e.module_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND (p_etudiants IS NULL OR i.etudiant_id = ANY(p_etudiants))
+      AND (p_jours IS NULL OR DATE(e.date_heure) = ANY(p_jours))
+    GROUP BY i.etudiant_id, DATE(e.date_heure)
+    HAVING COUNT(DISTINCT e.id) > 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Professeur >3 examens/jour (NULL = tous)
+CREATE OR REPLACE FUNCTION rafraichir_conflits_professeurs(p_professeurs INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'professeur'
+      AND (p_professeurs IS NULL OR entite_id = ANY(p_professeurs))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Professeur >3 examens/jour',
+        'professeur',
+        e.professeur_id,
+        DATE(e.date_heure),
+        ARRAY_AGG(e.id ORDER BY e.date_heure),
+        COUNT(*),
+        'Professeur ID: ' || e.professeur_id || ' a ' || COUNT(*) || ' examens le ' || DATE(e.date_heure),
+        'CRITIQUE'
+    FROM examens e
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND (p_professeurs IS NULL OR e.professeur_id = ANY(p_professeurs))
+      AND (p_jours IS NULL OR DATE(e.date_heure) = ANY(p_jours))
+    GROUP BY e.professeur_id, DATE(e.date_heure)
+    HAVING COUNT(*) > 3;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Chevauchement salle, rattaché au jour du premier examen de la paire (NULL = tous)
+CREATE OR REPLACE FUNCTION rafraichir_conflits_salles(p_salles INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'salle'
+      AND (p_salles IS NULL OR entite_id = ANY(p_salles))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Chevauchement salle',
+        'salle',
+        e1.salle_id,
+        LEAST(DATE(e1.date_heure), DATE(e2.date_heure)),
+        ARRAY[e1.id, e2.id],
+        2,
+        'Salle ID: ' || e1.salle_id || ' - Examens ' || e1.id || ' et ' || e2.id || ' se chevauchent',
+        'ÉLEVÉ'
+    FROM examens e1
+    -- Index GiST (salle_id, creneau) ; la borne de 240 min (durée maximale)
+    -- permet aussi le parcours de unique_salle_temps
+    JOIN examens e2 ON e2.salle_id = e1.salle_id
+                   AND e2.creneau && e1.creneau
+                   AND e2.date_heure > e1.date_heure - INTERVAL '240 minutes'
+    WHERE e1.id < e2.id
+      AND e1.statut IN ('Planifie', 'Confirme')
+      AND e2.statut IN ('Planifie', 'Confirme')
+      AND (p_salles IS NULL OR e1.salle_id = ANY(p_salles))
+      AND (p_jours IS NULL OR LEAST(DATE(e1.date_heure), DATE(e2.date_heure)) = ANY(p_jours));
+END;
+$$ LANGUAGE plpgsql;
+
+-- Dépassement capacité (NULL = tous)
+CREATE OR REPLACE FUNCTION rafraichir_conflits_capacite(p_examens INT[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'examen'
+      AND (p_examens IS NULL OR entite_id IN (SELECT UNNEST(p_examens)));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Dépassement capacité',
+        'examen',
+        e.id,
+        DATE(e.date_heure),
+        ARRAY[e.id],
+        COUNT(i.etudiant_id),
+        'Examen ID: ' || e.id || ' - ' || COUNT(i.etudiant_id) || ' étudiants pour ' || l.capacite || ' places',
+        'MOYEN'
+    FROM examens e
+    JOIN lieux_examen l ON e.salle_id = l.id
+    JOIN inscriptions i ON e.module_id = i.module_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND i.statut = 'Inscrit'
+      -- Semi-jointure hachée : = ANY() serait linéaire pour un gros lot
+      AND (p_examens IS NULL OR e.id IN (SELECT UNNEST(p_examens)))
+    GROUP BY e.id, e.date_heure, l.capacite
+    HAVING COUNT(i.etudiant_id) > l.capacite;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reconstruction complète (initialisation / réparation)
+CREATE OR REPLACE FUNCTION reconstruire_conflits_actifs()
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    TRUNCATE conflits_actifs;
+    PERFORM rafraichir_conflits_etudiants(NULL, NULL);
+    PERFORM rafraichir_conflits_professeurs(NULL, NULL);
+    PERFORM rafraichir_conflits_salles(NULL, NULL);
+    PERFORM rafraichir_conflits_capacite(NULL);
+    SELECT COUNT(*) INTO v_count FROM conflits_actifs;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger examens : une exécution par instruction (tables de transition)
+CREATE OR REPLACE FUNCTION trg_conflits_examens()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_modules INT[];
+    v_professeurs INT[];
+    v_salles INT[];
+    v_jours DATE[];
+    v_examens INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(DISTINCT module_id), ARRAY_AGG(DISTINCT professeur_id),
+               ARRAY_AGG(DISTINCT salle_id), ARRAY_AGG(DISTINCT DATE(date_heure)), ARRAY_AGG(id)
+        INTO v_modules, v_professeurs, v_salles, v_jours, v_examens
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT ARRAY_AGG(DISTINCT module_id), ARRAY_AGG(DISTINCT professeur_id),
+               ARRAY_AGG(DISTINCT salle_id), ARRAY_AGG(DISTINCT DATE(date_heure)), ARRAY_AGG(id)
+        INTO v_modules, v_professeurs, v_salles, v_jours, v_examens
+        FROM old_rows;
+    ELSE
+        -- Seules les colonnes qui influent sur les conflits comptent
+        -- (Planifie -> Confirme ne change rien, par exemple)
+        SELECT ARRAY_AGG(DISTINCT r.module_id), ARRAY_AGG(DISTINCT r.professeur_id),
+               ARRAY_AGG(DISTINCT r.salle_id), ARRAY_AGG(DISTINCT DATE(r.date_heure)), ARRAY_AGG(DISTINCT r.id)
+        INTO v_modules, v_professeurs, v_salles, v_jours, v_examens
+        FROM (
+            SELECT o.id, o.module_id, o.professeur_id, o.salle_id, o.date_heure
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.module_id, o.professeur_id, o.salle_id, o.date_heure, o.duree_minutes,
+                   o.statut IN ('Planifie', 'Confirme'))
+                  IS DISTINCT FROM
+                  (n.module_id, n.professeur_id, n.salle_id, n.date_heure, n.duree_minutes,
+                   n.statut IN ('Planifie', 'Confirme'))
+            UNION ALL
+            SELECT n.id, n.module_id, n.professeur_id, n.salle_id, n.date_heure
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.module_id, o.professeur_id, o.salle_id, o.date_heure, o.duree_minutes,
+                   o.statut IN ('Planifie', 'Confirme'))
+                  IS DISTINCT FROM
+                  (n.module_id, n.professeur_id, n.salle_id, n.date_heure, n.duree_minutes,
+                   n.statut IN ('Planifie', 'Confirme'))
+        ) r;
+    END IF;
+
+    IF v_examens IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM rafraichir_conflits_etudiants(
+        ARRAY(SELECT DISTINCT etudiant_id FROM inscriptions WHERE module_id = ANY(v_modules)),
+        v_jours
+    );
+    PERFORM rafraichir_conflits_professeurs(v_professeurs, v_jours);
+    -- Une paire qui chevauche minuit est rattachée à la veille
+    PERFORM rafraichir_conflits_salles(
+        v_salles,
+        v_jours || ARRAY(SELECT j - 1 FROM UNNEST(v_jours) j)
+    );
+    PERFORM rafraichir_conflits_capacite(v_examens);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger inscriptions : étudiants touchés sur les jours d'examen des modules touchés
+CREATE OR REPLACE FUNCTION trg_conflits_inscriptions()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_etudiants INT[];
+    v_modules INT[];
+    v_jours DATE[];
+    v_examens INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(DISTINCT etudiant_id), ARRAY_AGG(DISTINCT module_id)
+        INTO v_etudiants, v_modules
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT ARRAY_AGG(DISTINCT etudiant_id), ARRAY_AGG(DISTINCT module_id)
+        INTO v_etudiants, v_modules
+        FROM old_rows;
+    ELSE
+        SELECT ARRAY_AGG(DISTINCT r.etudiant_id), ARRAY_AGG(DISTINCT r.module_id)
+        INTO v_etudiants, v_modules
+        FROM (
+            SELECT o.etudiant_id, o.module_id
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.etudiant_id, o.module_id, o.statut) IS DISTINCT FROM (n.etudiant_id, n.module_id, n.statut)
+            UNION ALL
+            SELECT n.etudiant_id, n.module_id
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.etudiant_id, o.module_id, o.statut) IS DISTINCT FROM (n.etudiant_id, n.module_id, n.statut)
+        ) r;
+    END IF;
+
+    IF v_modules IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT ARRAY_AGG(DISTINCT DATE(e.date_heure)), ARRAY_AGG(e.id)
+    INTO v_jours, v_examens
+    FROM examens e
+    WHERE e.module_id = ANY(v_modules)
+      AND e.statut IN ('Planifie', 'Confirme');
+
+    IF v_examens IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM rafraichir_conflits_etudiants(v_etudiants, v_jours);
+    PERFORM rafraichir_conflits_capacite(v_examens);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger lieux_examen : seule la capacité influe sur les conflits
+-- (la suppression d'une salle supprime ses examens en cascade)
+CREATE OR REPLACE FUNCTION trg_conflits_lieux()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_examens INT[];
+BEGIN
+    SELECT ARRAY_AGG(e.id)
+    INTO v_examens
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id AND n.capacite IS DISTINCT FROM o.capacite
+    JOIN examens e ON e.salle_id = n.id AND e.statut IN ('Planifie', 'Confirme');
+
+    IF v_examens IS NOT NULL THEN
+        PERFORM rafraichir_conflits_capacite(v_examens);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_conflits_examens_ins ON examens;
+CREATE TRIGGER trg_conflits_examens_ins
+AFTER INSERT ON examens
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_examens();
+
+DROP TRIGGER IF EXISTS trg_conflits_examens_upd ON examens;
+CREATE TRIGGER trg_conflits_examens_upd
+AFTER UPDATE ON examens
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_examens();
+
+DROP TRIGGER IF EXISTS trg_conflits_examens_del ON examens;
+CREATE TRIGGER trg_conflits_examens_del
+AFTER DELETE ON examens
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_examens();
+
+DROP TRIGGER IF EXISTS trg_conflits_inscriptions_ins ON inscriptions;
+CREATE TRIGGER trg_conflits_inscriptions_ins
+AFTER INSERT ON inscriptions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_inscriptions();
+
+DROP TRIGGER IF EXISTS trg_conflits_inscriptions_upd ON inscriptions;
+CREATE TRIGGER trg_conflits_inscriptions_upd
+AFTER UPDATE ON inscriptions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_inscriptions();
+
+DROP TRIGGER IF EXISTS trg_conflits_inscriptions_del ON inscriptions;
+CREATE TRIGGER trg_conflits_inscriptions_del
+AFTER DELETE ON inscriptions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_inscriptions();
+
+DROP TRIGGER IF EXISTS trg_conflits_lieux_upd ON lieux_examen;
+CREATE TRIGGER trg_conflits_lieux_upd
+AFTER UPDATE ON lieux_examen
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_conflits_lieux();
+
+-- Même signature qu'avant : lecture indexée du stock de conflits
+CREATE OR REPLACE FUNCTION detecter_conflits()
+RETURNS TABLE(
+    type_conflit VARCHAR(50),
+    details TEXT,
+    severite VARCHAR(20)
+) AS $$
+    SELECT ca.type_conflit, ca.details, ca.severite
+    FROM conflits_actifs ca
+    ORDER BY CASE ca.entite
+                 WHEN 'etudiant' THEN 1
+                 WHEN 'professeur' THEN 2
+                 WHEN 'salle' THEN 3
+                 ELSE 4
+             END,
+             ca.jour, ca.entite_id;
+$$ LANGUAGE sql STABLE;
+
+-- Initialisation à partir des données existantes
+SELECT '✅ Conflits actifs initialisés' as status, reconstruire_conflits_actifs() as total;
+
+-- ============================================
+-- PARTIE 11: ENREGISTREMENT DU PLANNING EN MASSE
+-- ============================================
+-- Le planning généré est chargé par COPY dans une table temporaire, puis
+-- inséré en une seule requête après revalidation ensembliste. Le trigger
+-- d'audit ligne à ligne est suspendu pendant l'insertion : le lot est
+-- tracé par une seule entrée de audit_log.
+
+-- Les clés étrangères de examens étaient déclarées deux fois (REFERENCES en
+-- ligne + CONSTRAINT fk_examen_*) : six vérifications par ligne insérée
+ALTER TABLE examens DROP CONSTRAINT IF EXISTS examens_module_id_fkey;
+ALTER TABLE examens DROP CONSTRAINT IF EXISTS examens_professeur_id_fkey;
+ALTER TABLE examens DROP CONSTRAINT IF EXISTS examens_salle_id_fkey;
+
+-- Table de transit, propre à la transaction (COPY examens_import ... FROM STDIN)
+CREATE OR REPLACE FUNCTION preparer_import_examens()
+RETURNS VOID AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS examens_import (
+        ligne SERIAL,
+        module_id INT,
+        professor_id INT,
+        room_id INT,
+        exam_time TIMESTAMP,
+        duration_minutes INT,
+        student_count INT,
+        motif_rejet TEXT
+    ) ON COMMIT DROP;
+    TRUNCATE examens_import;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Revalide puis insère le contenu de examens_import.
+-- Les lignes refusées restent dans examens_import avec leur motif_rejet ;
+-- les conflits étudiants ne sont pas bloquants (voir conflits_actifs).
+CREATE OR REPLACE FUNCTION importer_examens_import(p_user_id INT DEFAULT NULL)
+RETURNS TABLE(inseres INT, rejetes INT) AS $$
+DECLARE
+    v_user_id INT;
+    v_ids INT[];
+    v_lignes JSONB;
+BEGIN
+    v_user_id := COALESCE(p_user_id, NULLIF(current_setting('app.user_id', TRUE), '')::INT);
+
+    -- Table temporaire : jamais analysée par l'autovacuum
+    ANALYZE examens_import;
+
+    -- Références et durée
+    UPDATE examens_import s
+    SET motif_rejet = CASE
+            WHEN s.module_id IS NULL OR NOT EXISTS (SELECT 1 FROM modules m WHERE m.id = s.module_id)
+                THEN 'Module inconnu'
+            WHEN s.professor_id IS NULL OR NOT EXISTS (SELECT 1 FROM professeurs p WHERE p.id = s.professor_id)
+                THEN 'Professeur inconnu'
+            WHEN s.room_id IS NULL OR NOT EXISTS (SELECT 1 FROM lieux_examen l WHERE l.id = s.room_id)
+                THEN 'Salle inconnue'
+            WHEN s.exam_time IS NULL
+                THEN 'Date manquante'
+            WHEN s.duration_minutes IS NULL OR s.duration_minutes NOT BETWEEN 60 AND 240
+                THEN 'Durée invalide'
+        END
+    WHERE s.motif_rejet IS NULL;
+
+    -- Salle déjà occupée (unique_salle_temps vaut aussi pour les examens annulés)
+    UPDATE examens_import s
+    SET motif_rejet = 'Salle occupée'
+    WHERE s.motif_rejet IS NULL
+      AND (EXISTS (
+               SELECT 1 FROM examens e
+               WHERE e.salle_id = s.room_id
+                 AND e.creneau && tsrange(s.exam_time, s.exam_time + s.duration_minutes * INTERVAL '1 minute')
+                 AND e.statut IN ('Planifie', 'Confirme'))
+           OR EXISTS (
+               SELECT 1 FROM examens e
+               WHERE e.salle_id = s.room_id AND e.date_heure = s.exam_time));
+
+    -- Professeur déjà en examen
+    UPDATE examens_import s
+    SET motif_rejet = 'Professeur occupé'
+    WHERE s.motif_rejet IS NULL
+      AND EXISTS (
+          SELECT 1 FROM examens e
+          WHERE e.professeur_id = s.professor_id
+            AND e.creneau && tsrange(s.exam_time, s.exam_time + s.duration_minutes * INTERVAL '1 minute')
+            AND e.statut IN ('Planifie', 'Confirme')
+      );
+
+    -- Chevauchements à l'intérieur du lot (la première ligne est gardée)
+    UPDATE examens_import s
+    SET motif_rejet = 'Salle occupée (lot)'
+    FROM (
+        SELECT ligne, exam_time,
+               MAX(exam_time + duration_minutes * INTERVAL '1 minute') OVER (
+                   PARTITION BY room_id ORDER BY exam_time, ligne
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ) AS fin_precedente
+        FROM examens_import
+        WHERE motif_rejet IS NULL
+    ) w
+    WHERE s.ligne = w.ligne AND w.fin_precedente > w.exam_time;
+
+    UPDATE examens_import s
+    SET motif_rejet = 'Professeur occupé (lot)'
+    FROM (
+        SELECT ligne, exam_time,
+               MAX(exam_time + duration_minutes * INTERVAL '1 minute') OVER (
+                   PARTITION BY professor_id ORDER BY exam_time, ligne
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ) AS fin_precedente
+        FROM examens_import
+        WHERE motif_rejet IS NULL
+    ) w
+    WHERE s.ligne = w.ligne AND w.fin_precedente > w.exam_time;
+
+    -- Maximum 3 examens par professeur et par jour (existants + lot)
+    UPDATE examens_import s
+    SET motif_rejet = 'Professeur >3 examens/jour'
+    FROM (
+        SELECT i.ligne,
+               ROW_NUMBER() OVER (PARTITION BY i.professor_id, i.exam_time::DATE ORDER BY i.exam_time, i.ligne)
+               + COALESCE(ex.nb, 0) AS rang
+        FROM examens_import i
+        LEFT JOIN (
+            SELECT e.professeur_id, e.date_heure::DATE AS jour, COUNT(*) AS nb
+            FROM examens e
+            WHERE e.statut IN ('Planifie', 'Confirme')
+              AND e.professeur_id IN (SELECT professor_id FROM examens_import)
+            GROUP BY e.professeur_id, e.date_heure::DATE
+        ) ex ON ex.professeur_id = i.professor_id AND ex.jour = i.exam_time::DATE
+        WHERE i.motif_rejet IS NULL
+    ) w
+    WHERE s.ligne = w.ligne AND w.rang > 3;
+
+    -- Insertion ensembliste, sans audit ligne à ligne
+    PERFORM set_config('app.audit_bulk', 'on', TRUE);
+
+    WITH nouveaux AS (
+        INSERT INTO examens (
+            module_id, professeur_id, salle_id, date_heure, duree_minutes,
+            type_examen, statut, max_etudiants, created_at, created_by
+        )
+        SELECT module_id, professor_id, room_id, exam_time, duration_minutes,
+               'Final', 'Planifie', student_count, CURRENT_TIMESTAMP, v_user_id
+        FROM examens_import
+        WHERE motif_rejet IS NULL
+        ORDER BY ligne
+        RETURNING id, module_id, professeur_id, salle_id, date_heure, duree_minutes
+    )
+    SELECT array_agg(id ORDER BY id),
+           jsonb_agg(jsonb_build_object(
+               'id', id, 'module_id', module_id, 'professeur_id', professeur_id,
+               'salle_id', salle_id, 'date_heure', date_heure, 'duree_minutes', duree_minutes
+           ) ORDER BY id)
+    INTO v_ids, v_lignes
+    FROM nouveaux;
+
+    PERFORM set_config('app.audit_bulk', 'off', TRUE);
+
+    inseres := COALESCE(array_length(v_ids, 1), 0);
+    SELECT COUNT(*) INTO rejetes FROM examens_import WHERE motif_rejet IS NOT NULL;
+
+    -- Une seule entrée d'audit pour le lot
+    IF inseres > 0 THEN
+        INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by, ip_address)
+        VALUES ('examens', v_ids[1], 'INSERT',
+                jsonb_build_object('lot', TRUE, 'nb', inseres, 'rejetes', rejetes, 'examens', v_lignes),
+                v_user_id, inet_client_addr()::VARCHAR);
+    END IF;
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Pas d'audit ligne à ligne pendant un import en masse
+DROP TRIGGER IF EXISTS trg_audit_examens ON examens;
+CREATE TRIGGER trg_audit_examens
+AFTER INSERT OR UPDATE OR DELETE ON examens
+FOR EACH ROW
+WHEN (COALESCE(current_setting('app.audit_bulk', TRUE), '') <> 'on')
+EXECUTE FUNCTION audit_trigger_function();
+
+-- Même signature qu'avant : passe par la table de transit
+CREATE OR REPLACE FUNCTION save_optimized_schedule(
+    p_schedule JSONB
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_inserted_count INTEGER;
+BEGIN
+    PERFORM preparer_import_examens();
+
+    INSERT INTO examens_import (module_id, professor_id, room_id, exam_time, duration_minutes, student_count)
+    SELECT module_id, professor_id, room_id, exam_time, duration_minutes, student_count
+    FROM jsonb_to_recordset(p_schedule) AS x(
+        module_id INT,
+        professor_id INT,
+        room_id INT,
+        exam_time TIMESTAMP,
+        duration_minutes INT,
+        student_count INT
+    );
+
+    SELECT inseres INTO v_inserted_count FROM importer_examens_import();
+    RETURN v_inserted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- PARTIE 12: EXCLUSION DES CHEVAUCHEMENTS SALLE / PROFESSEUR
+-- ============================================
+-- Deux examens actifs ne peuvent plus occuper la même salle ou le même
+-- professeur sur des créneaux qui se chevauchent : la base refuse le
+-- planning au lieu de le signaler après coup. Les index GiST des
+-- contraintes servent aussi les tests && (quick_conflict_check, import).
+
+-- Ajoute les contraintes absentes ; si des chevauchements existent déjà, la
+-- contrainte est remplacée par un simple index GiST et un avertissement
+-- (à relancer une fois les conflits corrigés)
+CREATE OR REPLACE FUNCTION activer_exclusions_examens()
+RETURNS TEXT AS $$
+DECLARE
+    v_salles INT;
+    v_professeurs INT;
+    v_resultat TEXT := '';
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'excl_examens_salle_creneau') THEN
+        CREATE INDEX IF NOT EXISTS idx_examens_salle_creneau ON examens
+            USING gist (salle_id, creneau) WHERE statut IN ('Planifie', 'Confirme');
+
+        SELECT COUNT(*) INTO v_salles
+        FROM examens e1
+        JOIN examens e2 ON e2.salle_id = e1.salle_id AND e2.creneau && e1.creneau AND e1.id < e2.id
+        WHERE e1.statut IN ('Planifie', 'Confirme') AND e2.statut IN ('Planifie', 'Confirme');
+
+        IF v_salles > 0 THEN
+            RAISE WARNING '% chevauchement(s) de salle : contrainte excl_examens_salle_creneau non ajoutée', v_salles;
+            v_resultat := v_resultat || 'salles: ' || v_salles || ' chevauchement(s); ';
+        ELSE
+            ALTER TABLE examens ADD CONSTRAINT excl_examens_salle_creneau
+                EXCLUDE USING gist (salle_id WITH =, creneau WITH &&)
+                WHERE (statut IN ('Planifie', 'Confirme'));
+            DROP INDEX IF EXISTS idx_examens_salle_creneau;
+            v_resultat := v_resultat || 'salles: contrainte ajoutée; ';
+        END IF;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'excl_examens_professeur_creneau') THEN
+        CREATE INDEX IF NOT EXISTS idx_examens_professeur_creneau ON examens
+            USING gist (professeur_id, creneau) WHERE statut IN ('Planifie', 'Confirme');
+
+        SELECT COUNT(*) INTO v_professeurs
+        FROM examens e1
+        JOIN examens e2 ON e2.professeur_id = e1.professeur_id AND e2.creneau && e1.creneau AND e1.id < e2.id
+        WHERE e1.statut IN ('Planifie', 'Confirme') AND e2.statut IN ('Planifie', 'Confirme');
+
+        IF v_professeurs > 0 THEN
+            RAISE WARNING '% chevauchement(s) de professeur : contrainte excl_examens_professeur_creneau non ajoutée', v_professeurs;
+            v_resultat := v_resultat || 'professeurs: ' || v_professeurs || ' chevauchement(s)';
+        ELSE
+            ALTER TABLE examens ADD CONSTRAINT excl_examens_professeur_creneau
+                EXCLUDE USING gist (professeur_id WITH =, creneau WITH &&)
+                WHERE (statut IN ('Planifie', 'Confirme'));
+            DROP INDEX IF EXISTS idx_examens_professeur_creneau;
+            v_resultat := v_resultat || 'professeurs: contrainte ajoutée';
+        END IF;
+    END IF;
+
+    RETURN NULLIF(v_resultat, '');
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT '✅ Exclusions examens' as status, activer_exclusions_examens() as resultat;
+
+-- ============================================
+-- PARTIE 13: VUES MATÉRIALISÉES RAFRAÎCHIES SUR CHANGEMENT
+-- ============================================
+-- mv_stats_departement et mv_occupation_salles remplacent, pour les
+-- tableaux de bord, les vues v_stats_departement (sous-requêtes corrélées
+-- par département) et v_occupation_salles (COUNT corrélé par examen).
+-- Les triggers des tables sources ajoutent une demande dans
+-- file_rafraichissement_vues ; rafraichir_vues_en_attente(), appelée en
+-- tâche de fond (view_refresher.py), regroupe les demandes (anti-rebond)
+-- et lance REFRESH ... CONCURRENTLY sans bloquer les lectures.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_stats_departement AS
+WITH formations_dept AS (
+    SELECT departement_id, COUNT(*) AS nb
+    FROM formations
+    GROUP BY departement_id
+),
+etudiants_dept AS (
+    SELECT f.departement_id, COUNT(*) AS nb
+    FROM etudiants e
+    JOIN formations f ON e.formation_id = f.id
+    WHERE e.statut = 'Actif'
+    GROUP BY f.departement_id
+),
+professeurs_dept AS (
+    SELECT departement_id, COUNT(*) AS nb
+    FROM professeurs
+    WHERE is_active = TRUE
+    GROUP BY departement_id
+),
+modules_dept AS (
+    SELECT f.departement_id, COUNT(*) AS nb
+    FROM modules m
+    JOIN formations f ON m.formation_id = f.id
+    GROUP BY f.departement_id
+),
+examens_dept AS (
+    SELECT f.departement_id,
+           COUNT(*) FILTER (WHERE e.statut IN ('Planifie', 'Confirme')) AS nb_planifies,
+           COUNT(*) FILTER (WHERE e.statut = 'Termine') AS nb_termines,
+           MAX(e.date_heure) AS dernier_examen,
+           MIN(e.date_heure) FILTER (WHERE e.date_heure > CURRENT_TIMESTAMP) AS premier_examen
+    FROM examens e
+    JOIN modules m ON e.module_id = m.id
+    JOIN formations f ON m.formation_id = f.id
+    GROUP BY f.departement_id
+)
+SELECT
+    d.id as departement_id,
+    d.nom as departement_nom,
+    COALESCE(fd.nb, 0) as nb_formations,
+    COALESCE(ed.nb, 0) as nb_etudiants,
+    COALESCE(pd.nb, 0) as nb_professeurs,
+    COALESCE(md.nb, 0) as nb_modules,
+    COALESCE(xd.nb_planifies, 0) as nb_examens_planifies,
+    COALESCE(xd.nb_termines, 0) as nb_examens_termines,
+    (SELECT AVG(capacite) FROM lieux_examen WHERE is_disponible = TRUE) as capacite_moyenne_salles,
+    xd.dernier_examen,
+    xd.premier_examen
+FROM departements d
+LEFT JOIN formations_dept fd ON fd.departement_id = d.id
+LEFT JOIN etudiants_dept ed ON ed.departement_id = d.id
+LEFT JOIN professeurs_dept pd ON pd.departement_id = d.id
+LEFT JOIN modules_dept md ON md.departement_id = d.id
+LEFT JOIN examens_dept xd ON xd.departement_id = d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_stats_departement ON mv_stats_departement(departement_id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_occupation_salles AS
+SELECT
+    l.id,
+    l.nom,
+    l.type,
+    l.capacite,
+    COUNT(e.id) as nb_examens_planifies,
+    COALESCE(AVG(COALESCE(ins.nb, 0)::FLOAT / l.capacite * 100), 0) as taux_occupation_moyen
+FROM lieux_examen l
+LEFT JOIN examens e ON l.id = e.salle_id
+    AND e.statut IN ('Planifie', 'Confirme')
+    AND e.date_heure >= CURRENT_DATE
+LEFT JOIN (
+    SELECT module_id, COUNT(*) AS nb
+    FROM inscriptions
+    WHERE statut = 'Inscrit'
+    GROUP BY module_id
+) ins ON ins.module_id = e.module_id
+GROUP BY l.id, l.nom, l.type, l.capacite;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_occupation_salles ON mv_occupation_salles(id);
+
+-- Demandes de rafraîchissement : insertion seule, pas de verrou partagé
+-- entre les transactions qui modifient les tables sources
+CREATE TABLE IF NOT EXISTS file_rafraichissement_vues (
+    id BIGSERIAL PRIMARY KEY,
+    vue VARCHAR(63) NOT NULL,
+    demande_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_rafraichissement_vue ON file_rafraichissement_vues(vue, id);
+
+CREATE TABLE IF NOT EXISTS etat_vues_materialisees (
+    vue VARCHAR(63) PRIMARY KEY,
+    rafraichi_at TIMESTAMP,
+    duree_ms NUMERIC(10,1),
+    nb_rafraichissements BIGINT DEFAULT 0
+);
+
+INSERT INTO etat_vues_materialisees (vue, rafraichi_at) VALUES
+    ('mv_stats_departement', CURRENT_TIMESTAMP),
+    ('mv_occupation_salles', CURRENT_TIMESTAMP)
+ON CONFLICT (vue) DO NOTHING;
+
+-- Trigger par instruction : une demande par vue concernée (TG_ARGV)
+CREATE OR REPLACE FUNCTION signaler_changement_vues()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO file_rafraichissement_vues (vue)
+    SELECT UNNEST(TG_ARGV);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_vues_examens ON examens;
+CREATE TRIGGER trg_vues_examens
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON examens
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement', 'mv_occupation_salles');
+
+DROP TRIGGER IF EXISTS trg_vues_lieux ON lieux_examen;
+CREATE TRIGGER trg_vues_lieux
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON lieux_examen
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement', 'mv_occupation_salles');
+
+DROP TRIGGER IF EXISTS trg_vues_inscriptions ON inscriptions;
+CREATE TRIGGER trg_vues_inscriptions
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON inscriptions
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_occupation_salles');
+
+DROP TRIGGER IF EXISTS trg_vues_departements ON departements;
+CREATE TRIGGER trg_vues_departements
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON departements
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement');
+
+DROP TRIGGER IF EXISTS trg_vues_formations ON formations;
+CREATE TRIGGER trg_vues_formations
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON formations
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement');
+
+DROP TRIGGER IF EXISTS trg_vues_modules ON modules;
+CREATE TRIGGER trg_vues_modules
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON modules
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement');
+
+DROP TRIGGER IF EXISTS trg_vues_etudiants ON etudiants;
+CREATE TRIGGER trg_vues_etudiants
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON etudiants
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement');
+
+DROP TRIGGER IF EXISTS trg_vues_professeurs ON professeurs;
+CREATE TRIGGER trg_vues_professeurs
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON professeurs
+FOR EACH STATEMENT EXECUTE FUNCTION signaler_changement_vues('mv_stats_departement');
+
+-- Rafraîchit les vues dont les demandes sont calmes depuis p_calme, ou
+-- attendent depuis plus de p_attente_max (écritures continues), ainsi que
+-- celles calculées un autre jour (CURRENT_DATE dans leur définition).
+-- Retourne le nombre de vues rafraîchies.
+CREATE OR REPLACE FUNCTION rafraichir_vues_en_attente(
+    p_calme INTERVAL DEFAULT INTERVAL '2 seconds',
+    p_attente_max INTERVAL DEFAULT INTERVAL '30 seconds'
+)
+RETURNS INT AS $$
+DECLARE
+    v_vue RECORD;
+    v_debut TIMESTAMP;
+    v_nb INT := 0;
+BEGIN
+    -- Un seul rafraîchissement à la fois, quel que soit le nombre de processus
+    IF NOT pg_try_advisory_xact_lock(hashtext('rafraichir_vues_en_attente')) THEN
+        RETURN 0;
+    END IF;
+
+    FOR v_vue IN
+        SELECT s.vue, f.dernier_id
+        FROM etat_vues_materialisees s
+        LEFT JOIN LATERAL (
+            SELECT MAX(id) AS dernier_id, MIN(demande_at) AS premiere, MAX(demande_at) AS derniere
+            FROM file_rafraichissement_vues q
+            WHERE q.vue = s.vue
+        ) f ON TRUE
+        WHERE (f.dernier_id IS NOT NULL
+               AND (f.derniere < clock_timestamp()::TIMESTAMP - p_calme
+                    OR f.premiere < clock_timestamp()::TIMESTAMP - p_attente_max))
+           OR s.rafraichi_at IS NULL
+           OR s.rafraichi_at::DATE < CURRENT_DATE
+    LOOP
+        v_debut := clock_timestamp();
+        EXECUTE format('REFRESH MATERIALIZED VIEW CONCURRENTLY %I', v_vue.vue);
+
+        -- Les demandes arrivées pendant le rafraîchissement restent en file
+        DELETE FROM file_rafraichissement_vues
+        WHERE vue = v_vue.vue AND id <= v_vue.dernier_id;
+
+        UPDATE etat_vues_materialisees
+        SET rafraichi_at = v_debut,
+            duree_ms = EXTRACT(EPOCH FROM clock_timestamp() - v_debut) * 1000,
+            nb_rafraichissements = nb_rafraichissements + 1
+        WHERE vue = v_vue.vue;
+
+        -- Cache des requêtes (PARTIE 15) : la vue a changé
+        PERFORM pg_notify('changements_tables', v_vue.vue);
+
+        v_nb := v_nb + 1;
+    END LOOP;
+
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fraîcheur affichée dans les tableaux de bord
+CREATE OR REPLACE FUNCTION fraicheur_vues()
+RETURNS TABLE(vue VARCHAR(63), rafraichi_at TIMESTAMP, en_attente BOOLEAN) AS $$
+    SELECT s.vue, s.rafraichi_at,
+           EXISTS (SELECT 1 FROM file_rafraichissement_vues q WHERE q.vue = s.vue)
+    FROM etat_vues_materialisees s;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- PARTIE 14: EMPLOI DU TEMPS ÉTUDIANT PRÉCALCULÉ
+-- ============================================
+-- student_timetable dénormalise, pour chaque étudiant inscrit, ses examens
+-- actifs (module, formation, département, professeur, salle) : la lecture
+-- d'un emploi du temps devient un parcours d'intervalle sur la clé
+-- (etudiant_id, date_heure) au lieu d'une jointure sur sept tables.
+-- Des triggers par instruction (tables de transition, cf. PARTIE 10) ne
+-- recalculent que les examens ou étudiants touchés.
+
+CREATE TABLE IF NOT EXISTS student_timetable (
+    etudiant_id INT NOT NULL,
+    date_heure TIMESTAMP NOT NULL,
+    examen_id INT NOT NULL,
+    module_id INT NOT NULL,
+    module_code VARCHAR(20) NOT NULL,
+    module_nom VARCHAR(200) NOT NULL,
+    formation_nom VARCHAR(150) NOT NULL,
+    departement_nom VARCHAR(100) NOT NULL,
+    professeur_nom VARCHAR(201) NOT NULL,
+    salle_nom VARCHAR(100) NOT NULL,
+    salle_type VARCHAR(30) NOT NULL,
+    batiment VARCHAR(50),
+    capacite INT NOT NULL,
+    duree_minutes INT NOT NULL,
+    date_fin TIMESTAMP NOT NULL,
+    type_examen VARCHAR(30),
+    statut VARCHAR(20) NOT NULL,
+    PRIMARY KEY (etudiant_id, date_heure, examen_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_student_timetable_examen ON student_timetable(examen_id);
+
+-- Recalcule les lignes des examens et/ou étudiants donnés (NULL = tous)
+CREATE OR REPLACE FUNCTION rafraichir_student_timetable(p_examens INT[], p_etudiants INT[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM student_timetable st
+    WHERE (p_examens IS NULL OR st.examen_id IN (SELECT UNNEST(p_examens)))
+      AND (p_etudiants IS NULL OR st.etudiant_id IN (SELECT UNNEST(p_etudiants)));
+
+    INSERT INTO student_timetable (
+        etudiant_id, date_heure, examen_id, module_id, module_code, module_nom,
+        formation_nom, departement_nom, professeur_nom, salle_nom, salle_type,
+        batiment, capacite, duree_minutes, date_fin, type_examen, statut
+    )
+    -- Une ligne par étudiant et examen, même inscrit à plusieurs sessions
+    -- ou années du module (inscriptions n'est unique que par session)
+    SELECT DISTINCT ON (i.etudiant_id, e.id)
+        i.etudiant_id,
+        e.date_heure,
+        e.id,
+        e.module_id,
+        m.code,
+        m.nom,
+        f.nom,
+        d.nom,
+        CONCAT(p.nom, ' ', p.prenom),
+        l.nom,
+        l.type,
+        l.batiment,
+        l.capacite,
+        e.duree_minutes,
+        e.date_heure + e.duree_minutes * INTERVAL '1 minute',
+        e.type_examen,
+        e.statut
+    FROM examens e
+    JOIN inscriptions i ON i.module_id = e.module_id AND i.statut = 'Inscrit'
+    JOIN modules m ON e.module_id = m.id
+    JOIN formations f ON m.formation_id = f.id
+    JOIN departements d ON f.departement_id = d.id
+    JOIN professeurs p ON e.professeur_id = p.id
+    JOIN lieux_examen l ON e.salle_id = l.id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND (p_examens IS NULL OR e.id IN (SELECT UNNEST(p_examens)))
+      AND (p_etudiants IS NULL OR i.etudiant_id IN (SELECT UNNEST(p_etudiants)));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION reconstruire_student_timetable()
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    TRUNCATE student_timetable;
+    PERFORM rafraichir_student_timetable(NULL, NULL);
+    SELECT COUNT(*) INTO v_count FROM student_timetable;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger examens : examens insérés, supprimés ou dont une colonne copiée change
+CREATE OR REPLACE FUNCTION trg_student_timetable_examens()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_examens INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(id) INTO v_examens FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT ARRAY_AGG(id) INTO v_examens FROM old_rows;
+    ELSE
+        SELECT ARRAY_AGG(n.id)
+        INTO v_examens
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.module_id, o.professeur_id, o.salle_id, o.date_heure, o.duree_minutes, o.type_examen, o.statut)
+              IS DISTINCT FROM
+              (n.module_id, n.professeur_id, n.salle_id, n.date_heure, n.duree_minutes, n.type_examen, n.statut);
+    END IF;
+
+    IF v_examens IS NOT NULL THEN
+        PERFORM rafraichir_student_timetable(v_examens, NULL);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger inscriptions : tout l'emploi du temps des étudiants touchés
+CREATE OR REPLACE FUNCTION trg_student_timetable_inscriptions()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_etudiants INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(DISTINCT etudiant_id) INTO v_etudiants FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT ARRAY_AGG(DISTINCT etudiant_id) INTO v_etudiants FROM old_rows;
+    ELSE
+        SELECT ARRAY_AGG(DISTINCT r.etudiant_id)
+        INTO v_etudiants
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        CROSS JOIN LATERAL (VALUES (o.etudiant_id), (n.etudiant_id)) r(etudiant_id)
+        WHERE (o.etudiant_id, o.module_id, o.statut) IS DISTINCT FROM (n.etudiant_id, n.module_id, n.statut);
+    END IF;
+
+    IF v_etudiants IS NOT NULL THEN
+        PERFORM rafraichir_student_timetable(NULL, v_etudiants);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger tables de référence : examens dont un libellé copié a changé
+CREATE OR REPLACE FUNCTION trg_student_timetable_references()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_examens INT[];
+BEGIN
+    IF TG_TABLE_NAME = 'modules' THEN
+        SELECT ARRAY_AGG(e.id) INTO v_examens
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN examens e ON e.module_id = n.id
+        WHERE (o.code, o.nom, o.formation_id) IS DISTINCT FROM (n.code, n.nom, n.formation_id);
+    ELSIF TG_TABLE_NAME = 'formations' THEN
+        SELECT ARRAY_AGG(e.id) INTO v_examens
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN modules m ON m.formation_id = n.id
+        JOIN examens e ON e.module_id = m.id
+        WHERE (o.nom, o.departement_id) IS DISTINCT FROM (n.nom, n.departement_id);
+    ELSIF TG_TABLE_NAME = 'departements' THEN
+        SELECT ARRAY_AGG(e.id) INTO v_examens
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN formations f ON f.departement_id = n.id
+        JOIN modules m ON m.formation_id = f.id
+        JOIN examens e ON e.module_id = m.id
+        WHERE o.nom IS DISTINCT FROM n.nom;
+    ELSIF TG_TABLE_NAME = 'professeurs' THEN
+        SELECT ARRAY_AGG(e.id) INTO v_examens
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN examens e ON e.professeur_id = n.id
+        WHERE (o.nom, o.prenom) IS DISTINCT FROM (n.nom, n.prenom);
+    ELSIF TG_TABLE_NAME = 'lieux_examen' THEN
+        SELECT ARRAY_AGG(e.id) INTO v_examens
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        JOIN examens e ON e.salle_id = n.id
+        WHERE (o.nom, o.type, o.batiment, o.capacite) IS DISTINCT FROM (n.nom, n.type, n.batiment, n.capacite);
+    END IF;
+
+    IF v_examens IS NOT NULL THEN
+        PERFORM rafraichir_student_timetable(v_examens, NULL);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_student_timetable_examens_ins ON examens;
+CREATE TRIGGER trg_student_timetable_examens_ins
+AFTER INSERT ON examens
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_examens();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_examens_upd ON examens;
+CREATE TRIGGER trg_student_timetable_examens_upd
+AFTER UPDATE ON examens
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_examens();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_examens_del ON examens;
+CREATE TRIGGER trg_student_timetable_examens_del
+AFTER DELETE ON examens
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_examens();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_inscriptions_ins ON inscriptions;
+CREATE TRIGGER trg_student_timetable_inscriptions_ins
+AFTER INSERT ON inscriptions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_inscriptions();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_inscriptions_upd ON inscriptions;
+CREATE TRIGGER trg_student_timetable_inscriptions_upd
+AFTER UPDATE ON inscriptions
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_inscriptions();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_inscriptions_del ON inscriptions;
+CREATE TRIGGER trg_student_timetable_inscriptions_del
+AFTER DELETE ON inscriptions
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_inscriptions();
+
+-- La suppression d'une ligne de référence supprime ses examens ou
+-- inscriptions en cascade : seules les mises à jour sont suivies ici
+DROP TRIGGER IF EXISTS trg_student_timetable_modules_upd ON modules;
+CREATE TRIGGER trg_student_timetable_modules_upd
+AFTER UPDATE ON modules
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_references();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_formations_upd ON formations;
+CREATE TRIGGER trg_student_timetable_formations_upd
+AFTER UPDATE ON formations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_references();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_departements_upd ON departements;
+CREATE TRIGGER trg_student_timetable_departements_upd
+AFTER UPDATE ON departements
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_references();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_professeurs_upd ON professeurs;
+CREATE TRIGGER trg_student_timetable_professeurs_upd
+AFTER UPDATE ON professeurs
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_references();
+
+DROP TRIGGER IF EXISTS trg_student_timetable_lieux_upd ON lieux_examen;
+CREATE TRIGGER trg_student_timetable_lieux_upd
+AFTER UPDATE ON lieux_examen
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_student_timetable_references();
+
+-- Initialisation à partir des données existantes
+SELECT '✅ Emplois du temps étudiants initialisés' as status, reconstruire_student_timetable() as total;
+
+-- ============================================
+-- PARTIE 15: NOTIFICATION DES CHANGEMENTS (CACHE DES REQUÊTES)
+-- ============================================
+-- query_cache.py garde en mémoire, pour toutes les sessions, les résultats
+-- des tableaux de bord. Ces triggers publient sur le canal
+-- 'changements_tables' le nom de la table modifiée ; les notifications
+-- sont envoyées au COMMIT et dédupliquées par transaction (une seule pour
+-- un import de 10 000 examens). rafraichir_vues_en_attente() publie de
+-- même le nom de chaque vue matérialisée rafraîchie.
+
+CREATE OR REPLACE FUNCTION notifier_changement_table()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('changements_tables', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notifier_examens ON examens;
+CREATE TRIGGER trg_notifier_examens
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON examens
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_inscriptions ON inscriptions;
+CREATE TRIGGER trg_notifier_inscriptions
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON inscriptions
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_lieux_examen ON lieux_examen;
+CREATE TRIGGER trg_notifier_lieux_examen
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON lieux_examen
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_professeurs ON professeurs;
+CREATE TRIGGER trg_notifier_professeurs
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON professeurs
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_modules ON modules;
+CREATE TRIGGER trg_notifier_modules
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON modules
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_formations ON formations;
+CREATE TRIGGER trg_notifier_formations
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON formations
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_departements ON departements;
+CREATE TRIGGER trg_notifier_departements
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON departements
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+DROP TRIGGER IF EXISTS trg_notifier_conflits_actifs ON conflits_actifs;
+CREATE TRIGGER trg_notifier_conflits_actifs
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON conflits_actifs
+FOR EACH STATEMENT EXECUTE FUNCTION notifier_changement_table();
+
+-- ============================================
+-- PARTIE 16: FILE DE TRAVAUX (GÉNÉRATION, ANALYSE DES CONFLITS)
+-- ============================================
+-- Les calculs longs ne tournent plus dans le script Streamlit : l'interface
+-- insère un travail, des processus worker.py (autant que nécessaire, sur une
+-- ou plusieurs machines) le réservent avec FOR UPDATE SKIP LOCKED, publient
+-- leur progression dans la table et y déposent le résultat (JSONB).
+-- Un travail dont le worker ne donne plus signe de vie (heartbeat_at) est
+-- remis en file ou marqué en échec par recuperer_jobs_abandonnes().
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    type VARCHAR(30) NOT NULL CHECK (type IN ('generation', 'conflits')),
+    parametres JSONB NOT NULL DEFAULT '{}',
+    statut VARCHAR(20) NOT NULL DEFAULT 'EN_ATTENTE'
+        CHECK (statut IN ('EN_ATTENTE', 'EN_COURS', 'TERMINE', 'ECHOUE', 'ANNULE')),
+    progression SMALLINT NOT NULL DEFAULT 0 CHECK (progression BETWEEN 0 AND 100),
+    message TEXT,
+    resultat JSONB,
+    erreur TEXT,
+    tentatives INT NOT NULL DEFAULT 0,
+    max_tentatives INT NOT NULL DEFAULT 2,
+    worker VARCHAR(100),
+    cree_par INT,  -- users.id, sans clé étrangère comme audit_log.changed_by
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Seuls les travaux en attente sont parcourus par reserver_job()
+CREATE INDEX IF NOT EXISTS idx_jobs_en_attente ON jobs(id) WHERE statut = 'EN_ATTENTE';
+CREATE INDEX IF NOT EXISTS idx_jobs_en_cours ON jobs(heartbeat_at) WHERE statut = 'EN_COURS';
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at DESC);
+
+-- Réveil immédiat des workers en attente (LISTEN jobs)
+CREATE OR REPLACE FUNCTION notifier_nouveau_job()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('jobs', NEW.type);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_jobs_notifier ON jobs;
+CREATE TRIGGER trg_jobs_notifier
+AFTER INSERT ON jobs
+FOR EACH ROW EXECUTE FUNCTION notifier_nouveau_job();
+
+-- Réserve le plus ancien travail en attente (NULL = tous les types).
+-- SKIP LOCKED : deux workers ne se bloquent jamais et ne prennent jamais
+-- le même travail.
+CREATE OR REPLACE FUNCTION reserver_job(
+    p_worker VARCHAR,
+    p_types VARCHAR[] DEFAULT NULL
+)
+RETURNS SETOF jobs AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE jobs j SET
+        statut = 'EN_COURS',
+        tentatives = j.tentatives + 1,
+        worker = p_worker,
+        progression = 0,
+        message = NULL,
+        erreur = NULL,
+        started_at = clock_timestamp(),
+        heartbeat_at = clock_timestamp()
+    WHERE j.id = (
+        SELECT id FROM jobs
+        WHERE statut = 'EN_ATTENTE'
+          AND (p_types IS NULL OR type = ANY(p_types))
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Travaux sans heartbeat depuis p_delai : remis en file s'il reste des
+-- tentatives, en échec sinon. Retourne le nombre de travaux traités.
+CREATE OR REPLACE FUNCTION recuperer_jobs_abandonnes(p_delai INTERVAL DEFAULT INTERVAL '2 minutes')
+RETURNS INT AS $$
+DECLARE
+    v_total INT;
+BEGIN
+    WITH abandonnes AS (
+        SELECT id FROM jobs
+        WHERE statut = 'EN_COURS'
+          AND heartbeat_at < clock_timestamp() - p_delai
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE jobs j SET
+        statut = CASE WHEN j.tentatives < j.max_tentatives THEN 'EN_ATTENTE' ELSE 'ECHOUE' END,
+        erreur = 'Worker ' || COALESCE(j.worker, '?') || ' sans réponse depuis ' || p_delai,
+        finished_at = CASE WHEN j.tentatives < j.max_tentatives THEN NULL ELSE clock_timestamp() END
+    FROM abandonnes a
+    WHERE j.id = a.id;
+
+    GET DIAGNOSTICS v_total = ROW_COUNT;
+    RETURN v_total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- PARTIE 17: CONFLITS FILTRÉS (DÉPARTEMENT, FORMATION, PÉRIODE)
+-- ============================================
+-- Un chef de département ne lit que sa tranche du stock conflits_actifs :
+-- les examens de son périmètre sont sélectionnés d'abord (jointures
+-- indexées modules -> formations), puis les conflits qui en contiennent au
+-- moins un (GIN sur examens_ids). Un conflit étudiant entre un examen du
+-- département et un examen d'un autre département est donc inclus.
+-- Colonnes structurées : plus de texte à analyser côté application.
+
+CREATE INDEX IF NOT EXISTS idx_conflits_actifs_examens ON conflits_actifs USING GIN (examens_ids);
+CREATE INDEX IF NOT EXISTS idx_conflits_actifs_jour ON conflits_actifs(jour);
+
+CREATE OR REPLACE FUNCTION detecter_conflits_filtre(
+    p_departement_id INT DEFAULT NULL,
+    p_formation_id INT DEFAULT NULL,
+    p_date_debut DATE DEFAULT NULL,
+    p_date_fin DATE DEFAULT NULL
+)
+RETURNS TABLE(
+    type_conflit VARCHAR(50),
+    severite VARCHAR(20),
+    entite VARCHAR(20),
+    entite_id INT,
+    jour DATE,
+    examens_ids INT[],
+    nb INT
+) AS $$
+DECLARE
+    v_examens INT[];
+BEGIN
+    IF p_departement_id IS NULL AND p_formation_id IS NULL THEN
+        -- Pas de périmètre : seule la période filtre
+        RETURN QUERY
+        SELECT ca.type_conflit, ca.severite, ca.entite, ca.entite_id, ca.jour, ca.examens_ids, ca.nb
+        FROM conflits_actifs ca
+        WHERE (p_date_debut IS NULL OR ca.jour >= p_date_debut)
+          AND (p_date_fin IS NULL OR ca.jour <= p_date_fin)
+        ORDER BY CASE ca.severite WHEN 'CRITIQUE' THEN 1 WHEN 'ÉLEVÉ' THEN 2 WHEN 'MOYEN' THEN 3 ELSE 4 END,
+                 ca.jour, ca.entite, ca.entite_id;
+        RETURN;
+    END IF;
+
+    SELECT ARRAY_AGG(e.id) INTO v_examens
+    FROM examens e
+    JOIN modules m ON m.id = e.module_id
+    JOIN formations f ON f.id = m.formation_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND (p_departement_id IS NULL OR f.departement_id = p_departement_id)
+      AND (p_formation_id IS NULL OR m.formation_id = p_formation_id)
+      AND (p_date_debut IS NULL OR e.date_heure >= p_date_debut)
+      AND (p_date_fin IS NULL OR e.date_heure < p_date_fin + 1);
+
+    IF v_examens IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT ca.type_conflit, ca.severite, ca.entite, ca.entite_id, ca.jour, ca.examens_ids, ca.nb
+    FROM conflits_actifs ca
+    WHERE ca.examens_ids && v_examens
+      AND (p_date_debut IS NULL OR ca.jour >= p_date_debut)
+      AND (p_date_fin IS NULL OR ca.jour <= p_date_fin)
+    ORDER BY CASE ca.severite WHEN 'CRITIQUE' THEN 1 WHEN 'ÉLEVÉ' THEN 2 WHEN 'MOYEN' THEN 3 ELSE 4 END,
+             ca.jour, ca.entite, ca.entite_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- ============================================
+-- PARTIE 18: VALIDATION DU PLANNING PAR LOTS
+-- ============================================
+-- Un seul UPDATE sur toute une session (50 000 examens) verrouille toutes
+-- les lignes jusqu'à la fin et écrit le WAL d'un bloc. La validation avance
+-- par lots d'identifiants croissants, chacun dans sa propre transaction
+-- (appelant : valider_planning_par_lots, queries.py) : verrous courts, une
+-- entrée d'audit par lot. Seuls les examens encore 'Planifie' sont pris :
+-- une validation interrompue se reprend depuis le dernier id traité, ou
+-- simplement depuis le début.
+
+-- Parcours des examens à valider dans l'ordre des id
+CREATE INDEX IF NOT EXISTS idx_examens_planifies_id ON examens(id) WHERE statut = 'Planifie';
+
+CREATE OR REPLACE FUNCTION valider_examens_lot(
+    p_apres_id INT DEFAULT 0,
+    p_taille INT DEFAULT 1000,
+    p_examens_ids INT[] DEFAULT NULL,
+    p_departement_id INT DEFAULT NULL,
+    p_date_debut DATE DEFAULT NULL,
+    p_date_fin DATE DEFAULT NULL,
+    p_user_id INT DEFAULT NULL
+)
+RETURNS TABLE(dernier_id INT, valides INT) AS $$
+DECLARE
+    v_lot INT[];
+    v_ids INT[];
+    v_user_id INT;
+BEGIN
+    v_user_id := COALESCE(p_user_id, NULLIF(current_setting('app.user_id', TRUE), '')::INT);
+
+    -- Lot suivant : les p_taille premiers examens planifiés au-delà de p_apres_id
+    SELECT array_agg(lot.id ORDER BY lot.id) INTO v_lot
+    FROM (
+        SELECT e.id
+        FROM examens e
+        WHERE e.statut = 'Planifie'
+          AND e.id > p_apres_id
+          AND (p_examens_ids IS NULL OR e.id = ANY(p_examens_ids))
+          AND (p_date_debut IS NULL OR e.date_heure >= p_date_debut)
+          AND (p_date_fin IS NULL OR e.date_heure < p_date_fin + 1)
+          AND (p_departement_id IS NULL OR EXISTS (
+                SELECT 1
+                FROM modules m
+                JOIN formations f ON f.id = m.formation_id
+                WHERE m.id = e.module_id AND f.departement_id = p_departement_id
+          ))
+        ORDER BY e.id
+        LIMIT p_taille
+    ) lot;
+
+    -- Plus rien à valider : dernier_id NULL
+    dernier_id := v_lot[array_length(v_lot, 1)];
+    IF dernier_id IS NULL THEN
+        valides := 0;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    PERFORM set_config('app.audit_bulk', 'on', TRUE);
+
+    -- statut revérifié : un examen modifié entre-temps n'est pas écrasé
+    WITH maj AS (
+        UPDATE examens e
+        SET statut = 'Confirme', updated_by = COALESCE(v_user_id, e.updated_by)
+        WHERE e.id = ANY(v_lot) AND e.statut = 'Planifie'
+        RETURNING e.id
+    )
+    SELECT array_agg(id ORDER BY id) INTO v_ids FROM maj;
+
+    PERFORM set_config('app.audit_bulk', 'off', TRUE);
+
+    valides := COALESCE(array_length(v_ids, 1), 0);
+
+    -- Une seule entrée d'audit pour le lot
+    IF valides > 0 THEN
+        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, changed_by, ip_address)
+        VALUES ('examens', v_ids[1], 'UPDATE',
+                jsonb_build_object('statut', 'Planifie'),
+                jsonb_build_object('lot', TRUE, 'statut', 'Confirme', 'nb', valides, 'examens', to_jsonb(v_ids)),
+                v_user_id, inet_client_addr()::VARCHAR);
+    END IF;
+
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- PARTIE 19: AUDIT PAR INSTRUCTION, ÉCRITURE DIFFÉRÉE
+-- ============================================
+-- Les triggers trg_audit_* (audit_trigger_function) écrivaient dans
+-- audit_log, ligne à ligne et dans la transaction de l'application, deux
+-- row_to_json complets par ligne modifiée. Ils sont remplacés par des
+-- triggers par instruction (tables de transition, cf. PARTIE 10) :
+--   * seules les colonnes modifiées sont gardées pour un UPDATE ;
+--   * jusqu'à app.audit_seuil_lot lignes (100), une entrée par ligne,
+--     comme avant ; au-delà, une seule entrée pour l'instruction, dont
+--     new_values contient le détail de chaque ligne ;
+--   * les entrées vont dans file_audit (UNLOGGED : ni WAL ni index
+--     secondaire), que vider_file_audit() verse par lots dans audit_log
+--     (audit_flusher.py, quelques secondes de décalage).
+-- Un arrêt brutal du serveur vide une table UNLOGGED : les entrées pas
+-- encore versées sont perdues. Si cette fenêtre n'est pas acceptable :
+-- ALTER TABLE file_audit SET LOGGED (l'écriture reste ensembliste).
+-- app.audit_bulk = 'on' suspend toujours l'audit automatique (PARTIE 11).
+
+CREATE UNLOGGED TABLE IF NOT EXISTS file_audit (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL,
+    record_id INT NOT NULL,
+    action VARCHAR(10) NOT NULL,
+    old_values JSONB,
+    new_values JSONB,
+    changed_by INT,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ip_address VARCHAR(45)
+);
+
+-- Trigger par instruction ; TG_ARGV : colonnes dont le seul changement
+-- n'est pas tracé (users : connexions)
+CREATE OR REPLACE FUNCTION audit_instruction()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_user_id INT;
+    v_ip_address VARCHAR(45);
+    v_ignorees TEXT[] := COALESCE(TG_ARGV, '{}'::TEXT[]);
+    v_seuil INT;
+    v_total INT;
+    v_colonnes TEXT[];
+    v_changees TEXT[];
+    v_filtre TEXT;
+    v_nb INT;
+    v_ids JSONB;
+    v_old JSONB;
+    v_new JSONB;
+BEGIN
+    IF COALESCE(current_setting('app.audit_bulk', TRUE), '') = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    BEGIN
+        v_user_id := NULLIF(current_setting('app.user_id', TRUE), '')::INT;
+    EXCEPTION WHEN OTHERS THEN
+        v_user_id := NULL;
+    END;
+    v_ip_address := inet_client_addr()::VARCHAR;
+    v_seuil := COALESCE(NULLIF(current_setting('app.audit_seuil_lot', TRUE), '')::INT, 100);
+
+    IF TG_OP = 'DELETE' THEN
+        SELECT COUNT(*) INTO v_total FROM old_rows;
+    ELSE
+        SELECT COUNT(*) INTO v_total FROM new_rows;
+    END IF;
+
+    -- Petite instruction : une entrée par ligne, colonnes modifiées seulement
+    IF v_total <= v_seuil THEN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO file_audit (table_name, record_id, action, new_values, changed_by, ip_address)
+            SELECT TG_TABLE_NAME, r.id, TG_OP, jsonb_strip_nulls(to_jsonb(r)), v_user_id, v_ip_address
+            FROM new_rows r
+            ORDER BY r.id;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO file_audit (table_name, record_id, action, old_values, changed_by, ip_address)
+            SELECT TG_TABLE_NAME, r.id, TG_OP, jsonb_strip_nulls(to_jsonb(r)), v_user_id, v_ip_address
+            FROM old_rows r
+            ORDER BY r.id;
+        ELSE
+            INSERT INTO file_audit (table_name, record_id, action, old_values, new_values, changed_by, ip_address)
+            SELECT TG_TABLE_NAME, d.id, TG_OP, d.old, d.new, v_user_id, v_ip_address
+            FROM (
+                SELECT p.id,
+                       jsonb_object_agg(c.key, p.oj -> c.key) AS old,
+                       jsonb_object_agg(c.key, c.value) AS new,
+                       bool_or(c.key <> ALL (v_ignorees)) AS utile
+                FROM (
+                    SELECT n.id, to_jsonb(o) AS oj, to_jsonb(n) AS nj
+                    FROM new_rows n
+                    JOIN old_rows o ON o.id = n.id
+                    OFFSET 0
+                ) p
+                CROSS JOIN LATERAL jsonb_each(p.nj) c
+                WHERE p.nj <> p.oj AND c.value IS DISTINCT FROM p.oj -> c.key
+                GROUP BY p.id
+            ) d
+            WHERE d.utile
+            ORDER BY d.id;
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    -- Instruction en masse : une seule entrée, valeurs rangées par colonne
+    -- ({"ids": [...], "colonnes": {"statut": [...]}}), sans objet JSON par ligne
+    SELECT array_agg(a.attname::TEXT ORDER BY a.attnum) INTO v_colonnes
+    FROM pg_attribute a
+    WHERE a.attrelid = TG_RELID AND a.attnum > 0 AND NOT a.attisdropped;
+
+    IF TG_OP = 'UPDATE' THEN
+        -- Lignes dont une colonne suivie a changé, et colonnes changées
+        SELECT format('ROW(%s) IS DISTINCT FROM ROW(%s)',
+                      string_agg(format('o.%I', c), ', '), string_agg(format('n.%I', c), ', '))
+        INTO v_filtre
+        FROM unnest(v_colonnes) c
+        WHERE c <> ALL (v_ignorees);
+
+        EXECUTE format(
+            'SELECT COUNT(*), ARRAY[%s] FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE %s',
+            (SELECT string_agg(format('CASE WHEN bool_or(o.%1$I IS DISTINCT FROM n.%1$I) THEN %1$L END', c), ', ')
+             FROM unnest(v_colonnes) c),
+            v_filtre)
+        INTO v_nb, v_changees;
+
+        IF v_nb = 0 THEN
+            RETURN NULL;
+        END IF;
+
+        EXECUTE format(
+            'SELECT to_jsonb(array_agg(n.id ORDER BY n.id)), jsonb_build_object(%s), jsonb_build_object(%s) '
+            'FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE %s',
+            (SELECT string_agg(format('%1$L, to_jsonb(array_agg(o.%1$I ORDER BY n.id))', c), ', ')
+             FROM unnest(array_remove(v_changees, NULL)) c),
+            (SELECT string_agg(format('%1$L, to_jsonb(array_agg(n.%1$I ORDER BY n.id))', c), ', ')
+             FROM unnest(array_remove(v_changees, NULL)) c),
+            v_filtre)
+        INTO v_ids, v_old, v_new;
+
+        v_old := jsonb_build_object('colonnes', v_old);
+        v_new := jsonb_build_object('colonnes', v_new);
+    ELSE
+        v_nb := v_total;
+        EXECUTE format(
+            'SELECT to_jsonb(array_agg(r.id ORDER BY r.id)), jsonb_build_object(%s) FROM %I r',
+            (SELECT string_agg(format('%1$L, to_jsonb(array_agg(r.%1$I ORDER BY r.id))', c), ', ')
+             FROM unnest(v_colonnes) c WHERE c <> 'id'),
+            CASE TG_OP WHEN 'INSERT' THEN 'new_rows' ELSE 'old_rows' END)
+        INTO v_ids, v_new;
+
+        IF TG_OP = 'DELETE' THEN
+            v_old := jsonb_build_object('colonnes', v_new);
+            v_new := '{}'::JSONB;
+        ELSE
+            v_new := jsonb_build_object('colonnes', v_new);
+        END IF;
+    END IF;
+
+    INSERT INTO file_audit (table_name, record_id, action, old_values, new_values, changed_by, ip_address)
+    VALUES (TG_TABLE_NAME, (v_ids ->> 0)::INT, TG_OP, v_old,
+            jsonb_build_object('lot', TRUE, 'nb', v_nb, 'ids', v_ids) || v_new,
+            v_user_id, v_ip_address);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Remplace les triggers ligne à ligne des PARTIES 2 et 11
+DO $$
+DECLARE
+    v_cible RECORD;
+BEGIN
+    FOR v_cible IN
+        SELECT * FROM (VALUES
+            ('examens', 'examens', ''),
+            ('etudiants', 'etudiants', ''),
+            ('professeurs', 'professeurs', ''),
+            ('inscriptions', 'inscriptions', ''),
+            ('modules', 'modules', ''),
+            ('formations', 'formations', ''),
+            ('lieux_examen', 'lieux', ''),
+            ('chef_departement', 'chef', ''),
+            ('users', 'users', '''last_login'', ''failed_attempts'', ''updated_at''')
+        ) AS t(nom_table, suffixe, ignorees)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_audit_' || v_cible.suffixe, v_cible.nom_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_audit_' || v_cible.suffixe || '_ins', v_cible.nom_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_audit_' || v_cible.suffixe || '_upd', v_cible.nom_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_audit_' || v_cible.suffixe || '_del', v_cible.nom_table);
+
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION audit_instruction(%s)',
+            'trg_audit_' || v_cible.suffixe || '_ins', v_cible.nom_table, v_cible.ignorees);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION audit_instruction(%s)',
+            'trg_audit_' || v_cible.suffixe || '_upd', v_cible.nom_table, v_cible.ignorees);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION audit_instruction(%s)',
+            'trg_audit_' || v_cible.suffixe || '_del', v_cible.nom_table, v_cible.ignorees);
+    END LOOP;
+END $$;
+
+-- Versement dans audit_log, dans l'ordre d'arrivée ; SKIP LOCKED : plusieurs
+-- processus peuvent vider la file en même temps sans s'attendre
+CREATE OR REPLACE FUNCTION vider_file_audit(p_max INT DEFAULT 5000)
+RETURNS INT AS $$
+DECLARE
+    v_nb INT;
+BEGIN
+    WITH lot AS (
+        DELETE FROM file_audit
+        WHERE id IN (
+            SELECT id FROM file_audit
+            ORDER BY id
+            LIMIT p_max
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ),
+    verses AS (
+        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, changed_by, changed_at, ip_address)
+        SELECT table_name, record_id, action, old_values, new_values, changed_by, changed_at, ip_address
+        FROM lot
+        ORDER BY id
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO v_nb FROM verses;
+
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- PARTIE 20: AUDIT_LOG PARTITIONNÉ PAR MOIS
+-- ============================================
+-- audit_log devient une table partitionnée par mois sur changed_at :
+--   * une partition audit_log_AAAA_MM par mois, créées d'avance par
+--     creer_partitions_audit() (audit_flusher.py, une fois par heure) ;
+--     audit_log_defaut recueille une ligne hors de toute partition et ses
+--     lignes sont déplacées quand la partition du mois est créée ;
+--   * index BRIN sur changed_at (les lignes arrivent dans l'ordre du temps)
+--     au lieu du B-tree ; le B-tree (table_name, record_id) reste ;
+--   * la rétention supprime des partitions entières (DETACH + DROP) au lieu
+--     d'un DELETE de plusieurs millions de lignes ; audit_flusher.py peut
+--     d'abord les exporter en CSV compressé (audit_archive_dir).
+-- Les requêtes filtrent changed_at par des bornes constantes (COALESCE
+-- plutôt que "param IS NULL OR ...") pour que seules les partitions de la
+-- période soient lues.
+
+-- Vues recréées plus bas, sur la table partitionnée
+DROP VIEW IF EXISTS v_audit_recent_activity;
+DROP VIEW IF EXISTS v_audit_daily_stats;
+DROP VIEW IF EXISTS v_audit_top_users;
+
+-- Migration : l'ancienne table est mise de côté, son contenu recopié plus bas
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_log')) = 'r' THEN
+        ALTER TABLE audit_log RENAME TO audit_log_monolithique;
+        ALTER TABLE audit_log_monolithique RENAME CONSTRAINT audit_log_pkey TO audit_log_monolithique_pkey;
+        ALTER SEQUENCE audit_log_id_seq OWNED BY NONE;
+        DROP INDEX IF EXISTS idx_audit_table_record;
+        DROP INDEX IF EXISTS idx_audit_changed_at;
+    END IF;
+END $$;
+
+CREATE SEQUENCE IF NOT EXISTS audit_log_id_seq;
+
+-- La clé primaire d'une table partitionnée contient la clé de partition
+CREATE TABLE IF NOT EXISTS audit_log (
+    id BIGINT NOT NULL DEFAULT nextval('audit_log_id_seq'),
+    table_name VARCHAR(100) NOT NULL,
+    record_id INT NOT NULL,
+    action VARCHAR(10) NOT NULL CHECK (action IN ('INSERT', 'UPDATE', 'DELETE')),
+    old_values JSONB,
+    new_values JSONB,
+    changed_by INT,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ip_address VARCHAR(45),
+    PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id;
+
+CREATE TABLE IF NOT EXISTS audit_log_defaut PARTITION OF audit_log DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_audit_table_record ON audit_log(table_name, record_id);
+CREATE INDEX IF NOT EXISTS idx_audit_changed_at_brin ON audit_log USING BRIN (changed_at) WITH (pages_per_range = 32);
+
+-- Partitions mensuelles de p_depuis (mois courant par défaut) jusqu'à
+-- p_mois_avance mois après le mois courant ; retourne le nombre créé.
+-- La partition est remplie puis attachée : les écritures dans audit_log ne
+-- sont pas bloquées (ATTACH ne prend qu'un SHARE UPDATE EXCLUSIVE).
+CREATE OR REPLACE FUNCTION creer_partitions_audit(p_mois_avance INT DEFAULT 3, p_depuis DATE DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+    v_mois DATE;
+    v_fin DATE;
+    v_dernier DATE;
+    v_nom TEXT;
+    v_nb INT := 0;
+BEGIN
+    -- Un seul processus à la fois (plusieurs audit_flusher.py)
+    IF NOT pg_try_advisory_xact_lock(hashtext('creer_partitions_audit')) THEN
+        RETURN 0;
+    END IF;
+
+    v_mois := date_trunc('month', COALESCE(p_depuis, CURRENT_DATE))::DATE;
+    v_dernier := (date_trunc('month', CURRENT_DATE) + make_interval(months => p_mois_avance))::DATE;
+
+    WHILE v_mois <= v_dernier LOOP
+        v_fin := (v_mois + INTERVAL '1 month')::DATE;
+        v_nom := 'audit_log_' || to_char(v_mois, 'YYYY_MM');
+
+        IF to_regclass(v_nom) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE audit_log INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_nom);
+            -- Lignes du mois déjà tombées dans la partition par défaut
+            EXECUTE format(
+                'WITH deplacees AS (DELETE FROM audit_log_defaut WHERE changed_at >= %L AND changed_at < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM deplacees',
+                v_mois, v_fin, v_nom);
+            EXECUTE format('ALTER TABLE audit_log ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           v_nom, v_mois, v_fin);
+            v_nb := v_nb + 1;
+        END IF;
+
+        v_mois := v_fin;
+    END LOOP;
+
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF to_regclass('audit_log_monolithique') IS NOT NULL THEN
+        PERFORM creer_partitions_audit(3, (SELECT MIN(changed_at)::DATE FROM audit_log_monolithique));
+        INSERT INTO audit_log (id, table_name, record_id, action, old_values, new_values, changed_by, changed_at, ip_address)
+        SELECT id, table_name, record_id, action, old_values, new_values, changed_by,
+               COALESCE(changed_at, CURRENT_TIMESTAMP), ip_address
+        FROM audit_log_monolithique
+        ORDER BY changed_at, id;
+        DROP TABLE audit_log_monolithique;
+    END IF;
+END $$;
+
+SELECT creer_partitions_audit();
+
+-- Partitions dont tout le mois est plus ancien que p_conservation
+CREATE OR REPLACE FUNCTION partitions_audit_expirees(p_conservation INTERVAL DEFAULT INTERVAL '90 days')
+RETURNS TABLE(partition TEXT, debut TIMESTAMP, fin TIMESTAMP) AS $$
+    SELECT c.relname::TEXT, b.bornes[1]::TIMESTAMP, b.bornes[2]::TIMESTAMP
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    CROSS JOIN LATERAL (
+        SELECT regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\) TO \(''([^'']+)''\)') AS bornes
+    ) b
+    WHERE i.inhparent = 'audit_log'::regclass
+      AND b.bornes IS NOT NULL
+      AND b.bornes[2]::TIMESTAMP <= LOCALTIMESTAMP - p_conservation
+    ORDER BY 2;
+$$ LANGUAGE sql STABLE;
+
+-- Détache puis supprime une partition d'audit ; retourne son nombre de lignes
+CREATE OR REPLACE FUNCTION supprimer_partition_audit(p_partition TEXT)
+RETURNS BIGINT AS $$
+DECLARE
+    v_nb BIGINT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_inherits i
+        WHERE i.inhparent = 'audit_log'::regclass AND i.inhrelid = to_regclass(p_partition)
+    ) OR p_partition = 'audit_log_defaut' THEN
+        RAISE EXCEPTION 'Pas une partition mensuelle de audit_log : %', p_partition;
+    END IF;
+
+    EXECUTE format('SELECT COUNT(*) FROM %I', p_partition) INTO v_nb;
+    EXECUTE format('ALTER TABLE audit_log DETACH PARTITION %I', p_partition);
+    EXECUTE format('DROP TABLE %I', p_partition);
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions entières au lieu d'un DELETE ; seule la partition par défaut
+-- est purgée ligne à ligne. Sans argument : 90 jours, comme avant
+DROP FUNCTION IF EXISTS cleanup_old_audit_logs();
+
+CREATE OR REPLACE FUNCTION cleanup_old_audit_logs(p_conservation INTERVAL DEFAULT INTERVAL '90 days')
+RETURNS INT AS $$
+DECLARE
+    v_partition TEXT;
+    deleted_count BIGINT := 0;
+    v_nb BIGINT;
+BEGIN
+    FOR v_partition IN SELECT partition FROM partitions_audit_expirees(p_conservation) LOOP
+        deleted_count := deleted_count + supprimer_partition_audit(v_partition);
+    END LOOP;
+
+    DELETE FROM audit_log_defaut
+    WHERE changed_at < LOCALTIMESTAMP - p_conservation;
+    GET DIAGNOSTICS v_nb = ROW_COUNT;
+
+    RETURN deleted_count + v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION get_audit_statistics(
+    p_start_date TIMESTAMP DEFAULT NULL,
+    p_end_date TIMESTAMP DEFAULT NULL
+)
+RETURNS TABLE (
+    table_name VARCHAR,
+    action_type VARCHAR,
+    operation_count BIGINT,
+    last_operation TIMESTAMP
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT 
+        al.table_name,
+        al.action,
+        COUNT(*) as operation_count,
+        MAX(al.changed_at) as last_operation
+    FROM audit_log al
+    WHERE al.changed_at >= COALESCE(p_start_date, '-infinity')
+      AND al.changed_at <= COALESCE(p_end_date, 'infinity')
+    GROUP BY al.table_name, al.action
+    ORDER BY operation_count DESC;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Période optionnelle : seules ses partitions sont lues
+DROP FUNCTION IF EXISTS search_audit_log(VARCHAR, INT, VARCHAR, INT, INT);
+
+CREATE OR REPLACE FUNCTION search_audit_log(
+    p_table_name VARCHAR DEFAULT NULL,
+    p_record_id INT DEFAULT NULL,
+    p_action VARCHAR DEFAULT NULL,
+    p_user_id INT DEFAULT NULL,
+    p_limit INT DEFAULT 100,
+    p_depuis TIMESTAMP DEFAULT NULL,
+    p_jusqu_a TIMESTAMP DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    table_name VARCHAR,
+    record_id INT,
+    action VARCHAR,
+    changed_by INT,
+    changed_at TIMESTAMP,
+    ip_address VARCHAR,
+    old_data JSONB,
+    new_data JSONB
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT 
+        al.id,
+        al.table_name,
+        al.record_id,
+        al.action,
+        al.changed_by,
+        al.changed_at,
+        al.ip_address,
+        al.old_values,
+        al.new_values
+    FROM audit_log al
+    WHERE al.changed_at >= COALESCE(p_depuis, '-infinity')
+      AND al.changed_at <= COALESCE(p_jusqu_a, 'infinity')
+      AND (p_table_name IS NULL OR al.table_name = p_table_name)
+      AND (p_record_id IS NULL OR al.record_id = p_record_id)
+      AND (p_action IS NULL OR al.action = p_action)
+      AND (p_user_id IS NULL OR al.changed_by = p_user_id)
+    ORDER BY al.changed_at DESC
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Activité récente : les 30 derniers jours (deux partitions au plus)
+CREATE OR REPLACE VIEW v_audit_recent_activity AS
+SELECT 
+    al.id,
+    al.table_name as table_cible,
+    al.record_id as id_cible,
+    CASE al.action
+        WHEN 'INSERT' THEN '🟢 Ajout'
+        WHEN 'UPDATE' THEN '🔵 Modification'
+        WHEN 'DELETE' THEN '🔴 Suppression'
+    END as operation,
+    COALESCE(u.username, 'Système') as utilisateur,
+    al.changed_at as date_operation,
+    al.ip_address,
+    al.old_values IS NOT NULL as a_anciennes_valeurs,
+    al.new_values IS NOT NULL as a_nouvelles_valeurs
+FROM audit_log al
+LEFT JOIN users u ON al.changed_by = u.id
+WHERE al.changed_at >= LOCALTIMESTAMP - INTERVAL '30 days'
+ORDER BY al.changed_at DESC;
+
+-- Statistiques et utilisateurs actifs : toute la période conservée,
+-- bornée par la rétention (cleanup_old_audit_logs)
+CREATE OR REPLACE VIEW v_audit_daily_stats AS
+SELECT 
+    DATE(al.changed_at) as jour,
+    al.table_name,
+    al.action,
+    COUNT(*) as nombre_operations,
+    COUNT(DISTINCT al.changed_by) as nombre_utilisateurs
+FROM audit_log al
+GROUP BY DATE(al.changed_at), al.table_name, al.action
+ORDER BY jour DESC, nombre_operations DESC;
+
+CREATE OR REPLACE VIEW v_audit_top_users AS
+SELECT 
+    COALESCE(u.username, 'ID:' || al.changed_by::TEXT) as utilisateur,
+    COUNT(*) as total_operations,
+    COUNT(DISTINCT al.table_name) as tables_modifiees,
+    MIN(al.changed_at) as premiere_operation,
+    MAX(al.changed_at) as derniere_operation,
+    STRING_AGG(DISTINCT al.action, ', ' ORDER BY al.action) as types_operations
+FROM audit_log al
+LEFT JOIN users u ON al.changed_by = u.id
+GROUP BY al.changed_by, u.username
+ORDER BY total_operations DESC;
+
+-- ============================================
+-- PARTIE 21: EXAMENS ET INSCRIPTIONS PARTITIONNÉS PAR ANNÉE
+-- ============================================
+-- examens est partitionnée par intervalle sur date_heure et inscriptions
+-- par liste sur annee_academique ; l'année est l'année civile, comme
+-- partout ailleurs (annee_academique = EXTRACT(YEAR FROM CURRENT_DATE)) :
+--   * une partition examens_AAAA / inscriptions_AAAA par année, créées
+--     d'avance par creer_partitions_annuelles() (audit_flusher.py) ;
+--     examens_defaut / inscriptions_defaut recueillent une ligne hors de
+--     toute année créée, déplacée quand la partition de l'année est créée ;
+--   * les années non archivées sont les partitions chaudes (fillfactor 90) ;
+--     archiver_annee() fige une année passée : partitions compactées
+--     (fillfactor 100, CLUSTER), contraintes d'exclusion retirées, lecture
+--     seule assurée par trigger ;
+--   * les requêtes sur le planning portent le prédicat d'année
+--     (date_heure >= debut_annees_actives(), annee_academique >=
+--     premiere_annee_active()) : les partitions archivées sont écartées à
+--     l'exécution, sans changer le résultat (une année archivée n'a plus
+--     d'examen Planifie ou Confirme).
+-- PostgreSQL refuse une contrainte d'exclusion sur une table partitionnée
+-- et une clé étrangère vers examens(id) seul (la clé primaire contient
+-- date_heure) :
+--   * les contraintes d'exclusion sont posées sur chaque partition ; un
+--     chevauchement à cheval sur le 1er janvier reste signalé par
+--     conflits_actifs ;
+--   * les références vers examens sont vérifiées par trigger et supprimées
+--     en cascade par un trigger d'instruction sur examens ; les id restent
+--     uniques car tirés de examens_id_seq.
+-- Sur une base existante : python migrate_partitions.py (cette PARTIE seule).
+
+-- Années archivées, de la plus ancienne à la plus récente, sans trou
+CREATE TABLE IF NOT EXISTS annees_archivees (
+    annee INT PRIMARY KEY,
+    nb_examens BIGINT NOT NULL,
+    nb_inscriptions BIGINT NOT NULL,
+    archivee_par INT,
+    archivee_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bornes basses du planning actif ; STABLE : évaluées une fois par
+-- requête, ce qui permet l'élagage des partitions à l'exécution
+CREATE OR REPLACE FUNCTION premiere_annee_active()
+RETURNS INT AS $$
+    SELECT COALESCE(MAX(annee) + 1, 0) FROM annees_archivees;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION debut_annees_actives()
+RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(make_timestamp(MAX(annee) + 1, 1, 1, 0, 0, 0), '-infinity'::TIMESTAMP)
+    FROM annees_archivees;
+$$ LANGUAGE sql STABLE;
+
+-- Colonnes d'une table hors colonnes générées (INSERT ... SELECT)
+CREATE OR REPLACE FUNCTION colonnes_inserables(p_table TEXT)
+RETURNS TEXT AS $$
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+    FROM pg_attribute
+    WHERE attrelid = p_table::regclass
+      AND attnum > 0
+      AND NOT attisdropped
+      AND attgenerated = '';
+$$ LANGUAGE sql STABLE;
+
+-- Migration : les objets qui dépendent des tables non partitionnées
+-- (vues, triggers, index) sont relevés puis supprimés, les clés étrangères
+-- vers examens retirées, les tables mises de côté ; tout est recréé plus
+-- bas, une fois les données recopiées
+DO $$
+DECLARE
+    v_tables TEXT[];
+    v_table TEXT;
+    v_objet RECORD;
+BEGIN
+    SELECT ARRAY_AGG(t) INTO v_tables
+    FROM UNNEST(ARRAY['examens', 'inscriptions']) t
+    WHERE (SELECT relkind FROM pg_class WHERE oid = to_regclass(t)) = 'r';
+
+    IF v_tables IS NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE TEMP TABLE IF NOT EXISTS partitionnement_a_recreer (
+        ordre SERIAL,
+        ddl TEXT NOT NULL
+    );
+
+    -- Index hors contraintes (reconstruits après la copie, en une passe)
+    INSERT INTO partitionnement_a_recreer (ddl)
+    SELECT pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    WHERE i.indrelid IN (SELECT UNNEST(v_tables)::regclass)
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+    ORDER BY i.indexrelid;
+
+    -- Triggers (recréés après la copie : pas d'audit ni de recalcul pour elle)
+    INSERT INTO partitionnement_a_recreer (ddl)
+    SELECT pg_get_triggerdef(oid)
+    FROM pg_trigger
+    WHERE tgrelid IN (SELECT UNNEST(v_tables)::regclass) AND NOT tgisinternal
+    ORDER BY oid;
+
+    -- Vues et vues matérialisées, directement ou indirectement dépendantes
+    FOR v_objet IN
+        WITH RECURSIVE vues AS (
+            SELECT r.ev_class AS vue, 1 AS niveau
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass
+              AND d.refobjid IN (SELECT UNNEST(v_tables)::regclass)
+              AND r.ev_class <> d.refobjid
+            UNION
+            SELECT r.ev_class, v.niveau + 1
+            FROM vues v
+            JOIN pg_depend d ON d.refobjid = v.vue AND d.classid = 'pg_rewrite'::regclass
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE r.ev_class <> v.vue
+        )
+        SELECT v.vue, c.relkind, MAX(v.niveau) AS niveau
+        FROM vues v
+        JOIN pg_class c ON c.oid = v.vue
+        GROUP BY v.vue, c.relkind
+        ORDER BY MAX(v.niveau), v.vue
+    LOOP
+        INSERT INTO partitionnement_a_recreer (ddl)
+        VALUES (format('CREATE %s %s AS %s',
+                       CASE v_objet.relkind WHEN 'm' THEN 'MATERIALIZED VIEW' ELSE 'VIEW' END,
+                       v_objet.vue::regclass,
+                       rtrim(pg_get_viewdef(v_objet.vue), ';')));
+        INSERT INTO partitionnement_a_recreer (ddl)
+        SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = v_objet.vue ORDER BY indexrelid;
+    END LOOP;
+
+    FOR v_objet IN
+        SELECT c.oid::regclass AS vue, c.relkind
+        FROM partitionnement_a_recreer p
+        JOIN pg_class c ON c.oid = to_regclass(substring(p.ddl FROM '^CREATE (?:MATERIALIZED )?VIEW (\S+) AS'))
+        ORDER BY p.ordre DESC
+    LOOP
+        EXECUTE format('DROP %s IF EXISTS %s',
+                       CASE v_objet.relkind WHEN 'm' THEN 'MATERIALIZED VIEW' ELSE 'VIEW' END, v_objet.vue);
+    END LOOP;
+
+    -- Clés étrangères vers examens : remplacées par les triggers plus bas
+    FOR v_objet IN
+        SELECT conrelid::regclass AS source, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid IN (SELECT UNNEST(v_tables)::regclass)
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', v_objet.source, v_objet.conname);
+    END LOOP;
+
+    FOREACH v_table IN ARRAY v_tables LOOP
+        FOR v_objet IN
+            SELECT indexrelid::regclass AS index FROM pg_index i
+            WHERE i.indrelid = v_table::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        LOOP
+            EXECUTE format('DROP INDEX %s', v_objet.index);
+        END LOOP;
+
+        -- Les noms (examens_pkey, unique_salle_temps...) passent à la nouvelle table
+        FOR v_objet IN
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = v_table::regclass AND contype IN ('p', 'u', 'x')
+        LOOP
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', v_table, v_objet.conname);
+        END LOOP;
+
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', v_table, v_table || '_monolithique');
+        EXECUTE format('ALTER SEQUENCE %I OWNED BY NONE', v_table || '_id_seq');
+    END LOOP;
+END $$;
+
+CREATE SEQUENCE IF NOT EXISTS examens_id_seq;
+CREATE SEQUENCE IF NOT EXISTS inscriptions_id_seq;
+
+-- La clé primaire d'une table partitionnée contient la clé de partition
+CREATE TABLE IF NOT EXISTS inscriptions (
+    id INT NOT NULL DEFAULT nextval('inscriptions_id_seq'),
+    etudiant_id INT NOT NULL,
+    module_id INT NOT NULL,
+    annee_academique INT NOT NULL,
+    session VARCHAR(10) CHECK (session IN ('Principale', 'Rattrapage')),
+    note NUMERIC(4,2) CHECK (note BETWEEN 0 AND 20),
+    statut VARCHAR(20) DEFAULT 'Inscrit' CHECK (statut IN ('Inscrit', 'Valide', 'Echoue', 'Abandonne')),
+    date_inscription TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    date_modification TIMESTAMP,
+    PRIMARY KEY (id, annee_academique),
+    UNIQUE(etudiant_id, module_id, annee_academique, session),
+    CONSTRAINT fk_inscription_etudiant FOREIGN KEY (etudiant_id)
+        REFERENCES etudiants(id) ON DELETE CASCADE,
+    CONSTRAINT fk_inscription_module FOREIGN KEY (module_id)
+        REFERENCES modules(id) ON DELETE CASCADE
+) PARTITION BY LIST (annee_academique);
+
+CREATE TABLE IF NOT EXISTS examens (
+    id INT NOT NULL DEFAULT nextval('examens_id_seq'),
+    uuid UUID DEFAULT uuid_generate_v4(),
+    module_id INT NOT NULL,
+    professeur_id INT NOT NULL,
+    salle_id INT NOT NULL,
+    date_heure TIMESTAMP NOT NULL,
+    duree_minutes INT NOT NULL CHECK (duree_minutes BETWEEN 60 AND 240),
+    creneau TSRANGE GENERATED ALWAYS AS (
+        tsrange(date_heure, date_heure + duree_minutes * INTERVAL '1 minute')
+    ) STORED,
+    type_examen VARCHAR(30) DEFAULT 'Final' CHECK (type_examen IN ('Final', 'Partiel', 'Rattrapage', 'Controle')),
+    statut VARCHAR(20) DEFAULT 'Planifie',
+    max_etudiants INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_by INT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_by INT,
+    notes TEXT,
+    PRIMARY KEY (id, date_heure),
+    CONSTRAINT examens_statut_check CHECK (statut IN ('Planifie', 'Confirme', 'Annule', 'Termine')),
+    CONSTRAINT fk_examen_module FOREIGN KEY (module_id)
+        REFERENCES modules(id) ON DELETE CASCADE,
+    CONSTRAINT fk_examen_professeur FOREIGN KEY (professeur_id)
+        REFERENCES professeurs(id) ON DELETE CASCADE,
+    CONSTRAINT fk_examen_salle FOREIGN KEY (salle_id)
+        REFERENCES lieux_examen(id) ON DELETE CASCADE,
+    CONSTRAINT unique_salle_temps UNIQUE(salle_id, date_heure)
+) PARTITION BY RANGE (date_heure);
+
+ALTER SEQUENCE examens_id_seq OWNED BY examens.id;
+ALTER SEQUENCE inscriptions_id_seq OWNED BY inscriptions.id;
+
+CREATE TABLE IF NOT EXISTS examens_defaut PARTITION OF examens DEFAULT WITH (fillfactor = 90);
+CREATE TABLE IF NOT EXISTS inscriptions_defaut PARTITION OF inscriptions DEFAULT;
+
+-- Contraintes d'exclusion d'une partition de examens ; si des
+-- chevauchements existent déjà, simple index GiST et avertissement, comme
+-- activer_exclusions_examens() en PARTIE 12
+CREATE OR REPLACE FUNCTION ajouter_exclusions_partition(p_partition TEXT)
+RETURNS TEXT AS $$
+DECLARE
+    v_nb INT;
+    v_resultat TEXT := '';
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'excl_' || p_partition || '_salle_creneau') THEN
+        EXECUTE format(
+            'SELECT COUNT(*) FROM %1$I e1 '
+            'JOIN %1$I e2 ON e2.salle_id = e1.salle_id AND e2.creneau && e1.creneau AND e1.id < e2.id '
+            'WHERE e1.statut IN (''Planifie'', ''Confirme'') AND e2.statut IN (''Planifie'', ''Confirme'')',
+            p_partition) INTO v_nb;
+
+        IF v_nb > 0 THEN
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON %I USING gist (salle_id, creneau) '
+                'WHERE statut IN (''Planifie'', ''Confirme'')',
+                'idx_' || p_partition || '_salle_creneau', p_partition);
+            RAISE WARNING '% chevauchement(s) de salle dans % : contrainte d''exclusion non ajoutée', v_nb, p_partition;
+            v_resultat := v_resultat || p_partition || ' salles: ' || v_nb || ' chevauchement(s); ';
+        ELSE
+            EXECUTE format(
+                'ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (salle_id WITH =, creneau WITH &&) '
+                'WHERE (statut IN (''Planifie'', ''Confirme''))',
+                p_partition, 'excl_' || p_partition || '_salle_creneau');
+            EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || p_partition || '_salle_creneau');
+        END IF;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'excl_' || p_partition || '_professeur_creneau') THEN
+        EXECUTE format(
+            'SELECT COUNT(*) FROM %1$I e1 '
+            'JOIN %1$I e2 ON e2.professeur_id = e1.professeur_id AND e2.creneau && e1.creneau AND e1.id < e2.id '
+            'WHERE e1.statut IN (''Planifie'', ''Confirme'') AND e2.statut IN (''Planifie'', ''Confirme'')',
+            p_partition) INTO v_nb;
+
+        IF v_nb > 0 THEN
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON %I USING gist (professeur_id, creneau) '
+                'WHERE statut IN (''Planifie'', ''Confirme'')',
+                'idx_' || p_partition || '_professeur_creneau', p_partition);
+            RAISE WARNING '% chevauchement(s) de professeur dans % : contrainte d''exclusion non ajoutée', v_nb, p_partition;
+            v_resultat := v_resultat || p_partition || ' professeurs: ' || v_nb || ' chevauchement(s); ';
+        ELSE
+            EXECUTE format(
+                'ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (professeur_id WITH =, creneau WITH &&) '
+                'WHERE (statut IN (''Planifie'', ''Confirme''))',
+                p_partition, 'excl_' || p_partition || '_professeur_creneau');
+            EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || p_partition || '_professeur_creneau');
+        END IF;
+    END IF;
+
+    RETURN NULLIF(v_resultat, '');
+END;
+$$ LANGUAGE plpgsql;
+
+-- Même signature qu'en PARTIE 12 : toutes les partitions non archivées
+CREATE OR REPLACE FUNCTION activer_exclusions_examens()
+RETURNS TEXT AS $$
+DECLARE
+    v_partition TEXT;
+    v_resultat TEXT := '';
+BEGIN
+    FOR v_partition IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'examens'::regclass
+          AND c.relname NOT IN (SELECT 'examens_' || annee FROM annees_archivees)
+        ORDER BY c.relname
+    LOOP
+        v_resultat := v_resultat || COALESCE(ajouter_exclusions_partition(v_partition), '');
+    END LOOP;
+
+    RETURN NULLIF(v_resultat, '');
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions annuelles de p_depuis (année courante par défaut) jusqu'à
+-- p_annees_avance années après l'année courante ; retourne le nombre
+-- d'années créées. Comme creer_partitions_audit() (PARTIE 20), chaque
+-- partition est remplie puis attachée.
+CREATE OR REPLACE FUNCTION creer_partitions_annuelles(p_annees_avance INT DEFAULT 1, p_depuis INT DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+    v_annee INT;
+    v_derniere INT := EXTRACT(YEAR FROM CURRENT_DATE)::INT + p_annees_avance;
+    v_nom TEXT;
+    v_nb INT := 0;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('creer_partitions_annuelles')) THEN
+        RETURN 0;
+    END IF;
+
+    FOR v_annee IN COALESCE(p_depuis, EXTRACT(YEAR FROM CURRENT_DATE)::INT) .. v_derniere LOOP
+        v_nom := 'examens_' || v_annee;
+        IF to_regclass(v_nom) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE examens INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED) '
+                           'WITH (fillfactor = 90)', v_nom);
+            EXECUTE format(
+                'WITH deplacees AS (DELETE FROM examens_defaut WHERE date_heure >= %2$L AND date_heure < %3$L RETURNING *) '
+                'INSERT INTO %1$I (%4$s) SELECT %4$s FROM deplacees',
+                v_nom, make_timestamp(v_annee, 1, 1, 0, 0, 0), make_timestamp(v_annee + 1, 1, 1, 0, 0, 0),
+                colonnes_inserables('examens'));
+            EXECUTE format('ALTER TABLE examens ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           v_nom, make_timestamp(v_annee, 1, 1, 0, 0, 0), make_timestamp(v_annee + 1, 1, 1, 0, 0, 0));
+            PERFORM ajouter_exclusions_partition(v_nom);
+            v_nb := v_nb + 1;
+        END IF;
+
+        v_nom := 'inscriptions_' || v_annee;
+        IF to_regclass(v_nom) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE inscriptions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_nom);
+            EXECUTE format(
+                'WITH deplacees AS (DELETE FROM inscriptions_defaut WHERE annee_academique = %2$s RETURNING *) '
+                'INSERT INTO %1$I SELECT * FROM deplacees',
+                v_nom, v_annee);
+            EXECUTE format('ALTER TABLE inscriptions ATTACH PARTITION %I FOR VALUES IN (%s)', v_nom, v_annee);
+        END IF;
+    END LOOP;
+
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Copie des données, puis index, triggers et vues relevés plus haut
+DO $$
+DECLARE
+    v_depuis INT;
+    v_ddl TEXT;
+BEGIN
+    IF to_regclass('examens_monolithique') IS NOT NULL OR to_regclass('inscriptions_monolithique') IS NOT NULL THEN
+        SELECT LEAST(
+            (SELECT MIN(EXTRACT(YEAR FROM date_heure))::INT FROM examens_monolithique),
+            (SELECT MIN(annee_academique) FROM inscriptions_monolithique)
+        ) INTO v_depuis;
+        PERFORM creer_partitions_annuelles(1, v_depuis);
+    END IF;
+
+    IF to_regclass('examens_monolithique') IS NOT NULL THEN
+        EXECUTE format('INSERT INTO examens (%1$s) SELECT %1$s FROM examens_monolithique ORDER BY date_heure, id',
+                       colonnes_inserables('examens'));
+        DROP TABLE examens_monolithique;
+    END IF;
+
+    IF to_regclass('inscriptions_monolithique') IS NOT NULL THEN
+        EXECUTE format('INSERT INTO inscriptions (%1$s) SELECT %1$s FROM inscriptions_monolithique '
+                       'ORDER BY annee_academique, etudiant_id, module_id',
+                       colonnes_inserables('inscriptions'));
+        DROP TABLE inscriptions_monolithique;
+    END IF;
+
+    IF to_regclass('pg_temp.partitionnement_a_recreer') IS NOT NULL THEN
+        FOR v_ddl IN SELECT ddl FROM partitionnement_a_recreer ORDER BY ordre LOOP
+            EXECUTE v_ddl;
+        END LOOP;
+        DROP TABLE partitionnement_a_recreer;
+    END IF;
+END $$;
+
+SELECT creer_partitions_annuelles();
+SELECT '✅ Exclusions par partition' as status, activer_exclusions_examens() as resultat;
+
+-- Références vers examens(id) : vérification à l'écriture. FOR KEY SHARE
+-- bloque, comme une clé étrangère, la suppression concurrente de l'examen.
+CREATE OR REPLACE FUNCTION verifier_reference_examen()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM 1 FROM examens WHERE id = NEW.examen_id FOR KEY SHARE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Examen % inexistant (%.examen_id)', NEW.examen_id, TG_TABLE_NAME
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ... et suppression en cascade, une fois par instruction
+CREATE OR REPLACE FUNCTION supprimer_references_examens()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM demandes_modification_examens WHERE examen_id IN (SELECT id FROM old_rows);
+    DELETE FROM presences_examens WHERE examen_id IN (SELECT id FROM old_rows);
+    DELETE FROM substitutions_remplacement WHERE examen_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['demandes_modification_examens', 'presences_examens', 'substitutions_remplacement'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_reference_examen ON %I', v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_reference_examen BEFORE INSERT OR UPDATE OF examen_id ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION verifier_reference_examen()', v_table);
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_references_examens_del ON examens;
+CREATE TRIGGER trg_references_examens_del
+AFTER DELETE ON examens
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION supprimer_references_examens();
+
+-- Partition archivée : toute écriture est refusée
+CREATE OR REPLACE FUNCTION refuser_modification_archive()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'Année % archivée : % est en lecture seule', TG_ARGV[0], TG_TABLE_NAME
+        USING ERRCODE = 'read_only_sql_transaction',
+              HINT = 'desarchiver_annee(' || TG_ARGV[0] || ') la rouvre';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Fige l'année p_annee : la plus ancienne année non archivée, antérieure à
+-- l'année courante, sans examen Planifie ou Confirme. Les partitions sont
+-- réécrites sans espace libre (CLUSTER sur la clé primaire), leurs
+-- contraintes d'exclusion retirées (plus d'examen actif). migrate_partitions.py
+-- --archiver enchaîne avec VACUUM (FREEZE, ANALYZE), impossible ici.
+CREATE OR REPLACE FUNCTION archiver_annee(p_annee INT, p_user_id INT DEFAULT NULL)
+RETURNS TABLE(partition TEXT, lignes BIGINT) AS $$
+DECLARE
+    v_plus_ancienne INT;
+    v_examens TEXT := 'examens_' || p_annee;
+    v_inscriptions TEXT := 'inscriptions_' || p_annee;
+    v_nb_examens BIGINT;
+    v_nb_inscriptions BIGINT;
+    v_partition TEXT;
+BEGIN
+    IF p_annee >= EXTRACT(YEAR FROM CURRENT_DATE) THEN
+        RAISE EXCEPTION 'L''année % n''est pas terminée', p_annee;
+    END IF;
+    IF EXISTS (SELECT 1 FROM annees_archivees WHERE annee = p_annee) THEN
+        RAISE EXCEPTION 'L''année % est déjà archivée', p_annee;
+    END IF;
+
+    SELECT LEAST(
+        (SELECT EXTRACT(YEAR FROM MIN(date_heure))::INT FROM examens WHERE date_heure >= debut_annees_actives()),
+        (SELECT MIN(annee_academique) FROM inscriptions WHERE annee_academique >= premiere_annee_active())
+    ) INTO v_plus_ancienne;
+    IF v_plus_ancienne < p_annee THEN
+        RAISE EXCEPTION 'Archiver d''abord l''année %', v_plus_ancienne;
+    END IF;
+
+    -- Lignes de l'année encore dans les partitions par défaut
+    PERFORM creer_partitions_annuelles(0, p_annee);
+
+    EXECUTE format('SELECT COUNT(*) FROM %I WHERE statut IN (''Planifie'', ''Confirme'')', v_examens) INTO v_nb_examens;
+    IF v_nb_examens > 0 THEN
+        RAISE EXCEPTION '% examen(s) de % encore Planifie ou Confirme', v_nb_examens, p_annee
+            USING HINT = 'Les terminer ou les annuler avant l''archivage';
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT IF EXISTS %I', v_examens, 'excl_' || v_examens || '_salle_creneau');
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT IF EXISTS %I', v_examens, 'excl_' || v_examens || '_professeur_creneau');
+    EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || v_examens || '_salle_creneau');
+    EXECUTE format('DROP INDEX IF EXISTS %I', 'idx_' || v_examens || '_professeur_creneau');
+
+    FOREACH v_partition IN ARRAY ARRAY[v_examens, v_inscriptions] LOOP
+        EXECUTE format('ALTER TABLE %I SET (fillfactor = 100)', v_partition);
+        EXECUTE format('CLUSTER %I USING %I', v_partition,
+                       (SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                        WHERE i.indrelid = v_partition::regclass AND i.indisprimary));
+        EXECUTE format('ANALYZE %I', v_partition);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_lecture_seule ON %I', v_partition);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_lecture_seule_truncate ON %I', v_partition);
+        EXECUTE format(
+            'CREATE TRIGGER trg_lecture_seule BEFORE INSERT OR UPDATE OR DELETE ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION refuser_modification_archive(%L)', v_partition, p_annee);
+        EXECUTE format(
+            'CREATE TRIGGER trg_lecture_seule_truncate BEFORE TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION refuser_modification_archive(%L)', v_partition, p_annee);
+    END LOOP;
+
+    EXECUTE format('SELECT COUNT(*) FROM %I', v_examens) INTO v_nb_examens;
+    EXECUTE format('SELECT COUNT(*) FROM %I', v_inscriptions) INTO v_nb_inscriptions;
+
+    INSERT INTO annees_archivees (annee, nb_examens, nb_inscriptions, archivee_par)
+    VALUES (p_annee, v_nb_examens, v_nb_inscriptions, p_user_id);
+
+    INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by, ip_address)
+    VALUES ('annees_archivees', p_annee, 'INSERT',
+            jsonb_build_object('annee', p_annee, 'nb_examens', v_nb_examens, 'nb_inscriptions', v_nb_inscriptions),
+            p_user_id, inet_client_addr()::VARCHAR);
+
+    RETURN QUERY VALUES (v_examens, v_nb_examens), (v_inscriptions, v_nb_inscriptions);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rouvre la dernière année archivée (correction d'un historique)
+CREATE OR REPLACE FUNCTION desarchiver_annee(p_annee INT, p_user_id INT DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    v_partition TEXT;
+BEGIN
+    IF p_annee IS DISTINCT FROM (SELECT MAX(annee) FROM annees_archivees) THEN
+        RAISE EXCEPTION 'Seule la dernière année archivée peut être rouverte';
+    END IF;
+
+    FOREACH v_partition IN ARRAY ARRAY['examens_' || p_annee, 'inscriptions_' || p_annee] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_lecture_seule ON %I', v_partition);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_lecture_seule_truncate ON %I', v_partition);
+    END LOOP;
+    EXECUTE format('ALTER TABLE %I SET (fillfactor = 90)', 'examens_' || p_annee);
+
+    DELETE FROM annees_archivees WHERE annee = p_annee;
+    PERFORM ajouter_exclusions_partition('examens_' || p_annee);
+
+    INSERT INTO audit_log (table_name, record_id, action, old_values, changed_by, ip_address)
+    VALUES ('annees_archivees', p_annee, 'DELETE', jsonb_build_object('annee', p_annee),
+            p_user_id, inet_client_addr()::VARCHAR);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recalcul des conflits (PARTIE 10) : prédicat d'année sur examens et
+-- inscriptions, les partitions archivées ne sont plus lues
+CREATE OR REPLACE FUNCTION rafraichir_conflits_etudiants(p_etudiants INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'etudiant'
+      AND (p_etudiants IS NULL OR entite_id = ANY(p_etudiants))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Étudiant >1 examen/jour',
+        'etudiant',
+        i.etudiant_id,
+        DATE(e.date_heure),
+        ARRAY_AGG(DISTINCT e.id),
+        COUNT(DISTINCT e.id),
+        'Étudiant ID: ' || i.etudiant_id || ' a ' || COUNT(DISTINCT e.id) || ' examens le ' || DATE(e.date_heure),
+        'CRITIQUE'
+    FROM inscriptions i
+    JOIN examens e ON i.module_id = e.module_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND e.date_heure >= debut_annees_actives()
+      AND i.annee_academique >= premiere_annee_active()
+      AND (p_etudiants IS NULL OR i.etudiant_id = ANY(p_etudiants))
+      AND (p_jours IS NULL OR DATE(e.date_heure) = ANY(p_jours))
+    GROUP BY i.etudiant_id, DATE(e.date_heure)
+    HAVING COUNT(DISTINCT e.id) > 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rafraichir_conflits_professeurs(p_professeurs INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'professeur'
+      AND (p_professeurs IS NULL OR entite_id = ANY(p_professeurs))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Professeur >3 examens/jour',
+        'professeur',
+        e.professeur_id,
+        DATE(e.date_heure),
+        ARRAY_AGG(e.id ORDER BY e.date_heure),
+        COUNT(*),
+        'Professeur ID: ' || e.professeur_id || ' a ' || COUNT(*) || ' examens le ' || DATE(e.date_heure),
+        'CRITIQUE'
+    FROM examens e
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND e.date_heure >= debut_annees_actives()
+      AND (p_professeurs IS NULL OR e.professeur_id = ANY(p_professeurs))
+      AND (p_jours IS NULL OR DATE(e.date_heure) = ANY(p_jours))
+    GROUP BY e.professeur_id, DATE(e.date_heure)
+    HAVING COUNT(*) > 3;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rafraichir_conflits_salles(p_salles INT[], p_jours DATE[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'salle'
+      AND (p_salles IS NULL OR entite_id = ANY(p_salles))
+      AND (p_jours IS NULL OR jour = ANY(p_jours));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Chevauchement salle',
+        'salle',
+        e1.salle_id,
+        LEAST(DATE(e1.date_heure), DATE(e2.date_heure)),
+        ARRAY[e1.id, e2.id],
+        2,
+        'Salle ID: ' || e1.salle_id || ' - Examens ' || e1.id || ' et ' || e2.id || ' se chevauchent',
+        'ÉLEVÉ'
+    FROM examens e1
+    JOIN examens e2 ON e2.salle_id = e1.salle_id
+                   AND e2.creneau && e1.creneau
+                   AND e2.date_heure > e1.date_heure - INTERVAL '240 minutes'
+    WHERE e1.id < e2.id
+      AND e1.statut IN ('Planifie', 'Confirme')
+      AND e2.statut IN ('Planifie', 'Confirme')
+      AND e1.date_heure >= debut_annees_actives()
+      AND e2.date_heure >= debut_annees_actives()
+      AND (p_salles IS NULL OR e1.salle_id = ANY(p_salles))
+      AND (p_jours IS NULL OR LEAST(DATE(e1.date_heure), DATE(e2.date_heure)) = ANY(p_jours));
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rafraichir_conflits_capacite(p_examens INT[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM conflits_actifs
+    WHERE entite = 'examen'
+      AND (p_examens IS NULL OR entite_id IN (SELECT UNNEST(p_examens)));
+
+    INSERT INTO conflits_actifs (type_conflit, entite, entite_id, jour, examens_ids, nb, details, severite)
+    SELECT
+        'Dépassement capacité',
+        'examen',
+        e.id,
+        DATE(e.date_heure),
+        ARRAY[e.id],
+        COUNT(i.etudiant_id),
+        'Examen ID: ' || e.id || ' - ' || COUNT(i.etudiant_id) || ' étudiants pour ' || l.capacite || ' places',
+        'MOYEN'
+    FROM examens e
+    JOIN lieux_examen l ON e.salle_id = l.id
+    JOIN inscriptions i ON e.module_id = i.module_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND e.date_heure >= debut_annees_actives()
+      AND i.statut = 'Inscrit'
+      AND i.annee_academique >= premiere_annee_active()
+      AND (p_examens IS NULL OR e.id IN (SELECT UNNEST(p_examens)))
+    GROUP BY e.id, e.date_heure, l.capacite
+    HAVING COUNT(i.etudiant_id) > l.capacite;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Périmètre d'un chef de département (PARTIE 17), années actives seulement
+CREATE OR REPLACE FUNCTION detecter_conflits_filtre(
+    p_departement_id INT DEFAULT NULL,
+    p_formation_id INT DEFAULT NULL,
+    p_date_debut DATE DEFAULT NULL,
+    p_date_fin DATE DEFAULT NULL
+)
+RETURNS TABLE(
+    type_conflit VARCHAR(50),
+    severite VARCHAR(20),
+    entite VARCHAR(20),
+    entite_id INT,
+    jour DATE,
+    examens_ids INT[],
+    nb INT
+) AS $$
+DECLARE
+    v_examens INT[];
+BEGIN
+    IF p_departement_id IS NULL AND p_formation_id IS NULL THEN
+        RETURN QUERY
+        SELECT ca.type_conflit, ca.severite, ca.entite, ca.entite_id, ca.jour, ca.examens_ids, ca.nb
+        FROM conflits_actifs ca
+        WHERE (p_date_debut IS NULL OR ca.jour >= p_date_debut)
+          AND (p_date_fin IS NULL OR ca.jour <= p_date_fin)
+        ORDER BY CASE ca.severite WHEN 'CRITIQUE' THEN 1 WHEN 'ÉLEVÉ' THEN 2 WHEN 'MOYEN' THEN 3 ELSE 4 END,
+                 ca.jour, ca.entite, ca.entite_id;
+        RETURN;
+    END IF;
+
+    SELECT ARRAY_AGG(e.id) INTO v_examens
+    FROM examens e
+    JOIN modules m ON m.id = e.module_id
+    JOIN formations f ON f.id = m.formation_id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND e.date_heure >= GREATEST(p_date_debut, debut_annees_actives())
+      AND (p_departement_id IS NULL OR f.departement_id = p_departement_id)
+      AND (p_formation_id IS NULL OR m.formation_id = p_formation_id)
+      AND (p_date_fin IS NULL OR e.date_heure < p_date_fin + 1);
+
+    IF v_examens IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT ca.type_conflit, ca.severite, ca.entite, ca.entite_id, ca.jour, ca.examens_ids, ca.nb
+    FROM conflits_actifs ca
+    WHERE ca.examens_ids && v_examens
+      AND (p_date_debut IS NULL OR ca.jour >= p_date_debut)
+      AND (p_date_fin IS NULL OR ca.jour <= p_date_fin)
+    ORDER BY CASE ca.severite WHEN 'CRITIQUE' THEN 1 WHEN 'ÉLEVÉ' THEN 2 WHEN 'MOYEN' THEN 3 ELSE 4 END,
+             ca.jour, ca.entite, ca.entite_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Emploi du temps étudiant (PARTIE 14), années actives seulement
+CREATE OR REPLACE FUNCTION rafraichir_student_timetable(p_examens INT[], p_etudiants INT[])
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM student_timetable st
+    WHERE (p_examens IS NULL OR st.examen_id IN (SELECT UNNEST(p_examens)))
+      AND (p_etudiants IS NULL OR st.etudiant_id IN (SELECT UNNEST(p_etudiants)));
+
+    INSERT INTO student_timetable (
+        etudiant_id, date_heure, examen_id, module_id, module_code, module_nom,
+        formation_nom, departement_nom, professeur_nom, salle_nom, salle_type,
+        batiment, capacite, duree_minutes, date_fin, type_examen, statut
+    )
+    -- Une ligne par étudiant et examen, même inscrit à plusieurs sessions
+    -- ou années du module (inscriptions n'est unique que par session)
+    SELECT DISTINCT ON (i.etudiant_id, e.id)
+        i.etudiant_id,
+        e.date_heure,
+        e.id,
+        e.module_id,
+        m.code,
+        m.nom,
+        f.nom,
+        d.nom,
+        CONCAT(p.nom, ' ', p.prenom),
+        l.nom,
+        l.type,
+        l.batiment,
+        l.capacite,
+        e.duree_minutes,
+        e.date_heure + e.duree_minutes * INTERVAL '1 minute',
+        e.type_examen,
+        e.statut
+    FROM examens e
+    JOIN inscriptions i ON i.module_id = e.module_id AND i.statut = 'Inscrit'
+                       AND i.annee_academique >= premiere_annee_active()
+    JOIN modules m ON e.module_id = m.id
+    JOIN formations f ON m.formation_id = f.id
+    JOIN departements d ON f.departement_id = d.id
+    JOIN professeurs p ON e.professeur_id = p.id
+    JOIN lieux_examen l ON e.salle_id = l.id
+    WHERE e.statut IN ('Planifie', 'Confirme')
+      AND e.date_heure >= debut_annees_actives()
+      AND (p_examens IS NULL OR e.id IN (SELECT UNNEST(p_examens)))
+      AND (p_etudiants IS NULL OR i.etudiant_id IN (SELECT UNNEST(p_etudiants)));
+END;
+$$ LANGUAGE plpgsql;
+
+-- Vue du planning : inscriptions des années actives ; le prédicat
+-- d'année des requêtes sur date_heure descend dans la vue
+CREATE OR REPLACE VIEW v_planning_examens AS
+SELECT
+    e.id,
+    e.uuid,
+    m.code as module_code,
+    m.nom as module_nom,
+    f.nom as formation_nom,
+    d.nom as departement_nom,
+    p.nom || ' ' || p.prenom as professeur_nom,
+    l.nom as salle_nom,
+    l.type as salle_type,
+    l.capacite,
+    e.date_heure,
+    e.duree_minutes,
+    e.type_examen,
+    e.statut,
+    COUNT(DISTINCT i.etudiant_id) as etudiants_inscrits
+FROM examens e
+JOIN modules m ON e.module_id = m.id
+JOIN formations f ON m.formation_id = f.id
+JOIN departements d ON f.departement_id = d.id
+JOIN professeurs p ON e.professeur_id = p.id
+JOIN lieux_examen l ON e.salle_id = l.id
+LEFT JOIN inscriptions i ON e.module_id = i.module_id
+    AND i.statut = 'Inscrit'
+    AND i.annee_academique >= premiere_annee_active()
+GROUP BY e.id, e.uuid, m.code, m.nom, f.nom, d.nom, p.nom, p.prenom,
+         l.nom, l.type, l.capacite, e.date_heure, e.duree_minutes,
+         e.type_examen, e.statut;
+
+ANALYZE examens;
+ANALYZE inscriptions;
+
+-- ============================================
+-- PARTIE 22: NOTIFICATIONS : DISTRIBUTION ET COMPTEURS NON LUS
+-- ============================================
+-- notifications garde le message, une seule fois ; la remise à chaque
+-- destinataire et son état de lecture passent dans notifications_destinataires :
+--   * user_id renseigné : notification personnelle (user_role, user_id),
+--     user_id étant l'identifiant lié (users.linked_id) comme jusqu'ici ;
+--   * user_id NULL : diffusion à tout le rôle, remise aux comptes actifs
+--     du rôle par un seul INSERT ... SELECT (trigger d'instruction), puis
+--     aux comptes créés ensuite tant que le message n'a pas expiré ;
+--   * notifications_non_lues tient le nombre de non lues par destinataire,
+--     maintenu par les triggers de notifications_destinataires : le badge
+--     lit une ligne au lieu de compter.
+-- Les notifications expirées sont supprimées par purger_notifications_expirees()
+-- (audit_flusher.py, à chaque entretien) ; les compteurs suivent. D'ici là,
+-- le badge retranche du compteur les non lues expirées, que la liste masque.
+
+CREATE TABLE IF NOT EXISTS notifications_destinataires (
+    notification_id INT NOT NULL REFERENCES notifications(id) ON DELETE CASCADE,
+    user_role VARCHAR(30) NOT NULL,
+    user_id INT NOT NULL,
+    is_lu BOOLEAN NOT NULL DEFAULT FALSE,
+    lu_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_role, user_id, notification_id)
+);
+
+-- Liste d'un destinataire, non lues d'abord puis par date
+CREATE INDEX IF NOT EXISTS idx_notif_dest_utilisateur
+ON notifications_destinataires(user_id, user_role, is_lu, created_at DESC);
+
+-- Suppression en cascade depuis notifications
+CREATE INDEX IF NOT EXISTS idx_notif_dest_notification
+ON notifications_destinataires(notification_id);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_expires
+ON notifications(expires_at) WHERE expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS notifications_non_lues (
+    user_role VARCHAR(30) NOT NULL,
+    user_id INT NOT NULL,
+    nb INT NOT NULL DEFAULT 0 CHECK (nb >= 0),
+    PRIMARY KEY (user_role, user_id)
+);
+
+-- Compteurs : un écart par destinataire touché par l'instruction
+CREATE OR REPLACE FUNCTION maj_notifications_non_lues()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notifications_non_lues (user_role, user_id, nb)
+        SELECT user_role, user_id, COUNT(*)
+        FROM new_rows
+        WHERE NOT is_lu
+        GROUP BY user_role, user_id
+        ON CONFLICT (user_role, user_id)
+        DO UPDATE SET nb = notifications_non_lues.nb + EXCLUDED.nb;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE notifications_non_lues c
+        SET nb = GREATEST(c.nb - d.nb, 0)
+        FROM (
+            SELECT user_role, user_id, COUNT(*) AS nb
+            FROM old_rows
+            WHERE NOT is_lu
+            GROUP BY user_role, user_id
+        ) d
+        WHERE c.user_role = d.user_role AND c.user_id = d.user_id;
+    ELSE
+        UPDATE notifications_non_lues c
+        SET nb = GREATEST(c.nb + d.ecart, 0)
+        FROM (
+            SELECT n.user_role, n.user_id,
+                   SUM(CASE WHEN n.is_lu THEN -1 ELSE 1 END) AS ecart
+            FROM old_rows o
+            JOIN new_rows n USING (user_role, user_id, notification_id)
+            WHERE o.is_lu IS DISTINCT FROM n.is_lu
+            GROUP BY n.user_role, n.user_id
+        ) d
+        WHERE c.user_role = d.user_role AND c.user_id = d.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notif_non_lues_ins ON notifications_destinataires;
+CREATE TRIGGER trg_notif_non_lues_ins
+AFTER INSERT ON notifications_destinataires
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maj_notifications_non_lues();
+
+DROP TRIGGER IF EXISTS trg_notif_non_lues_upd ON notifications_destinataires;
+CREATE TRIGGER trg_notif_non_lues_upd
+AFTER UPDATE ON notifications_destinataires
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maj_notifications_non_lues();
+
+DROP TRIGGER IF EXISTS trg_notif_non_lues_del ON notifications_destinataires;
+CREATE TRIGGER trg_notif_non_lues_del
+AFTER DELETE ON notifications_destinataires
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION maj_notifications_non_lues();
+
+-- Remise des notifications insérées : personnelles et diffusions par rôle
+-- en un seul INSERT ... SELECT, quel que soit le nombre de destinataires
+CREATE OR REPLACE FUNCTION distribuer_notifications()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO notifications_destinataires (notification_id, user_role, user_id, is_lu, created_at)
+    SELECT n.id, n.user_role, n.user_id, COALESCE(n.is_lu, FALSE), n.created_at
+    FROM new_rows n
+    WHERE n.user_id IS NOT NULL
+    UNION ALL
+    SELECT n.id, u.role, u.linked_id, FALSE, n.created_at
+    FROM new_rows n
+    JOIN users u ON u.role = n.user_role AND u.is_active
+    WHERE n.user_id IS NULL
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_distribuer_notifications ON notifications;
+CREATE TRIGGER trg_distribuer_notifications
+AFTER INSERT ON notifications
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION distribuer_notifications();
+
+-- Un compte créé reçoit les diffusions de son rôle encore valables
+CREATE OR REPLACE FUNCTION distribuer_notifications_nouveaux_comptes()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO notifications_destinataires (notification_id, user_role, user_id, created_at)
+    SELECT n.id, u.role, u.linked_id, n.created_at
+    FROM new_rows u
+    JOIN notifications n ON n.user_role = u.role AND n.user_id IS NULL
+    WHERE u.is_active
+      AND (n.expires_at IS NULL OR n.expires_at > CURRENT_TIMESTAMP)
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notifications_nouveaux_comptes ON users;
+CREATE TRIGGER trg_notifications_nouveaux_comptes
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION distribuer_notifications_nouveaux_comptes();
+
+-- Diffusion à tout un rôle ; retourne l'id de la notification
+CREATE OR REPLACE FUNCTION notifier_role(
+    p_role VARCHAR,
+    p_type VARCHAR,
+    p_titre VARCHAR,
+    p_contenu TEXT,
+    p_priority INT DEFAULT 1,
+    p_expires_at TIMESTAMP DEFAULT NULL
+)
+RETURNS INT AS $$
+    INSERT INTO notifications (user_id, user_role, type_notification, titre, contenu, priority, expires_at)
+    VALUES (NULL, p_role, p_type, p_titre, p_contenu, p_priority, p_expires_at)
+    RETURNING id;
+$$ LANGUAGE sql;
+
+-- Suppression des notifications expirées (remises comprises, en cascade)
+CREATE OR REPLACE FUNCTION purger_notifications_expirees()
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    DELETE FROM notifications WHERE expires_at <= CURRENT_TIMESTAMP;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Compteurs recalculés depuis les remises (initialisation, contrôle)
+CREATE OR REPLACE FUNCTION reconstruire_notifications_non_lues()
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    LOCK TABLE notifications_destinataires IN SHARE MODE;
+    DELETE FROM notifications_non_lues;
+    INSERT INTO notifications_non_lues (user_role, user_id, nb)
+    SELECT user_role, user_id, COUNT(*) FILTER (WHERE NOT is_lu)
+    FROM notifications_destinataires
+    GROUP BY user_role, user_id;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reprise des notifications existantes (une seule fois : remises vides)
+INSERT INTO notifications_destinataires (notification_id, user_role, user_id, is_lu, created_at)
+SELECT n.id, n.user_role, n.user_id, COALESCE(n.is_lu, FALSE), COALESCE(n.created_at, CURRENT_TIMESTAMP)
+FROM notifications n
+WHERE n.user_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM notifications_destinataires)
+UNION ALL
+SELECT n.id, u.role, u.linked_id, FALSE, COALESCE(n.created_at, CURRENT_TIMESTAMP)
+FROM notifications n
+JOIN users u ON u.role = n.user_role AND u.is_active
+WHERE n.user_id IS NULL
+  AND NOT EXISTS (SELECT 1 FROM notifications_destinataires)
+ON CONFLICT DO NOTHING;
+
+SELECT '✅ Compteurs de notifications initialisés' as status, reconstruire_notifications_non_lues() as destinataires;
+
+-- ============================================
+-- PARTIE 23: FLUX DES CHANGEMENTS (TABLEAUX DE BORD EN DIRECT)
+-- ============================================
+-- Les tableaux de bord ouverts sont tenus à jour sans rechargement complet :
+-- les triggers ci-dessous publient sur le canal 'flux_changements', au
+-- COMMIT, les lignes modifiées d'examens, demandes_modification_examens et
+-- notifications avec leurs clés de diffusion :
+--   m:<module>, p:<professeur>, d:<département> (examens, demandes),
+--   e:<étudiant> (demandes), u:<rôle>:<id> ou r:<rôle> (notifications).
+-- Message : {"t": table, "r": [{"id": .., "k": [clés]}, ...]}, 50 lignes
+-- au plus (limite de 8000 octets de pg_notify) ; au-delà de 1000 lignes
+-- (génération d'un planning...), un seul {"t": table, "complet": true}.
+-- change_feed.py remet chaque message aux sessions abonnées à l'une des
+-- clés, qui ne relisent que ces lignes.
+
+CREATE OR REPLACE FUNCTION publier_changements(p_table TEXT, p_lignes JSONB)
+RETURNS VOID AS $$
+DECLARE
+    v_nb INT := COALESCE(jsonb_array_length(p_lignes), 0);
+    v_debut INT := 0;
+BEGIN
+    IF v_nb > 1000 THEN
+        PERFORM pg_notify('flux_changements', jsonb_build_object('t', p_table, 'complet', TRUE)::TEXT);
+        RETURN;
+    END IF;
+    WHILE v_debut < v_nb LOOP
+        PERFORM pg_notify('flux_changements', jsonb_build_object(
+            't', p_table,
+            'r', (SELECT jsonb_agg(l.value ORDER BY l.n)
+                  FROM jsonb_array_elements(p_lignes) WITH ORDINALITY l(value, n)
+                  WHERE l.n > v_debut AND l.n <= v_debut + 50)
+        )::TEXT);
+        v_debut := v_debut + 50;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Examens : clés de l'ancienne et de la nouvelle version (un examen
+-- réattribué disparaît chez l'ancien professeur)
+CREATE OR REPLACE FUNCTION flux_examens()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_lignes JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('id', id, 'm', module_id, 'p', professeur_id))
+        INTO v_lignes FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(jsonb_build_object('id', id, 'm', module_id, 'p', professeur_id))
+        INTO v_lignes FROM old_rows;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_object('id', v.id, 'm', v.module_id, 'p', v.professeur_id))
+        INTO v_lignes
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        CROSS JOIN LATERAL (VALUES (n.id, n.module_id, n.professeur_id),
+                                   (o.id, o.module_id, o.professeur_id)) v(id, module_id, professeur_id)
+        WHERE o IS DISTINCT FROM n;
+    END IF;
+
+    IF v_lignes IS NULL THEN
+        RETURN NULL;
+    ELSIF jsonb_array_length(v_lignes) > 1000 THEN
+        -- Message "complet", sans calcul des clés
+        PERFORM publier_changements('examens', v_lignes);
+        RETURN NULL;
+    END IF;
+
+    SELECT jsonb_agg(jsonb_build_object('id', c.id, 'k', c.cles))
+    INTO v_lignes
+    FROM (
+        SELECT r.id, jsonb_agg(DISTINCT k.cle) AS cles
+        FROM jsonb_to_recordset(v_lignes) AS r(id INT, m INT, p INT)
+        JOIN modules mo ON mo.id = r.m
+        JOIN formations f ON f.id = mo.formation_id
+        CROSS JOIN LATERAL (VALUES ('m:' || r.m), ('p:' || r.p), ('d:' || f.departement_id)) k(cle)
+        GROUP BY r.id
+    ) c;
+
+    PERFORM publier_changements('examens', v_lignes);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flux_examens_ins ON examens;
+CREATE TRIGGER trg_flux_examens_ins
+AFTER INSERT ON examens
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_examens();
+
+DROP TRIGGER IF EXISTS trg_flux_examens_upd ON examens;
+CREATE TRIGGER trg_flux_examens_upd
+AFTER UPDATE ON examens
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_examens();
+
+DROP TRIGGER IF EXISTS trg_flux_examens_del ON examens;
+CREATE TRIGGER trg_flux_examens_del
+AFTER DELETE ON examens
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_examens();
+
+-- Demandes : l'étudiant, le professeur et le département de l'examen
+CREATE OR REPLACE FUNCTION flux_demandes()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_lignes JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('id', id, 'e', etudiant_id, 'x', examen_id))
+        INTO v_lignes FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg(jsonb_build_object('id', id, 'e', etudiant_id, 'x', examen_id))
+        INTO v_lignes FROM old_rows;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_object('id', n.id, 'e', n.etudiant_id, 'x', n.examen_id))
+        INTO v_lignes
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        WHERE o IS DISTINCT FROM n;
+    END IF;
+
+    IF v_lignes IS NULL THEN
+        RETURN NULL;
+    ELSIF jsonb_array_length(v_lignes) > 1000 THEN
+        PERFORM publier_changements('demandes_modification_examens', v_lignes);
+        RETURN NULL;
+    END IF;
+
+    SELECT jsonb_agg(jsonb_build_object('id', c.id, 'k', c.cles))
+    INTO v_lignes
+    FROM (
+        SELECT r.id, jsonb_agg(DISTINCT k.cle) FILTER (WHERE k.cle IS NOT NULL) AS cles
+        FROM jsonb_to_recordset(v_lignes) AS r(id INT, e INT, x INT)
+        LEFT JOIN examens ex ON ex.id = r.x
+        LEFT JOIN modules mo ON mo.id = ex.module_id
+        LEFT JOIN formations f ON f.id = mo.formation_id
+        CROSS JOIN LATERAL (VALUES ('e:' || r.e), ('p:' || ex.professeur_id), ('d:' || f.departement_id)) k(cle)
+        GROUP BY r.id
+    ) c;
+
+    PERFORM publier_changements('demandes_modification_examens', v_lignes);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flux_demandes_ins ON demandes_modification_examens;
+CREATE TRIGGER trg_flux_demandes_ins
+AFTER INSERT ON demandes_modification_examens
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_demandes();
+
+DROP TRIGGER IF EXISTS trg_flux_demandes_upd ON demandes_modification_examens;
+CREATE TRIGGER trg_flux_demandes_upd
+AFTER UPDATE ON demandes_modification_examens
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_demandes();
+
+DROP TRIGGER IF EXISTS trg_flux_demandes_del ON demandes_modification_examens;
+CREATE TRIGGER trg_flux_demandes_del
+AFTER DELETE ON demandes_modification_examens
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_demandes();
+
+-- Notifications : une diffusion à tout un rôle est une seule clé r:<rôle>,
+-- quel que soit le nombre de destinataires (PARTIE 22)
+CREATE OR REPLACE FUNCTION flux_notifications()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM publier_changements('notifications', (
+        SELECT jsonb_agg(jsonb_build_object(
+            'id', id,
+            'k', jsonb_build_array(CASE WHEN user_id IS NULL THEN 'r:' || user_role
+                                        ELSE 'u:' || user_role || ':' || user_id END)
+        ))
+        FROM new_rows
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flux_notifications_ins ON notifications;
+CREATE TRIGGER trg_flux_notifications_ins
+AFTER INSERT ON notifications
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION flux_notifications();
@@ -0,0 +1,110 @@
+"""
+bench_conflicts.py - conflict_analysis (NumPy) contre les fonctions SQL de détection
+Sur la base de st.secrets["postgres"] :
+    python bench_conflicts.py                     # base courante, 5 répétitions
+    python bench_conflicts.py --repeat 10
+Sans base de données, passage à l'échelle de l'analyse en mémoire :
+    python bench_conflicts.py --synthetique 10000 50000 200000
+
+"SQL stock" lit conflits_actifs (detecter_conflits()), "SQL complet"
+recalcule tout (reconstruire_conflits_actifs(), annulé par ROLLBACK) ;
+"NumPy" sépare le chargement (une fois) de l'analyse, seule à refaire pour
+valider un planning candidat.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from conflict_analysis import ConflictAnalyzer
+from connection import get_conn, load_dataframe
+
+MINUTES_PAR_JOUR = 1440
+
+
+def best_of(repeat, func):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def sql_rebuild():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reconstruire_conflits_actifs()")
+            total = cur.fetchone()[0]
+        conn.rollback()
+    return total
+
+
+def signature(df):
+    return {(r.entite, int(r.entite_id), r.jour, tuple(sorted(r.examens_ids)), int(r.nb)) for r in df.itertuples()}
+
+
+def bench_db(repeat):
+    t_stock, stock = best_of(repeat, lambda: load_dataframe("SELECT * FROM detecter_conflits()"))
+    t_rebuild, _ = best_of(repeat, sql_rebuild)
+    t_load, analyzer = best_of(repeat, ConflictAnalyzer.from_db)
+    t_rows, conflicts = best_of(repeat, analyzer.conflicts)
+    t_counts, counts = best_of(repeat, analyzer.counts)
+
+    print(f"{len(analyzer.exam_ids)} examens actifs, {len(analyzer.enrol_students)} inscriptions, "
+          f"{len(conflicts)} conflits {counts}")
+    print(f"{'méthode':>28} {'temps (ms)':>11}")
+    print(f"{'SQL stock (lecture)':>28} {t_stock * 1000:>11.1f}")
+    print(f"{'SQL complet':>28} {t_rebuild * 1000:>11.1f}")
+    print(f"{'NumPy chargement':>28} {t_load * 1000:>11.1f}")
+    print(f"{'NumPy analyse (lignes)':>28} {t_rows * 1000:>11.1f}")
+    print(f"{'NumPy analyse (comptes)':>28} {t_counts * 1000:>11.1f}")
+
+    reference = load_dataframe("SELECT entite, entite_id, jour, examens_ids, nb FROM conflits_actifs")
+    same = signature(reference) == signature(conflicts) if not reference.empty else conflicts.empty
+    print(f"Résultats identiques à conflits_actifs : {'oui' if same else 'NON'} ({len(stock)} lignes en base)")
+
+
+def synthetic(n_exams, seed=42):
+    """Session de 6 semaines, 5 étudiants par examen, 6 modules par étudiant"""
+    rng = np.random.default_rng(seed)
+    n_students = 5 * n_exams
+    n_rooms = max(1, n_exams // 20)
+    slots = rng.integers(0, 42 * 4, n_exams)
+    starts = 29_000_000 + slots // 4 * MINUTES_PAR_JOUR + (8 * 60 + slots % 4 * 150)
+    enrol_students = np.repeat(np.arange(1, n_students + 1), 6)
+    return ConflictAnalyzer(
+        np.arange(1, n_exams + 1), np.arange(1, n_exams + 1),
+        rng.integers(1, n_rooms + 1, n_exams), rng.integers(1, n_exams // 4 + 2, n_exams),
+        starts, rng.choice([90, 120, 180], n_exams),
+        enrol_students, rng.integers(1, n_exams + 1, len(enrol_students)),
+        np.ones(len(enrol_students), dtype=bool), rng.integers(20, 400, n_rooms + 1),
+    )
+
+
+def bench_synthetic(sizes, repeat):
+    print(f"{'examens':>8} {'inscriptions':>13} {'comptes (ms)':>13} {'lignes (ms)':>12} {'conflits':>9}")
+    for n in sizes:
+        analyzer = synthetic(n)
+        t_counts, counts = best_of(repeat, analyzer.counts)
+        t_rows, _ = best_of(repeat, analyzer.conflicts)
+        print(f"{n:>8} {len(analyzer.enrol_students):>13} {t_counts * 1000:>13.1f} {t_rows * 1000:>12.1f} "
+              f"{sum(counts.values()):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetique", nargs="*", type=int, metavar="EXAMENS",
+                        help="sans base : tailles de session générées (défaut 1 000 -> 100 000)")
+    args = parser.parse_args()
+
+    if args.synthetique is not None:
+        bench_synthetic(args.synthetique or [1000, 10000, 100000], args.repeat)
+    else:
+        bench_db(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
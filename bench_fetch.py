@@ -0,0 +1,69 @@
+"""
+bench_fetch.py - load_dataframe (RealDictCursor) contre load_columns (colonnaire)
+Base de st.secrets["postgres"], données générées par generate_series (aucune table lue) :
+    python bench_fetch.py                  # 10 000 -> 500 000 lignes
+    python bench_fetch.py 1000000          # tailles au choix
+    python bench_fetch.py --repeat 5
+
+"Pic Python" est le maximum alloué pendant le chargement (tracemalloc,
+mesuré sur une exécution à part) ; "DataFrame" la taille du résultat.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from connection import load_columns, load_dataframe
+
+QUERY = """
+    SELECT
+        g AS id,
+        (g %% 500)::INT AS salle_id,
+        TIMESTAMP '2025-01-06 08:00' + (g %% 10000) * INTERVAL '30 minutes' AS date_heure,
+        (60 + g %% 4 * 30)::INT AS duree_minutes,
+        ROUND((g %% 1000) / 7.0, 2) AS taux_occupation,
+        (ARRAY['Planifie', 'Confirme', 'Annule', 'Termine'])[1 + g %% 4] AS statut,
+        'Salle ' || (g %% 500) AS salle_nom
+    FROM generate_series(1, %s) g
+"""
+
+LOADERS = {
+    "dictionnaires": lambda n: load_dataframe(QUERY, (n,)),
+    "colonnes": lambda n: load_columns(QUERY, (n,), categorical=("statut",)),
+}
+
+
+def measure(loader, n, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        df = loader(n)
+        best = min(best, time.perf_counter() - t0)
+        del df
+
+    gc.collect()
+    tracemalloc.start()
+    df = loader(n)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, df.memory_usage(deep=True).sum(), df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=[10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'lignes':>8} {'chargement':>14} {'temps (s)':>10} {'pic Python (Mo)':>16} {'DataFrame (Mo)':>15}")
+    for n in args.sizes:
+        for name, loader in LOADERS.items():
+            elapsed, peak, size, df = measure(loader, n, args.repeat)
+            print(f"{n:>8} {name:>14} {elapsed:>10.3f} {peak / 2**20:>16.1f} {size / 2**20:>15.1f}")
+        print(f"{'':>8} {'types':>14} " + ", ".join(f"{c}={t}" for c, t in df.dtypes.items()))
+
+
+if __name__ == "__main__":
+    main()
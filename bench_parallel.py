@@ -0,0 +1,54 @@
+"""
+bench_parallel.py - Passage à l'échelle de la génération parallèle (parallel_scheduler)
+Données synthétiques de bench_scheduler.py, sans base de données :
+    python bench_parallel.py                      # 10 000 modules, 1 -> nb de cœurs
+    python bench_parallel.py 5000 --workers 1 4 8 --restarts 4 --budget 2
+
+"Tâches (s)" est le temps CPU cumulé des processus : le rapport
+tâches / (mur x processus) mesure l'efficacité du parallélisme.
+"""
+
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+from bench_scheduler import make_dataset
+from parallel_scheduler import generate_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="?", type=int, default=10000)
+    parser.add_argument("--workers", nargs="+", type=int)
+    parser.add_argument("--restarts", type=int, default=4)
+    parser.add_argument("--budget", type=float, default=0.0, help="recherche locale par tâche (s)")
+    parser.add_argument("--partition", default="auto", choices=["auto", "composantes", "departements"])
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers_list = args.workers or [w for w in (1, 2, 4, 8, 16) if w <= cpus]
+    modules, rooms = make_dataset(args.modules)
+    start = date(2025, 1, 6)
+
+    print(f"{args.modules} modules, {len(rooms)} salles, {args.restarts} redémarrage(s), {cpus} cœur(s)")
+    print(f"{'processus':>9} {'groupes':>8} {'tâches':>7} {'mur (s)':>8} {'tâches (s)':>11} "
+          f"{'efficacité':>10} {'fusion (s)':>10} {'réparés':>8} {'placés':>7} {'conflits':>9} {'coût':>10}")
+
+    for workers in workers_list:
+        t0 = time.perf_counter()
+        optimizer = generate_parallel(
+            modules, rooms, start, start + timedelta(weeks=6),
+            partition=args.partition, restarts=args.restarts,
+            budget_seconds=args.budget, max_workers=workers
+        )
+        wall = time.perf_counter() - t0
+        stats = optimizer.parallel_stats
+        efficiency = stats['task_time'] / (stats['solve_time'] * workers) if stats['solve_time'] else 0
+        print(f"{workers:>9} {stats['groups']:>8} {stats['tasks']:>7} {wall:>8.2f} {stats['task_time']:>11.2f} "
+              f"{efficiency:>10.0%} {stats['merge_time']:>10.2f} {stats['repaired']:>8} "
+              f"{len(optimizer.generated_schedule):>7} {len(optimizer.conflicts):>9} {optimizer.schedule_cost():>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
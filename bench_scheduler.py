@@ -0,0 +1,146 @@
+"""
+bench_scheduler.py - Temps de génération d'ExamScheduleOptimizer selon le nombre de modules
+Données synthétiques, sans base de données :
+    python bench_scheduler.py                 # 100 -> 10 000 modules
+    python bench_scheduler.py 500 2000        # tailles au choix
+    python bench_scheduler.py --linear 2000   # compare avec le parcours linéaire
+    python bench_scheduler.py --glouton       # compare avec le moteur glouton
+
+Chaque formation a ETUDIANTS_PAR_MODULE * MODULES_PAR_FORMATION étudiants
+(100 000 étudiants pour 10 000 modules), dont une partie suit une option
+dans une autre formation, presque toujours du même département : seul le
+moteur "coloration" évite ces conflits.
+"""
+
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from admin_examens import ExamScheduleOptimizer
+
+MODULES_PAR_FORMATION = 8
+ETUDIANTS_PAR_MODULE = 10
+TAUX_OPTION = 0.3
+TAUX_OPTION_AUTRE_DEPARTEMENT = 0.1
+N_DEPARTEMENTS = 7
+EXAMENS_PAR_SALLE_ET_JOUR = 4
+
+
+def make_dataset(n_modules, seed=42):
+    """Modules / salles / professeurs au format de load_optimization_data"""
+    rng = random.Random(seed)
+    n_formations = max(1, n_modules // MODULES_PAR_FORMATION)
+    n_professors = max(1, n_modules // 4)
+    n_students = n_modules * ETUDIANTS_PAR_MODULE
+
+    # Formation f -> département f % N_DEPARTEMENTS
+    modules_of_dept = [[] for _ in range(N_DEPARTEMENTS)]
+    for i in range(n_modules):
+        modules_of_dept[(i % n_formations) % N_DEPARTEMENTS].append(i)
+
+    # Étudiants : tous les modules de leur formation, parfois une option ailleurs
+    students_of = [[] for _ in range(n_modules)]
+    for student_id in range(1, n_students + 1):
+        formation = student_id % n_formations
+        for i in range(formation, n_modules, n_formations):
+            students_of[i].append(student_id)
+        if rng.random() < TAUX_OPTION:
+            if rng.random() < TAUX_OPTION_AUTRE_DEPARTEMENT:
+                students_of[rng.randrange(n_modules)].append(student_id)
+            else:
+                students_of[rng.choice(modules_of_dept[formation % N_DEPARTEMENTS])].append(student_id)
+
+    modules = []
+    for i in range(n_modules):
+        credits = rng.choice([2, 3, 4, 5, 6])
+        student_ids = sorted(set(students_of[i]))
+        modules.append({
+            'module_id': i + 1,
+            'module_name': f"Module {i + 1}",
+            'credits': credits,
+            'formation_id': i % n_formations + 1,
+            'departement_id': (i % n_formations) % N_DEPARTEMENTS + 1,
+            'professor_id': rng.randint(1, n_professors),
+            'student_count': len(student_ids),
+            'student_ids': student_ids,
+            'duration_minutes': 180 if credits >= 6 else 120 if credits >= 4 else 90,
+        })
+
+    # Assez de salles pour tout placer sur 6 semaines
+    n_rooms = max(5, n_modules // (30 * EXAMENS_PAR_SALLE_ET_JOUR) * 3)
+    rooms = [
+        {'id': r + 1, 'nom': f"Salle {r + 1}", 'capacite': rng.choice([60, 120, 200, 300])}
+        for r in range(n_rooms)
+    ]
+    rooms.sort(key=lambda x: x['capacite'], reverse=True)
+    return modules, rooms
+
+
+class LinearScanOptimizer(ExamScheduleOptimizer):
+    """Ancienne vérification : parcours de tout le planning pour chaque créneau"""
+
+    def _assign_rooms(self, modules):
+        self._placed = []
+        return super()._assign_rooms(modules)
+
+    def _is_slot_available(self, slot_time, room_id, module):
+        slot_end = slot_time + timedelta(minutes=module.get('duration_minutes', 120))
+        for exam in self._placed:
+            if exam['room_id'] == room_id:
+                exam_end = exam['exam_time'] + timedelta(minutes=exam['duration_minutes'])
+                if not (slot_end <= exam['exam_time'] or slot_time >= exam_end):
+                    return False
+        if not self.occupancy.day_is_free(slot_time.date(), module.get('professor_id'), module.get('formation_id')):
+            return False
+        if not self.occupancy.professors.is_free(module.get('professor_id'), slot_time, slot_end):
+            return False
+        # Ce créneau sera retenu : on l'enregistre pour les suivants
+        self._placed.append({'room_id': room_id, 'exam_time': slot_time,
+                             'duration_minutes': module.get('duration_minutes', 120)})
+        return True
+
+
+def run(optimizer_class, dataset, engine="coloration"):
+    modules, rooms = dataset
+    start = date(2025, 1, 6)
+    optimizer = optimizer_class(start, start + timedelta(weeks=6), engine=engine)
+    optimizer.modules_data = modules
+    optimizer.rooms = rooms
+    optimizer.professors = []
+
+    t0 = time.perf_counter()
+    schedule = optimizer.build_schedule()
+    elapsed = time.perf_counter() - t0
+    student_conflicts = sum(c['type_conflit'] == 'Étudiant >1 examen/jour' for c in optimizer.conflicts)
+    return elapsed, len(schedule), student_conflicts, optimizer.graph.n_edges
+
+
+def main(argv):
+    linear = "--linear" in argv
+    glouton = "--glouton" in argv
+    sizes = [int(a) for a in argv if a.isdigit()] or [100, 500, 1000, 2000, 5000, 10000]
+
+    header = f"{'modules':>8} {'étudiants':>10} {'arêtes':>8} {'salles':>7} {'placés':>7} {'conflits':>9} {'temps (s)':>10}"
+    if linear:
+        header += f" {'linéaire (s)':>13}"
+    if glouton:
+        header += f" {'glouton (s)':>12} {'placés':>7} {'conflits':>9}"
+    print(header)
+
+    for n in sizes:
+        dataset = make_dataset(n)
+        n_students = len({s for m in dataset[0] for s in m['student_ids']})
+        elapsed, placed, conflicts, edges = run(ExamScheduleOptimizer, dataset)
+        line = f"{n:>8} {n_students:>10} {edges:>8} {len(dataset[1]):>7} {placed:>7} {conflicts:>9} {elapsed:>10.3f}"
+        if linear:
+            elapsed_linear = run(LinearScanOptimizer, dataset)[0]
+            line += f" {elapsed_linear:>13.3f}"
+        if glouton:
+            elapsed_g, placed_g, conflicts_g, _ = run(ExamScheduleOptimizer, dataset, "glouton")
+            line += f" {elapsed_g:>12.3f} {placed_g:>7} {conflicts_g:>9}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
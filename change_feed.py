@@ -0,0 +1,281 @@
+"""
+change_feed.py - Changements poussés aux tableaux de bord ouverts
+Les triggers de bdd.sql (PARTIE 23) publient sur 'flux_changements' les
+lignes modifiées d'examens, demandes_modification_examens et notifications
+avec leurs clés de diffusion (m:<module>, p:<professeur>, d:<département>,
+e:<étudiant>, u:<rôle>:<id>, r:<rôle>). La connexion d'écoute du processus
+(query_cache.PgListener, une seule par processus) les remet au ChangeFeed,
+qui les range dans les abonnements des sessions concernées.
+Chaque session s'abonne avec ses clés (subscribe_session) ; le fragment
+live_updates() relance la page seulement quand un changement la concerne,
+et la page ne relit que les lignes signalées (Subscription.drain()).
+Sans écoute active, les pages se comportent comme avant (pas de poussée).
+"""
+
+import json
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import streamlit as st
+
+from query_cache import get_query_cache
+from queries import UserQueries
+
+CANAL = "flux_changements"
+
+# Secondes entre deux vérifications des abonnements d'une session
+LIVE_INTERVAL = 3
+
+# Durée de vie du badge de notifications (secondes) : sans écoute active,
+# il est relu à ce rythme et non à chaque vérification ; avec écoute, il
+# prend aussi en compte les notifications expirées entre-temps
+NOTIFICATIONS_MAX_AGE = 60
+
+
+class Subscription:
+    """
+    Abonnement d'une session : tables suivies et clés de diffusion.
+    Les changements reçus s'accumulent jusqu'au prochain drain().
+    "complet" : relire tout (message groupé, écoute interrompue).
+    """
+
+    def __init__(self, tables, keys):
+        self.tables = frozenset(tables)
+        self.keys = frozenset(keys)
+        self._lock = threading.Lock()
+        self._ids = defaultdict(set)  # table -> ids modifiés
+        self._complet = set()         # tables à relire entièrement
+
+    def push(self, table, ids=(), complet=False):
+        with self._lock:
+            if complet:
+                self._complet.add(table)
+                self._ids.pop(table, None)
+            elif table not in self._complet:
+                self._ids[table].update(ids)
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._complet or self._ids)
+
+    def drain(self) -> dict:
+        """{table: ids modifiés, ou None pour tout relire} ; vide l'abonnement"""
+        with self._lock:
+            changes = {table: None for table in self._complet}
+            changes.update({table: ids for table, ids in self._ids.items()})
+            self._complet.clear()
+            self._ids.clear()
+        return changes
+
+
+class ChangeFeed:
+    """
+    Répartition des messages du canal aux abonnements, par index
+    clé -> abonnements : le coût d'un message ne dépend que de ses clés.
+    Les abonnements sont tenus par référence faible : une session fermée
+    disparaît avec son st.session_state.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.messages = 0
+        self.deliveries = 0
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(weakref.WeakSet)    # clé -> abonnements
+        self._by_table = defaultdict(weakref.WeakSet)  # table -> abonnements
+
+    @property
+    def online(self) -> bool:
+        return self.listener is not None and self.listener.listening.is_set()
+
+    def subscribe(self, tables, keys) -> Subscription:
+        sub = Subscription(tables, keys)
+        with self._lock:
+            for table in sub.tables:
+                self._by_table[table].add(sub)
+            for key in sub.keys:
+                self._by_key[key].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for table in sub.tables:
+                self._by_table[table].discard(sub)
+            for key in sub.keys:
+                self._by_key[key].discard(sub)
+
+    def publish(self, payload):
+        """Handler du canal (thread d'écoute) : un message JSON de PARTIE 23"""
+        message = json.loads(payload)
+        table = message["t"]
+        self.messages += 1
+
+        if message.get("complet"):
+            with self._lock:
+                subs = list(self._by_table.get(table, ()))
+            for sub in subs:
+                sub.push(table, complet=True)
+            self.deliveries += len(subs)
+            return
+
+        ids_by_sub = defaultdict(set)
+        with self._lock:
+            for row in message.get("r") or ():
+                for key in row["k"]:
+                    for sub in self._by_key.get(key, ()):
+                        if table in sub.tables:
+                            ids_by_sub[sub].add(row["id"])
+        for sub, ids in ids_by_sub.items():
+            sub.push(table, ids)
+        self.deliveries += len(ids_by_sub)
+
+    def reset_all(self):
+        """(Re)connexion : les messages de la coupure sont perdus, tout est à relire"""
+        with self._lock:
+            subs = {sub for table_subs in self._by_table.values() for sub in table_subs}
+        for sub in subs:
+            for table in sub.tables:
+                sub.push(table, complet=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscriptions = len({sub for table_subs in self._by_table.values() for sub in table_subs})
+        return {
+            "online": self.online,
+            "messages": self.messages,
+            "deliveries": self.deliveries,
+            "subscriptions": subscriptions,
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_change_feed() -> ChangeFeed:
+    """Flux unique par processus, branché sur la connexion d'écoute du cache"""
+    listener = get_query_cache().listener
+    feed = ChangeFeed(listener)
+    listener.add_channel(CANAL, feed.publish, on_connect=feed.reset_all)
+    return feed
+
+
+def subscribe_session(name: str, tables, keys) -> Subscription:
+    """
+    Abonnement de la session pour name (une page, un composant) ; recréé
+    si les clés changent. Retourne None sans flux disponible.
+    Un abonnement neuf n'a rien reçu : la page charge ses données en entier.
+    """
+    try:
+        feed = get_change_feed()
+    except Exception:
+        return None
+
+    state_key = f"_flux_{name}"
+    sub = st.session_state.get(state_key)
+    tables, keys = frozenset(tables), frozenset(keys)
+    if sub is None or sub.tables != tables or sub.keys != keys:
+        if sub is not None:
+            feed.unsubscribe(sub)
+        sub = feed.subscribe(tables, keys)
+        st.session_state[state_key] = sub
+    return sub
+
+
+def mark_changed(name: str, table: str, ids=()):
+    """
+    Écriture faite par la session : ses données sont relues au rerun qui
+    suit, sans attendre la notification
+    """
+    sub = st.session_state.get(f"_flux_{name}")
+    if sub is not None:
+        sub.push(table, ids)
+    else:
+        st.session_state.pop(f"_flux_data_{name}", None)
+
+
+def live_data(name: str, sub, load, patch, max_age=None):
+    """
+    Données de la session tenues à jour par sub : load(readonly) au premier
+    appel, après un message "complet" ou au-delà de max_age secondes ; sinon
+    patch(data, {table: ids}) pour les seules lignes signalées, ou les
+    données gardées si rien n'a changé.
+    Sans écoute active, les données sont gardées jusqu'à max_age (relues à
+    chaque appel sans max_age) et relues après une écriture de la session.
+    Un rechargement dû au flux (message "complet", reconnexion) lit le
+    primaire (readonly=False) : la notification part au COMMIT, un réplica
+    en retard rendrait l'état d'avant, gardé puisque l'abonnement est vidé.
+    """
+    state_key = f"_flux_data_{name}"
+    entry = st.session_state.get(state_key)
+    changes = sub.drain() if sub is not None else {}
+    try:
+        online = sub is not None and get_change_feed().online
+    except Exception:
+        online = False
+
+    if (entry is None or entry[0] is not sub
+            or (not online and (max_age is None or changes))
+            or (max_age is not None and time.monotonic() - entry[2] > max_age)
+            or any(ids is None for ids in changes.values())):
+        data, loaded_at = load(readonly=not changes), time.monotonic()
+    elif changes:
+        data, loaded_at = patch(entry[1], changes), entry[2]
+    else:
+        data, loaded_at = entry[1], entry[2]
+
+    st.session_state[state_key] = (sub, data, loaded_at)
+    return data
+
+
+@st.fragment(run_every=LIVE_INTERVAL)
+def live_updates(*subscriptions):
+    """
+    Vérification périodique, en mémoire : relance la page quand un des
+    abonnements a reçu un changement (la page relit alors ces lignes seules)
+    """
+    subscriptions = [sub for sub in subscriptions if sub is not None]
+    if not subscriptions:
+        return
+    if any(sub.pending() for sub in subscriptions):
+        st.rerun()
+    try:
+        online = get_change_feed().online
+    except Exception:
+        online = False
+    st.caption("🟢 Mises à jour en direct" if online else "⚪ Mises à jour en direct indisponibles")
+
+
+@st.fragment(run_every=LIVE_INTERVAL)
+def notification_badge(user_role: str, user_id: int):
+    """
+    Badge des notifications non lues : compteur (PARTIE 22) et dernières
+    notifications relus seulement quand une notification arrive, ou toutes
+    les NOTIFICATIONS_MAX_AGE secondes
+    """
+    sub = subscribe_session(
+        "notifications", ("notifications",), [f"u:{user_role}:{user_id}", f"r:{user_role}"]
+    )
+
+    def load(readonly):
+        # Compteur et liste toujours lus sur le primaire
+        return (
+            UserQueries.get_unread_notifications_count(user_id, user_role),
+            UserQueries.get_notifications(user_id, user_role),
+        )
+
+    count, notifications = live_data(
+        "notifications", sub, load=load, patch=lambda data, changes: load(readonly=False),
+        max_age=NOTIFICATIONS_MAX_AGE,
+    )
+
+    with st.popover(f"🔔 {count} non lue(s)" if count else "🔔 Notifications", use_container_width=True):
+        if not notifications:
+            st.caption("Aucune notification")
+        for notif in notifications:
+            icon = "🔵" if not notif["is_lu"] else "⚪"
+            st.markdown(f"{icon} **{notif['titre']}**  \n{notif['contenu'] or ''}")
+            st.caption(notif["created_at"].strftime("%d/%m/%Y %H:%M"))
+        if count and st.button("✅ Tout marquer comme lu", key="notifications_lues"):
+            UserQueries.mark_all_notifications_as_read(user_id, user_role)
+            mark_changed("notifications", "notifications")
+            st.rerun()
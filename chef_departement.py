@@ -10,6 +10,8 @@ def render_department_head_dashboard():
     from datetime import datetime, date
 
     from connection import execute_query
+    from queries import fetch_kpis, AnalyticsQueries, valider_planning_par_lots
+    from change_feed import subscribe_session, live_updates
 
     # ----------------------------
     # Configuration de la page
@@ -20,22 +22,6 @@ def render_department_head_dashboard():
         layout="wide"
     )
 
-    # ----------------------------
-    # Helper sécurisé pour requêtes scalaires
-    # ----------------------------
-    def q1(sql: str, default=0):
-        rows = execute_query(sql)
-        if not rows:
-            return default
-        row = rows[0]
-        if hasattr(row, 'keys') and len(row) > 0:
-            value = list(row.values())[0]
-        elif hasattr(row, '__getitem__') and len(row) > 0:
-            value = row[0]
-        else:
-            value = row
-        return default if value is None else value
-
     # ----------------------------
     # CSS personnalisé (identique à admin_examens.py)
     # ----------------------------
@@ -111,21 +97,17 @@ def render_department_head_dashboard():
     chef_id = st.session_state.user.get('linked_id', 1)
 
     # Récupérer le département
-    dept_info = q1(f"""
+    dept_rows = execute_query("""
         SELECT d.id, d.nom, d.code
         FROM chef_departement cd
         JOIN departements d ON cd.departement_id = d.id
-        WHERE cd.professeur_id = {chef_id} AND cd.is_actif = TRUE
-    """, {"id": 1, "nom": "Inconnu", "code": "???"})
-
-    if isinstance(dept_info, dict):
-        dept_id = dept_info.get('id', 1)
-        dept_nom = dept_info.get('nom', 'Inconnu')
-        dept_code = dept_info.get('code', '???')
-    else:
-        dept_id = 1
-        dept_nom = "Inconnu"
-        dept_code = "???"
+        WHERE cd.professeur_id = %s AND cd.is_actif = TRUE
+    """, (chef_id,))
+    dept_info = dict(dept_rows[0]) if dept_rows else {}
+
+    dept_id = dept_info.get('id', 1)
+    dept_nom = dept_info.get('nom', 'Inconnu')
+    dept_code = dept_info.get('code', '???')
 
     # ----------------------------
     # Header
@@ -173,10 +155,16 @@ def render_department_head_dashboard():
 
         col1, col2, col3, col4 = st.columns(4)
 
-        nb_formations = q1(f"SELECT COUNT(*) FROM formations WHERE departement_id = {dept_id} AND is_active = TRUE", 0)
-        nb_etudiants = q1(f"SELECT COUNT(*) FROM etudiants e JOIN formations f ON e.formation_id = f.id WHERE f.departement_id = {dept_id} AND e.statut = 'Actif'", 0)
-        nb_professeurs = q1(f"SELECT COUNT(*) FROM professeurs WHERE departement_id = {dept_id} AND is_active = TRUE", 0)
-        nb_examens = q1(f"SELECT COUNT(*) FROM examens ex JOIN modules m ON ex.module_id = m.id JOIN formations f ON m.formation_id = f.id WHERE f.departement_id = {dept_id} AND ex.statut IN ('Planifie', 'Confirme')", 0)
+        kpis = fetch_kpis({
+            "nb_formations": ("SELECT COUNT(*) FROM formations WHERE departement_id = %s AND is_active = TRUE", (dept_id,)),
+            "nb_etudiants": ("SELECT COUNT(*) FROM etudiants e JOIN formations f ON e.formation_id = f.id WHERE f.departement_id = %s AND e.statut = 'Actif'", (dept_id,)),
+            "nb_professeurs": ("SELECT COUNT(*) FROM professeurs WHERE departement_id = %s AND is_active = TRUE", (dept_id,)),
+            "nb_examens": ("SELECT COUNT(*) FROM examens ex JOIN modules m ON ex.module_id = m.id JOIN formations f ON m.formation_id = f.id WHERE f.departement_id = %s AND ex.statut IN ('Planifie', 'Confirme') AND ex.date_heure >= debut_annees_actives()", (dept_id,)),
+        })
+        nb_formations = kpis["nb_formations"]
+        nb_etudiants = kpis["nb_etudiants"]
+        nb_professeurs = kpis["nb_professeurs"]
+        nb_examens = kpis["nb_examens"]
 
         with col1: kpi_card("🎓 Formations", f"{int(nb_formations):,}", "", "ok")
         with col2: kpi_card("👨‍🎓 Étudiants", f"{int(nb_etudiants):,}", "", "ok")
@@ -200,6 +188,7 @@ def render_department_head_dashboard():
             LEFT JOIN modules m ON f.id = m.formation_id
             LEFT JOIN etudiants e ON f.id = e.formation_id AND e.statut = 'Actif'
             LEFT JOIN examens ex ON m.id = ex.module_id AND ex.statut IN ('Planifie', 'Confirme')
+                AND ex.date_heure >= debut_annees_actives()
             WHERE f.departement_id = {dept_id} AND f.is_active = TRUE
             GROUP BY f.id, f.code, f.nom, f.niveau
             ORDER BY f.nom
@@ -270,44 +259,45 @@ def render_department_head_dashboard():
     elif page == "⚠️ Conflits Département":
         section_header(f"⚠️ Conflits - {dept_nom}")
 
-        if st.button("🔍 Détecter les conflits", type="primary"):
-            conflits = execute_query(f"""
-                -- Conflits étudiants
-                SELECT 'Étudiant >1 examen/jour' as type_conflit,
-                       'CRITIQUE' as severite,
-                       i.etudiant_id,
-                       DATE(e.date_heure) as jour,
-                       COUNT(*) as nb_examens
-                FROM inscriptions i
-                JOIN examens e ON i.module_id = e.module_id
-                JOIN modules m ON e.module_id = m.id
-                JOIN formations f ON m.formation_id = f.id
-                WHERE f.departement_id = {dept_id}
-                AND e.statut IN ('Planifie', 'Confirme')
-                GROUP BY i.etudiant_id, DATE(e.date_heure)
-                HAVING COUNT(*) > 1
-                
-                UNION ALL
-                
-                -- Conflits professeurs
-                SELECT 'Professeur >3 examens/jour' as type_conflit,
-                       'CRITIQUE' as severite,
-                       e.professeur_id,
-                       DATE(e.date_heure) as jour,
-                       COUNT(*) as nb_examens
-                FROM examens e
-                JOIN modules m ON e.module_id = m.id
-                JOIN formations f ON m.formation_id = f.id
-                WHERE f.departement_id = {dept_id}
-                AND e.statut IN ('Planifie', 'Confirme')
-                GROUP BY e.professeur_id, DATE(e.date_heure)
-                HAVING COUNT(*) > 3
-            """)
-
-            if conflits:
+        col1, col2 = st.columns(2)
+        with col1: conf_debut = st.date_input("Du", value=None, key="c1")
+        with col2: conf_fin = st.date_input("Au", value=None, key="c2")
+
+        # Analyse gardée pour la session et relancée d'elle-même quand un
+        # examen du département change (plus besoin de recliquer)
+        subscription = subscribe_session("chef_conflits", ("examens",), [f"d:{dept_id}"])
+        changes = subscription.drain() if subscription is not None else {}
+        params = (dept_id, conf_debut, conf_fin)
+        analyse = st.session_state.get("conflits_departement")
+
+        relancer = analyse is not None and analyse["params"] == params and bool(changes)
+        if st.button("🔍 Détecter les conflits", type="primary") or relancer:
+            # Filtre département / période appliqué en base (detecter_conflits_filtre)
+            analyse = {
+                "params": params,
+                # Relance due au flux : lecture sur le primaire, un réplica en
+                # retard rendrait l'état d'avant le changement
+                "conflits": AnalyticsQueries.get_conflicts_report(
+                    dept_id, start_date=conf_debut, end_date=conf_fin, readonly=not relancer
+                ),
+                "auto": relancer,
+                "at": datetime.now(),
+            }
+            st.session_state["conflits_departement"] = analyse
+
+        if analyse is not None and analyse["params"] == params:
+            conflits = analyse["conflits"]
+            live_updates(subscription)
+            if analyse["auto"]:
+                st.info(f"🔄 Analyse relancée à {analyse['at'].strftime('%H:%M:%S')} : examens du département modifiés")
+
+            if not conflits.empty:
                 st.error(f"⚠️ {len(conflits)} conflit(s) détecté(s)")
-                df = pd.DataFrame(conflits)
-                st.dataframe(df, use_container_width=True)
+                par_type = conflits["type_conflit"].value_counts()
+                cols = st.columns(len(par_type))
+                for col, (type_conflit, nb) in zip(cols, par_type.items()):
+                    col.metric(type_conflit, int(nb))
+                st.dataframe(conflits, use_container_width=True, hide_index=True)
             else:
                 st.success("✅ Aucun conflit détecté !")
 
@@ -321,16 +311,16 @@ def render_department_head_dashboard():
         with col1: date_debut = st.date_input("Début", value=date.today(), key="v1")
         with col2: date_fin = st.date_input("Fin", value=date.today() + pd.Timedelta(days=30), key="v2")
 
-        examens = execute_query(f"""
+        examens = execute_query("""
             SELECT ex.id, m.nom as module, ex.date_heure, ex.statut
             FROM examens ex
             JOIN modules m ON ex.module_id = m.id
             JOIN formations f ON m.formation_id = f.id
-            WHERE f.departement_id = {dept_id}
-            AND ex.date_heure BETWEEN '{date_debut}' AND '{date_fin}'
+            WHERE f.departement_id = %s
+            AND ex.date_heure BETWEEN %s AND %s
             AND ex.statut = 'Planifie'
             ORDER BY ex.date_heure
-        """)
+        """, (dept_id, date_debut, date_fin))
 
         if not examens:
             st.success("✅ Tous les examens sont déjà confirmés !")
@@ -338,12 +328,16 @@ def render_department_head_dashboard():
 
         st.dataframe(pd.DataFrame(examens), use_container_width=True)
 
-        if st.button("✅ Valider tous les examens", type="primary"):
-            if st.checkbox("Je confirme la validation de tous les examens planifiés"):
-                ids = [e['id'] for e in examens]
-                placeholders = ','.join(['%s'] * len(ids))
-                query = f"UPDATE examens SET statut = 'Confirme' WHERE id IN ({placeholders})"
-                result = execute_query(query, tuple(ids), fetch=False)
-                if result:
-                    st.success(f"✅ {result} examen(s) validé(s) !")
-                    st.rerun()
\ No newline at end of file
+        confirm = st.checkbox("Je confirme la validation de tous les examens planifiés")
+        if st.button("✅ Valider tous les examens", type="primary", disabled=not confirm):
+            # Exactement les examens affichés, en lots (= ANY(ids), pas de liste IN)
+            barre = st.progress(0, text="Validation par lots...")
+            result = valider_planning_par_lots(
+                examens_ids=[e['id'] for e in examens],
+                department_id=dept_id,
+                on_progress=lambda faits, total: barre.progress(faits / total, text=f"✅ {faits} / {total} examens confirmés"),
+                user_id=st.session_state.user.get('id')
+            )
+            if result["valides"]:
+                st.success(f"✅ {result['valides']} examen(s) validé(s) !")
+                st.rerun()
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""
+conflict_analysis.py - Analyse des conflits en mémoire, vectorisée (NumPy)
+Alternative à detecter_conflits() : examens actifs, inscriptions et
+capacités sont chargés une fois en tableaux, puis les quatre classes de
+conflits de bdd.sql (PARTIE 10) sont calculées sans boucle par ligne :
+- étudiant >1 examen/jour : clés (étudiant, jour, examen) empaquetées en
+  int64, triées, dédoublonnées puis comptées par (étudiant, jour)
+- professeur >3 examens/jour : même comptage sur (professeur, jour)
+- chevauchement salle : balayage des intervalles triés par (salle, début),
+  searchsorted donne pour chaque examen les suivants qui commencent avant
+  sa fin
+- dépassement capacité : np.bincount des inscrits par module
+Un planning candidat (ExamScheduleOptimizer.generated_schedule) se valide
+contre les données chargées avec with_schedule(), sans accès à la base.
+"""
+
+import numpy as np
+import pandas as pd
+
+from connection import load_columns
+
+MINUTES_PAR_JOUR = 1440
+MAX_EXAMENS_PROF_PAR_JOUR = 3
+
+TYPES = {
+    "etudiant": ("Étudiant >1 examen/jour", "CRITIQUE"),
+    "professeur": ("Professeur >3 examens/jour", "CRITIQUE"),
+    "salle": ("Chevauchement salle", "ÉLEVÉ"),
+    "examen": ("Dépassement capacité", "MOYEN"),
+}
+
+COLUMNS = ["type_conflit", "entite", "entite_id", "jour", "examens_ids", "nb", "details", "severite"]
+
+EXAMS_QUERY = """
+    SELECT id, module_id, salle_id, professeur_id, date_heure, duree_minutes
+    FROM examens
+    WHERE statut IN ('Planifie', 'Confirme')
+      AND date_heure >= debut_annees_actives()
+"""
+
+ENROLMENTS_QUERY = """
+    SELECT etudiant_id, module_id, statut = 'Inscrit' AS inscrit
+    FROM inscriptions
+    WHERE annee_academique >= premiere_annee_active()
+"""
+
+ROOMS_QUERY = "SELECT id, capacite FROM lieux_examen"
+
+
+def _int64(series, missing=-1):
+    """Colonne entière (éventuellement nullable) -> int64, NULL -> missing"""
+    return series.to_numpy(dtype=np.int64, na_value=missing)
+
+
+def _check_packing(*bases):
+    """Les clés empaquetées a * base_b + b... doivent tenir dans un int64"""
+    total = 1
+    for base in bases:
+        total *= int(base)
+    if total >= 2**63:
+        raise OverflowError("Clé empaquetée hors de l'int64")
+
+
+def _expand_ranges(lo, hi):
+    """Indices lo[i] .. hi[i]-1 mis bout à bout, et l'indice i de chacun"""
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lo[owner] + offsets
+
+
+def _runs(sorted_keys):
+    """
+    Séries de clés égales d'un tableau trié : clé, début et longueur de
+    chaque série (np.unique(..., return_counts=True) sans son tri, ni la
+    table de hachage de NumPy 2, plus lente ici)
+    """
+    if not len(sorted_keys):
+        return sorted_keys, np.empty(0, np.int64), np.empty(0, np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    return sorted_keys[starts], starts, np.diff(np.append(starts, len(sorted_keys)))
+
+
+def _groups(values, starts, lengths):
+    """values[début:début + longueur] pour chaque série, en listes Python"""
+    return [values[s:s + n].tolist() for s, n in zip(starts.tolist(), lengths.tolist())]
+
+
+class ConflictAnalyzer:
+    """
+    Examens actifs et inscriptions en tableaux NumPy.
+    Les horaires sont en minutes depuis l'époque Unix, les jours en jours
+    depuis l'époque (début // 1440).
+    """
+
+    def __init__(self, exam_ids, module_ids, room_ids, professor_ids, starts, durations,
+                 enrol_students, enrol_modules, enrol_inscrit, room_capacity):
+        self.exam_ids = np.asarray(exam_ids, dtype=np.int64)
+        self.module_ids = np.asarray(module_ids, dtype=np.int64)
+        self.room_ids = np.asarray(room_ids, dtype=np.int64)
+        self.professor_ids = np.asarray(professor_ids, dtype=np.int64)  # -1 : sans professeur
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.durations = np.asarray(durations, dtype=np.int64)
+        self.enrol_students = np.asarray(enrol_students, dtype=np.int64)
+        self.enrol_modules = np.asarray(enrol_modules, dtype=np.int64)
+        self.enrol_inscrit = np.asarray(enrol_inscrit, dtype=bool)
+        self.room_capacity = np.asarray(room_capacity, dtype=np.int64)  # indexé par id de salle
+        self.days = self.starts // MINUTES_PAR_JOUR
+
+    @classmethod
+    def from_db(cls, readonly=True):
+        """Trois lectures colonnaires (load_columns), puis plus aucun accès à la base"""
+        exams = load_columns(EXAMS_QUERY, readonly=readonly)
+        enrolments = load_columns(ENROLMENTS_QUERY, readonly=readonly)
+        rooms = load_columns(ROOMS_QUERY, readonly=readonly)
+
+        capacity = np.zeros(int(rooms["id"].max()) + 1 if not rooms.empty else 0, dtype=np.int64)
+        if not rooms.empty:
+            capacity[_int64(rooms["id"])] = _int64(rooms["capacite"], 0)
+
+        if exams.empty:
+            exams = pd.DataFrame({c: pd.Series(dtype="int64") for c in
+                                  ("id", "module_id", "salle_id", "professeur_id", "duree_minutes")})
+            exams["date_heure"] = pd.Series(dtype="datetime64[us]")
+        if enrolments.empty:
+            enrolments = pd.DataFrame({"etudiant_id": pd.Series(dtype="int64"),
+                                       "module_id": pd.Series(dtype="int64"),
+                                       "inscrit": pd.Series(dtype=bool)})
+
+        return cls(
+            _int64(exams["id"]), _int64(exams["module_id"]), _int64(exams["salle_id"]),
+            _int64(exams["professeur_id"]),
+            exams["date_heure"].to_numpy("datetime64[m]").astype(np.int64),
+            _int64(exams["duree_minutes"], 120),
+            _int64(enrolments["etudiant_id"]), _int64(enrolments["module_id"]),
+            enrolments["inscrit"].to_numpy(dtype=bool, na_value=False),
+            capacity,
+        )
+
+    def with_schedule(self, schedule, replace_modules=False):
+        """
+        Nouvel analyseur : examens chargés + planning candidat (lignes
+        module_id, room_id, professor_id, exam_time, duration_minutes).
+        Les examens candidats reçoivent des ids négatifs (-1, -2...).
+        Par défaut les examens existants restent, comme avec save_schedule ;
+        replace_modules=True retire ceux des modules replanifiés.
+        """
+        if not schedule:
+            return self
+        candidate = pd.DataFrame(schedule)
+        modules = candidate["module_id"].to_numpy(dtype=np.int64)
+        keep = ~np.isin(self.module_ids, modules) if replace_modules else np.ones(len(self.exam_ids), bool)
+
+        def merged(existing, new):
+            return np.concatenate([existing[keep], np.asarray(new, dtype=np.int64)])
+
+        return ConflictAnalyzer(
+            merged(self.exam_ids, -np.arange(1, len(candidate) + 1)),
+            merged(self.module_ids, modules),
+            merged(self.room_ids, candidate["room_id"].to_numpy(dtype=np.int64)),
+            merged(self.professor_ids, candidate["professor_id"].astype("Int64").to_numpy(dtype=np.int64, na_value=-1)),
+            merged(self.starts, pd.to_datetime(candidate["exam_time"]).to_numpy("datetime64[m]").astype(np.int64)),
+            merged(self.durations, candidate["duration_minutes"].to_numpy(dtype=np.int64)),
+            self.enrol_students, self.enrol_modules, self.enrol_inscrit, self.room_capacity,
+        )
+
+    # ---------- les quatre classes de conflits ----------
+
+    def _student_exam_pairs(self):
+        """
+        Jointure inscriptions x examens sur le module : examens triés par
+        module, et index direct id de module -> [début, fin) dans ce tri
+        (ids SERIAL, donc denses) au lieu d'une recherche par inscription
+        """
+        order = np.argsort(self.module_ids, kind="stable")
+        size = int(max(self.module_ids.max(initial=0), self.enrol_modules.max(initial=0))) + 2
+        bounds = np.zeros(size, dtype=np.int64)
+        bounds[1:] = np.cumsum(np.bincount(self.module_ids, minlength=size - 1))
+        enrolment, position = _expand_ranges(bounds[self.enrol_modules], bounds[self.enrol_modules + 1])
+        return self.enrol_students[enrolment], order[position]
+
+    def student_conflicts(self, with_exams=True):
+        """
+        (étudiant, jour) ayant plus d'un examen distinct ; avec with_exams,
+        la liste des indices d'examens de chacun
+        """
+        students, exams = self._student_exam_pairs()
+        if not len(exams):
+            return np.empty(0, np.int64), np.empty(0, np.int64), []
+        day0 = self.days.min()
+        n_days = int(self.days.max() - day0) + 1
+        n_exams = len(self.exam_ids)
+        _check_packing(students.max() + 1, n_days, n_exams)
+        # Clé (étudiant, jour, examen) triée ; une inscription en double ne
+        # compte qu'une fois (COUNT(DISTINCT e.id))
+        triples = (students * n_days + (self.days[exams] - day0)) * n_exams + exams
+        triples.sort()
+        pair_keys, exams = np.divmod(_runs(triples)[0], n_exams)
+        keys, starts, lengths = _runs(pair_keys)
+        selected = lengths > 1
+        conflicting = keys[selected]
+        groups = _groups(exams, starts[selected], lengths[selected]) if with_exams else []
+        return conflicting // n_days, conflicting % n_days + day0, groups
+
+    def professor_conflicts(self, max_per_day=MAX_EXAMENS_PROF_PAR_JOUR, with_exams=True):
+        """(professeur, jour) au-delà de max_per_day, avec leurs examens dans l'ordre horaire"""
+        with_prof = np.flatnonzero(self.professor_ids >= 0)
+        if not len(with_prof):
+            return np.empty(0, np.int64), np.empty(0, np.int64), []
+        day0 = self.days.min()
+        n_days = int(self.days.max() - day0) + 1
+        _check_packing(self.professor_ids.max() + 1, n_days)
+        keys = self.professor_ids[with_prof] * n_days + (self.days[with_prof] - day0)
+        # Tri par (clé, début) : examens de chaque groupe dans l'ordre horaire
+        order = np.lexsort((self.starts[with_prof], keys))
+        unique_keys, starts, lengths = _runs(keys[order])
+        selected = lengths > max_per_day
+        conflicting = unique_keys[selected]
+        groups = _groups(with_prof[order], starts[selected], lengths[selected]) if with_exams else []
+        return conflicting // n_days, conflicting % n_days + day0, groups
+
+    def room_overlaps(self):
+        """
+        Paires d'examens (i, j) qui se chevauchent dans une même salle.
+        Après tri par (salle, début), les examens qui chevauchent i parmi
+        les suivants sont ceux qui commencent avant sa fin : un intervalle
+        contigu, borné par searchsorted.
+        """
+        n = len(self.exam_ids)
+        if n < 2:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+        t0 = self.starts.min()
+        span = int((self.starts + self.durations).max() - t0) + 1
+        order = np.lexsort((self.starts, self.room_ids))
+        sorted_rooms = self.room_ids[order]
+        room_rank = np.concatenate(([0], np.cumsum(sorted_rooms[1:] != sorted_rooms[:-1])))
+        _check_packing(room_rank[-1] + 1, span)
+        keys = room_rank * span + (self.starts[order] - t0)
+        ends = room_rank * span + (self.starts[order] + self.durations[order] - t0)
+        hi = np.searchsorted(keys, ends, "left")
+        first, second = _expand_ranges(np.arange(1, n + 1), np.maximum(hi, np.arange(1, n + 1)))
+        first, second = order[first], order[second]
+        # Examen de durée nulle au même début : pas de chevauchement (bornes strictes)
+        overlap = self.starts[second] + self.durations[second] > self.starts[first]
+        return first[overlap], second[overlap]
+
+    def capacity_overflows(self):
+        """Indices des examens dont le module a plus d'inscrits que la salle de places"""
+        size = int(max(self.module_ids.max(initial=0), self.enrol_modules.max(initial=0))) + 1
+        enrolled = np.bincount(self.enrol_modules[self.enrol_inscrit], minlength=size)
+        counts = enrolled[self.module_ids]
+        capacity = np.zeros(len(self.exam_ids), dtype=np.int64)
+        # Salle inconnue : exclue, comme par la jointure SQL
+        known = (self.room_ids >= 0) & (self.room_ids < len(self.room_capacity))
+        capacity[known] = self.room_capacity[self.room_ids[known]]
+        over = np.flatnonzero(known & (counts > capacity))
+        return over, counts[over], capacity[over]
+
+    # ---------- résultats ----------
+
+    def counts(self) -> dict:
+        """Nombre de conflits par entité, sans construire les lignes (validation rapide)"""
+        return {
+            "etudiant": len(self.student_conflicts(with_exams=False)[0]),
+            "professeur": len(self.professor_conflicts(with_exams=False)[0]),
+            "salle": len(self.room_overlaps()[0]),
+            "examen": len(self.capacity_overflows()[0]),
+        }
+
+    def conflicts(self) -> pd.DataFrame:
+        """Mêmes lignes que conflits_actifs (type, entité, jour, examens, détails, sévérité)"""
+        rows = []
+        ids = self.exam_ids
+
+        def day(d):
+            return np.datetime64(int(d), "D").item()
+
+        students, days, groups = self.student_conflicts()
+        for student, d, exams in zip(students.tolist(), days.tolist(), groups):
+            rows.append(("etudiant", student, day(d), sorted(ids[exams].tolist()), len(exams),
+                         f"Étudiant ID: {student} a {len(exams)} examens le {day(d)}"))
+
+        professors, days, groups = self.professor_conflicts()
+        for professor, d, exams in zip(professors.tolist(), days.tolist(), groups):
+            rows.append(("professeur", professor, day(d), ids[exams].tolist(), len(exams),
+                         f"Professeur ID: {professor} a {len(exams)} examens le {day(d)}"))
+
+        first, second = self.room_overlaps()
+        for i, j in zip(first.tolist(), second.tolist()):
+            a, b = sorted((int(ids[i]), int(ids[j])))
+            room = int(self.room_ids[i])
+            rows.append(("salle", room, day(min(self.days[i], self.days[j])), [a, b], 2,
+                         f"Salle ID: {room} - Examens {a} et {b} se chevauchent"))
+
+        over, enrolled, capacity = self.capacity_overflows()
+        for i, count, places in zip(over.tolist(), enrolled.tolist(), capacity.tolist()):
+            rows.append(("examen", int(ids[i]), day(self.days[i]), [int(ids[i])], count,
+                         f"Examen ID: {int(ids[i])} - {count} étudiants pour {places} places"))
+
+        if not rows:
+            return pd.DataFrame(columns=COLUMNS)
+        # Dépassement capacité : nb = inscrits, comme conflits_actifs
+        df = pd.DataFrame(rows, columns=["entite", "entite_id", "jour", "examens_ids", "nb", "details"])
+        df["type_conflit"] = df["entite"].map(lambda e: TYPES[e][0])
+        df["severite"] = df["entite"].map(lambda e: TYPES[e][1])
+        return df[COLUMNS]
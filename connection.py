@@ -1,71 +1,679 @@
 """
 connection.py - Connexion PostgreSQL (Streamlit Cloud compatible)
 Utilise st.secrets["postgres"] pour les identifiants.
+
+Les connexions sont servies par un pool unique par processus, partagé entre
+toutes les sessions Streamlit (st.cache_resource). Paramètres optionnels dans
+st.secrets["postgres"] :
+    pool_min            connexions gardées ouvertes en permanence (1)
+    pool_max            connexions simultanées maximum (10)
+    pool_max_idle       secondes avant fermeture d'une connexion inactive (300)
+    pool_health_check   secondes d'inactivité avant un "SELECT 1" de contrôle (30)
+    pool_timeout        secondes d'attente maximum d'une connexion libre (10)
+
+Réplicas en lecture seule (optionnels) : les requêtes marquées readonly=True
+(execute_query, load_dataframe, get_conn) sont réparties entre eux, les
+autres vont au primaire. Une même instance peut servir de primaire et de
+réplica pour les essais locaux.
+    replicas                 liste de tables, chacune surchargeant host, port,
+                             dbname, user, password, sslmode du primaire
+                             ex. [{ host = "replica-1" }, { host = "replica-2", port = 5433 }]
+    replica_balancing        "round_robin" ou "latency" (round_robin)
+    replica_max_lag          secondes de retard au-delà desquelles un réplica
+                             est écarté au profit du primaire (10)
+    replica_check_interval   secondes entre deux mesures de retard / latence (5)
+
+Gros volumes : iter_dataframes (curseur nommé, côté serveur), copy_csv
+(COPY ... TO STDOUT) et write_parquet gardent la mémoire bornée, au lieu de
+fetchall() + DataFrame. load_columns construit un DataFrame colonne par
+colonne (tuples -> tableaux NumPy) sans dictionnaire par ligne.
 """
 
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
 import streamlit as st
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import pandas as pd
 
 
 class SimpleConnection:
+    @staticmethod
+    def connect(overrides=None):
+        """
+        Ouvre une nouvelle connexion (lève une exception en cas d'échec)
+        overrides : paramètres remplaçant ceux de st.secrets["postgres"] (réplicas)
+        """
+        cfg = dict(st.secrets["postgres"])
+        cfg.update(overrides or {})
+        return psycopg2.connect(
+            host=cfg["host"],
+            dbname=cfg["dbname"],
+            user=cfg["user"],
+            password=cfg["password"],
+            port=int(cfg.get("port", 5432)),
+            sslmode=cfg.get("sslmode", "require"),
+        )
+
     @staticmethod
     def get_connection():
         try:
-            cfg = st.secrets["postgres"]
-            return psycopg2.connect(
-                host=cfg["host"],
-                dbname=cfg["dbname"],
-                user=cfg["user"],
-                password=cfg["password"],
-                port=int(cfg.get("port", 5432)),
-                sslmode=cfg.get("sslmode", "require"),
-            )
+            return SimpleConnection.connect()
         except Exception as e:
             st.error(f"⚠️ Connexion DB impossible : {e}")
             return None
 
 
-def execute_query(query: str, params=None, fetch=True):
-    conn = None
-    cur = None
-    try:
-        conn = SimpleConnection.get_connection()
-        if conn is None:
-            return [] if fetch else 0
+class ConnectionPool:
+    """
+    Pool de connexions thread-safe.
+    - minconn / maxconn : taille du pool
+    - éviction des connexions inactives depuis plus de max_idle secondes
+    - contrôle de santé ("SELECT 1") des connexions restées inactives
+    - mesure du temps d'attente et de détention de chaque emprunt
+    """
 
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(query, params or ())
+    def __init__(self, factory, minconn=1, maxconn=10, max_idle=300.0,
+                 health_check_after=30.0, timeout=10.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Tailles de pool invalides")
 
-        if fetch:
-            rows = cur.fetchall()
-            conn.commit()
-            return rows
-        else:
-            count = cur.rowcount
-            conn.commit()
-            return count
+        self._factory = factory
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, dernier retour au pool)
+        self._size = 0        # connexions ouvertes (libres + empruntées)
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "evicted": 0,
+            "health_failures": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "hold_time_total": 0.0,
+            "hold_time_max": 0.0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
+
+    # ---------- cycle de vie ----------
+
+    def _open(self):
+        conn = self._factory()
+        with self._cond:
+            self._size += 1
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _evict_idle(self, now):
+        """Ferme les connexions inactives trop anciennes (appelé sous verrou)"""
+        expired = []
+        # Les plus anciennes sont à gauche (LIFO à droite)
+        while (self._idle and self._size - len(expired) > self.minconn
+               and now - self._idle[0][1] > self.max_idle):
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ---------- emprunt / retour ----------
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            conn = None
+            idle_for = 0.0
+            create = False
+
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("Pool de connexions fermé")
+
+                now = time.monotonic()
+                expired = self._evict_idle(now)
+                self._size -= len(expired)
+                self._stats["evicted"] += len(expired)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    idle_for = now - last_used
+                elif self._size < self.maxconn:
+                    # Réserve la place avant d'ouvrir hors verrou
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise psycopg2.pool.PoolError(
+                            f"Aucune connexion libre après {self.timeout:g}s "
+                            f"({self.maxconn} connexions utilisées)"
+                        )
+                    self._cond.wait(remaining)
+
+            for old in expired:
+                try:
+                    old.close()
+                except Exception:
+                    pass
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif conn is not None:
+                if conn.closed or (idle_for > self.health_check_after and not self._is_healthy(conn)):
+                    with self._cond:
+                        self._stats["health_failures"] += 1
+                    self._discard(conn)
+                    continue
+            else:
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return conn
+
+    def putconn(self, conn, close=False, held_for=None):
+        if held_for is not None:
+            with self._cond:
+                self._stats["hold_time_total"] += held_for
+                self._stats["hold_time_max"] = max(self._stats["hold_time_max"], held_for)
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        try:
+            # Ne jamais rendre une connexion avec une transaction ouverte
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Emprunte une connexion ; rollback + retour au pool en sortie"""
+        conn = self.getconn()
+        checked_out = time.monotonic()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken, held_for=time.monotonic() - checked_out)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        """Compteurs du pool (temps en secondes)"""
+        with self._cond:
+            s = dict(self._stats)
+            s["size"] = self._size
+            s["idle"] = len(self._idle)
+            s["in_use"] = self._size - len(self._idle)
+        n = s["checkouts"] or 1
+        s["wait_time_avg"] = s["wait_time_total"] / n
+        s["hold_time_avg"] = s["hold_time_total"] / n
+        return s
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool() -> ConnectionPool:
+    """Pool unique par processus, partagé par toutes les sessions"""
+    cfg = st.secrets["postgres"]
+    return ConnectionPool(
+        SimpleConnection.connect,
+        minconn=int(cfg.get("pool_min", 1)),
+        maxconn=int(cfg.get("pool_max", 10)),
+        max_idle=float(cfg.get("pool_max_idle", 300)),
+        health_check_after=float(cfg.get("pool_health_check", 30)),
+        timeout=float(cfg.get("pool_timeout", 10)),
+    )
+
+
+class ReplicaRouter:
+    """
+    Aiguillage primaire / réplicas.
+    - pool_for(readonly=False) -> (pool, nom) : le primaire, ou pour une
+      lecture un réplica disponible choisi en tourniquet ("round_robin") ou
+      par latence mesurée la plus faible ("latency")
+    - retard et latence de chaque réplica mesurés au plus toutes les
+      check_interval secondes, par le premier thread qui passe ; au-delà de
+      max_lag secondes (ou en cas d'erreur) le réplica est écarté
+    - mark_failed(nom) écarte un réplica jusqu'à la mesure suivante
+    Le routage est explicite : un SELECT peut appeler une fonction qui écrit
+    (save_optimized_schedule...), il n'est donc pas deviné depuis le SQL.
+    """
+
+    # 0 si l'instance est un primaire ou a rejoué tout ce qu'elle a reçu
+    LAG_QUERY = """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """
+
+    def __init__(self, primary, replicas=None, balancing="round_robin",
+                 max_lag=10.0, check_interval=5.0):
+        if balancing not in ("round_robin", "latency"):
+            raise ValueError(f"Équilibrage inconnu : {balancing}")
+
+        self.primary = primary
+        self.balancing = balancing
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._next = 0
+        self._fallbacks = 0
+        self._replicas = [
+            {
+                "name": name,
+                "pool": pool,
+                "available": False,
+                "lag": None,       # secondes
+                "latency": None,   # secondes, moyenne glissante
+                "checked_at": None,
+                "error": None,
+                "routed": 0,
+            }
+            for name, pool in (replicas or {}).items()
+        ]
+
+    # ---------- mesures ----------
+
+    def _check(self, replica):
+        started = time.monotonic()
+        try:
+            with replica["pool"].connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(self.LAG_QUERY)
+                    lag = cur.fetchone()[0]
+            rtt = time.monotonic() - started
+            lag = None if lag is None else float(lag)
+            with self._lock:
+                replica["lag"] = lag
+                replica["latency"] = rtt if replica["latency"] is None else 0.7 * replica["latency"] + 0.3 * rtt
+                replica["available"] = lag is not None and lag <= self.max_lag
+                replica["error"] = None
+        except Exception as e:
+            with self._lock:
+                replica["available"] = False
+                replica["error"] = str(e)
+        finally:
+            replica["checked_at"] = time.monotonic()
+
+    def _refresh(self):
+        """Mesure les réplicas dont la dernière mesure est trop ancienne"""
+        now = time.monotonic()
+        stale = [r for r in self._replicas
+                 if r["checked_at"] is None or now - r["checked_at"] >= self.check_interval]
+        # Un seul thread mesure, les autres gardent l'état courant
+        if stale and self._check_lock.acquire(blocking=False):
+            try:
+                for replica in stale:
+                    self._check(replica)
+            finally:
+                self._check_lock.release()
+
+    # ---------- aiguillage ----------
+
+    def pool_for(self, readonly=False):
+        if not readonly or not self._replicas:
+            return self.primary, "primary"
+
+        self._refresh()
+        with self._lock:
+            candidates = [r for r in self._replicas if r["available"]]
+            if not candidates:
+                self._fallbacks += 1
+                return self.primary, "primary"
+            if self.balancing == "latency":
+                replica = min(candidates, key=lambda r: r["latency"])
+            else:
+                replica = candidates[self._next % len(candidates)]
+                self._next += 1
+            replica["routed"] += 1
+            return replica["pool"], replica["name"]
+
+    def mark_failed(self, name, error=None):
+        with self._lock:
+            for replica in self._replicas:
+                if replica["name"] == name:
+                    replica["available"] = False
+                    replica["error"] = error
+                    replica["checked_at"] = time.monotonic()
+
+    def closeall(self):
+        for replica in self._replicas:
+            replica["pool"].closeall()
+
+    def stats(self) -> dict:
+        """État des réplicas (retard / latence en secondes) et du primaire"""
+        with self._lock:
+            replicas = [
+                {k: v for k, v in r.items() if k != "pool"}
+                for r in self._replicas
+            ]
+            fallbacks = self._fallbacks
+        for r in replicas:
+            r["pool"] = next(x["pool"] for x in self._replicas if x["name"] == r["name"]).stats()
+        return {
+            "balancing": self.balancing,
+            "max_lag": self.max_lag,
+            "fallbacks": fallbacks,
+            "primary": self.primary.stats(),
+            "replicas": replicas,
+        }
+
+
+def _replica_factory(overrides):
+    def connect():
+        conn = SimpleConnection.connect(overrides)
+        # Garde-fou : une écriture routée par erreur échoue au lieu de
+        # réussir sur l'instance qui sert de réplica en local
+        conn.set_session(readonly=True)
+        return conn
+    return connect
+
+
+@st.cache_resource(show_spinner=False)
+def get_router() -> ReplicaRouter:
+    """Aiguilleur unique par processus (primaire = get_pool())"""
+    cfg = st.secrets["postgres"]
+    replicas = {}
+    for i, overrides in enumerate(cfg.get("replicas", []) or []):
+        overrides = dict(overrides)
+        name = f"replica-{i + 1} ({overrides.get('host', cfg['host'])}:{overrides.get('port', cfg.get('port', 5432))})"
+        replicas[name] = ConnectionPool(
+            _replica_factory(overrides),
+            minconn=0,  # un réplica arrêté ne doit pas empêcher le démarrage
+            maxconn=int(cfg.get("pool_max", 10)),
+            max_idle=float(cfg.get("pool_max_idle", 300)),
+            health_check_after=float(cfg.get("pool_health_check", 30)),
+            timeout=float(cfg.get("pool_timeout", 10)),
+        )
+    return ReplicaRouter(
+        get_pool(),
+        replicas,
+        balancing=cfg.get("replica_balancing", "round_robin"),
+        max_lag=float(cfg.get("replica_max_lag", 10)),
+        check_interval=float(cfg.get("replica_check_interval", 5)),
+    )
+
+
+@contextmanager
+def get_conn(readonly=False):
+    """
+    Connexion empruntée au pool partagé (usage : with get_conn() as conn)
+    readonly=True : connexion d'un réplica si un réplica est disponible
+    """
+    pool, _ = get_router().pool_for(readonly)
+    with pool.connection() as conn:
+        yield conn
+
+
+def _run_query(pool, query, params, fetch):
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(query, params or ())
+
+            if fetch:
+                rows = cur.fetchall()
+                conn.commit()
+                return rows
+            else:
+                count = cur.rowcount
+                conn.commit()
+                return count
+
+
+def execute_query(query: str, params=None, fetch=True, readonly=False):
+    """
+    readonly=True : la requête ne fait que lire et peut être servie par un
+    réplica (cf. ReplicaRouter) ; sinon elle va au primaire
+    """
+    try:
+        router = get_router()
+        pool, target = router.pool_for(readonly)
+    except Exception as e:
+        st.error(f"⚠️ Connexion DB impossible : {e}")
+        return [] if fetch else 0
+
+    try:
+        try:
+            return _run_query(pool, query, params, fetch)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError) as e:
+            if pool is router.primary:
+                raise
+            # Réplica injoignable : écarté, la lecture est rejouée sur le primaire
+            router.mark_failed(target, str(e))
+            return _run_query(router.primary, query, params, fetch)
 
     except psycopg2.Error as e:
         st.error(f"⚠️ Erreur SQL : {e}")
-        if conn:
-            conn.rollback()
         return [] if fetch else 0
 
     except Exception as e:
         st.error(f"⚠️ Erreur : {e}")
-        if conn:
-            conn.rollback()
         return [] if fetch else 0
 
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
 
-def load_dataframe(query: str, params=None) -> pd.DataFrame:
-    rows = execute_query(query, params=params, fetch=True)
+def load_dataframe(query: str, params=None, readonly=False) -> pd.DataFrame:
+    rows = execute_query(query, params=params, fetch=True, readonly=readonly)
     return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+
+# OID PostgreSQL -> conversion pandas (load_columns, iter_dataframes) : les
+# types ne dépendent pas des valeurs, même pour une colonne toute à NULL
+_INT_OIDS = {20, 21, 23}                  # int8, int2, int4
+_FLOAT_OIDS = {700, 701, 1700}            # float4, float8, numeric
+_DATETIME_OIDS = {1082, 1114}             # date, timestamp
+_TEXT_OIDS = {25, 1042, 1043, 2950}       # text, char, varchar, uuid
+
+
+def _column_array(values, oid, categorical=False):
+    """Une colonne (tuple de valeurs Python) -> tableau NumPy / pandas typé"""
+    if categorical:
+        return pd.Categorical(values)
+    has_null = None in values
+    if oid in (21, 23):
+        return pd.array(values, dtype="Int32") if has_null else np.fromiter(values, np.int32, len(values))
+    if oid == 20:
+        return pd.array(values, dtype="Int64") if has_null else np.fromiter(values, np.int64, len(values))
+    if oid in _FLOAT_OIDS:
+        return np.array(values, dtype=np.float64)  # None -> NaN, Decimal -> float
+    if oid == 16:
+        return pd.array(values, dtype="boolean") if has_null else np.array(values, dtype=bool)
+    if oid in _DATETIME_OIDS:
+        return np.array(values, dtype="datetime64[us]")  # None -> NaT
+    if oid == 1184:
+        return pd.to_datetime(values, utc=True)
+    return np.array(values, dtype=object)
+
+
+def load_columns(query: str, params=None, categorical=(), readonly=False) -> pd.DataFrame:
+    """
+    Variante colonnaire de load_dataframe pour les requêtes analytiques :
+    curseur à tuples, puis une conversion par colonne selon le type
+    PostgreSQL (int2/int4 -> int32, timestamp/date -> datetime64, numeric ->
+    float64 ; types nullables pandas si la colonne contient des NULL).
+    categorical : colonnes à faible cardinalité (statuts...) -> category
+    """
+    try:
+        pool, _ = get_router().pool_for(readonly)
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params or ())
+                rows = cur.fetchall()
+                description = cur.description
+            conn.commit()
+    except psycopg2.Error as e:
+        st.error(f"⚠️ Erreur SQL : {e}")
+        return pd.DataFrame()
+    except Exception as e:
+        st.error(f"⚠️ Erreur : {e}")
+        return pd.DataFrame()
+
+    if not rows:
+        return pd.DataFrame()
+
+    return pd.DataFrame({
+        d.name: _column_array(values, d.type_code, d.name in categorical)
+        for d, values in zip(description, zip(*rows))
+    })
+
+
+# ---------- lectures en flux ----------
+
+def _typed_frame(rows, columns, type_codes):
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for column, oid in zip(columns, type_codes):
+        if oid in _INT_OIDS:
+            df[column] = df[column].astype("Int64")
+        elif oid in _FLOAT_OIDS:
+            df[column] = df[column].astype("Float64")
+        elif oid == 16:
+            df[column] = df[column].astype("boolean")
+        elif oid in _DATETIME_OIDS:
+            df[column] = pd.to_datetime(df[column])
+        elif oid == 1184:  # timestamptz
+            df[column] = pd.to_datetime(df[column], utc=True)
+        elif oid in _TEXT_OIDS:
+            df[column] = df[column].astype("string")
+    return df
+
+
+def iter_dataframes(query: str, params=None, chunksize=10000, readonly=False):
+    """
+    Lecture en flux par un curseur nommé (côté serveur) : au plus chunksize
+    lignes en mémoire à la fois, sous forme de DataFrames typés.
+    Un résultat vide donne un seul DataFrame vide (avec ses colonnes).
+    Les erreurs sont levées : utilisable hors du thread de rendu Streamlit
+    (st.download_button avec data=callable, par exemple).
+    """
+    pool, _ = get_router().pool_for(readonly)
+    with pool.connection() as conn:
+        with conn.cursor(name=f"flux_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunksize
+            cur.execute(query, params)
+            yielded = False
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if rows or not yielded:
+                    columns = [d.name for d in cur.description]
+                    type_codes = [d.type_code for d in cur.description]
+                    yield _typed_frame(rows, columns, type_codes)
+                    yielded = True
+                if len(rows) < chunksize:
+                    break
+
+
+def copy_csv(query: str, buffer, params=None, readonly=False) -> int:
+    """
+    Écrit le résultat de query en CSV (avec en-tête) dans buffer (fichier,
+    BytesIO ou StringIO) : le serveur formate les lignes (COPY ... TO STDOUT),
+    aucune ligne ne passe par des objets Python. Retourne le nombre de lignes.
+    """
+    pool, _ = get_router().pool_for(readonly)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            if params:
+                query = cur.mogrify(query, params).decode(psycopg2.extensions.encodings[conn.encoding])
+            cur.copy_expert(f"COPY ({query.strip().rstrip(';')}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+            return cur.rowcount
+
+
+def write_parquet(query: str, buffer, params=None, chunksize=50000, readonly=False) -> int:
+    """
+    Écrit le résultat de query en Parquet dans buffer, un groupe de lignes
+    par morceau de iter_dataframes. Retourne le nombre de lignes.
+    """
+    import pyarrow as pa  # installé avec streamlit
+    import pyarrow.parquet as pq
+
+    writer = None
+    count = 0
+    try:
+        for frame in iter_dataframes(query, params, chunksize=chunksize, readonly=readonly):
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(buffer, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            count += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
@@ -6,13 +6,16 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from queries import ExamQueries, AnalyticsQueries, UserQueries
+from queries import AnalyticsQueries, UserQueries
 from student_requests import StudentRequests  # NOUVEAU
 import calendar
 from connection import execute_query
+from change_feed import live_updates
 
 # Importer les fonctions
 from student_functions import (
+    load_student_bundle,
+    load_live_student_bundle,
     render_personal_schedule,
     render_room_view,
     render_student_statistics,
@@ -24,6 +27,12 @@ def render_student_dashboard():
     """
     # Header avec informations personnelles
     student_info = st.session_state.user
+    student_id = student_info['linked_id']
+    
+    # Examens, modules et conflits chargés une fois pour tous les onglets,
+    # puis mis à jour ligne à ligne quand un examen de la session change
+    bundle, subscription = load_live_student_bundle(student_id)
+    exams = bundle['exams']
     
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
@@ -39,18 +48,17 @@ def render_student_dashboard():
     
     with col2:
         today = datetime.now().date()
-        exams_today = len([e for e in ExamQueries.get_student_exams(
-            student_info['linked_id'], today, today
-        )])
+        exams_today = int((exams['date_heure'].dt.date == today).sum()) if not exams.empty else 0
         
         st.metric("📅 Examens aujourd'hui", exams_today)
     
     with col3:
         # Détection de conflits rapide
-        conflicts = StudentRequests.detect_student_conflicts(student_info['linked_id'])
+        conflicts = bundle['conflicts']
         st.metric("⚠️ Conflits détectés", len(conflicts), 
                  delta="À résoudre" if conflicts else "Aucun")
     
+    live_updates(subscription)
     st.markdown("---")
     
     # Onglets complets
@@ -64,32 +72,34 @@ def render_student_dashboard():
     ])
     
     with tab1:
-        render_personal_schedule(student_info['linked_id'])
+        render_personal_schedule(student_id, bundle)
     
     with tab2:
-        render_registered_modules(student_info['linked_id'])  # NOUVEAU
+        render_registered_modules(student_id, bundle)  # NOUVEAU
     
     with tab3:
-        render_student_conflicts(student_info['linked_id'])  # NOUVEAU
+        render_student_conflicts(student_id, bundle)  # NOUVEAU
     
     with tab4:
-        render_modification_requests(student_info['linked_id'])  # NOUVEAU
+        render_modification_requests(student_id, bundle)  # NOUVEAU
     
     with tab5:
-        render_room_view(student_info['linked_id'])
+        render_room_view(student_id, bundle)
     
     with tab6:
-        render_student_statistics(student_info['linked_id'])
+        render_student_statistics(student_id, bundle)
 
 # ========== NOUVELLES FONCTIONS ==========
 
-def render_registered_modules(student_id: int):
+def render_registered_modules(student_id: int, bundle: dict = None):
     """
     Affiche uniquement les modules où l'étudiant est inscrit
     """
     st.subheader("📚 Mes Modules Inscrits")
     
-    modules = StudentRequests.get_registered_modules(student_id)
+    bundle = bundle or load_student_bundle(student_id)
+    modules = bundle['modules']
+    exams = bundle['exams']
     
     if not modules:
         st.info("Vous n'êtes inscrit à aucun module")
@@ -143,23 +153,24 @@ def render_registered_modules(student_id: int):
             
             with col3:
                 # Voir les examens de ce module
-                exams = ExamQueries.get_student_exams(student_id)
-                module_exams = [e for e in exams if e.get('module_code') == module['code']]
+                module_exams = exams[exams['module_code'] == module['code']]
                 
-                if module_exams:
+                if not module_exams.empty:
                     st.write("**Examens:**")
-                    for exam in module_exams:
+                    for exam in module_exams.to_dict('records'):
                         st.write(f"• {exam['date_heure'].strftime('%d/%m %H:%M')} - {exam['salle_nom']}")
                 else:
                     st.info("Aucun examen programmé")
 
-def render_student_conflicts(student_id: int):
+def render_student_conflicts(student_id: int, bundle: dict = None):
     """
     Affiche les conflits personnels de l'étudiant
     """
     st.subheader("⚠️ Mes Conflits d'Examens")
     
-    conflicts = StudentRequests.detect_student_conflicts(student_id)
+    bundle = bundle or load_student_bundle(student_id)
+    conflicts = bundle['conflicts']
+    exams_by_id = {e['id']: e for e in bundle['exams'].to_dict('records')}
     
     if not conflicts:
         st.success("✅ Aucun conflit détecté dans votre emploi du temps")
@@ -167,7 +178,7 @@ def render_student_conflicts(student_id: int):
     
     st.warning(f"🚨 {len(conflicts)} conflit(s) détecté(s)")
     
-    for conflict in conflicts:
+    for i, conflict in enumerate(conflicts):
         severity_color = {
             'CRITIQUE': '🔴',
             'ÉLEVÉ': '🟠',
@@ -184,17 +195,17 @@ def render_student_conflicts(student_id: int):
                 exam_ids = conflict['examens_ids']
                 if isinstance(exam_ids, list):
                     for exam_id in exam_ids:
-                        exam_info = get_exam_info(exam_id)
+                        exam_info = exams_by_id.get(exam_id) or get_exam_info(exam_id)
                         if exam_info:
                             st.write(f"• {exam_info['module_nom']} - {exam_info['date_heure'].strftime('%d/%m %H:%M')}")
             
             # Bouton pour créer une demande
-            if st.button("📝 Demander un réajustement", key=f"request_{conflict.get('type_conflit')}"):
+            if st.button("📝 Demander un réajustement", key=f"request_{i}_{conflict.get('type_conflit')}"):
                 st.session_state['show_request_form'] = True
                 st.session_state['conflict_for_request'] = conflict
                 st.rerun()
 
-def render_modification_requests(student_id: int):
+def render_modification_requests(student_id: int, bundle: dict = None):
     """
     Gestion des demandes de modification d'examens
     """
@@ -204,19 +215,19 @@ def render_modification_requests(student_id: int):
     tab1, tab2 = st.tabs(["Nouvelle demande", "Mes demandes"])
     
     with tab1:
-        render_new_request_form(student_id)
+        render_new_request_form(student_id, bundle)
     
     with tab2:
         render_existing_requests(student_id)
 
-def render_new_request_form(student_id: int):
+def render_new_request_form(student_id: int, bundle: dict = None):
     """
     Formulaire pour créer une nouvelle demande
     """
     st.markdown("### 📝 Nouvelle demande de modification")
     
     # Récupérer les examens à venir
-    exams = ExamQueries.get_student_exams(student_id)
+    exams = (bundle or load_student_bundle(student_id))['exams'].to_dict('records')
     future_exams = [e for e in exams if e['date_heure'] > datetime.now()]
     
     if not future_exams:
@@ -0,0 +1,79 @@
+"""
+jobs.py - File de travaux en base (table jobs, bdd.sql PARTIE 16)
+Les calculs longs (génération du planning, analyse des conflits) ne
+tournent plus dans le script Streamlit : l'interface les soumet ici, les
+processus worker.py les exécutent et publient progression et résultat
+dans la table. Un rafraîchissement du navigateur ne perd plus rien : il
+suffit de relire le travail.
+"""
+
+import json
+from datetime import date, datetime
+
+import numpy as np
+import psycopg2.extras
+
+from connection import execute_query
+
+TYPES = ("generation", "conflits")
+STATUTS_ACTIFS = ("EN_ATTENTE", "EN_COURS")
+
+# Tout sauf resultat, qui peut peser plusieurs Mo (planning complet)
+JOB_COLUMNS = """
+    id, type, parametres, statut, progression, message, erreur, tentatives,
+    max_tentatives, worker, cree_par, created_at, started_at, heartbeat_at, finished_at
+"""
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Type non sérialisable en JSON : {type(value).__name__}")
+
+
+def to_json(value) -> psycopg2.extras.Json:
+    """Adaptateur JSONB : dates en ISO 8601, scalaires NumPy convertis"""
+    return psycopg2.extras.Json(value, dumps=lambda v: json.dumps(v, default=_json_default))
+
+
+def soumettre_job(type_job: str, parametres: dict = None, user_id: int = None):
+    """Met un travail en file ; retourne son id (None si l'insertion échoue)"""
+    if type_job not in TYPES:
+        raise ValueError(f"Type de travail inconnu : {type_job}")
+    rows = execute_query(
+        "INSERT INTO jobs (type, parametres, cree_par) VALUES (%s, %s, %s) RETURNING id",
+        (type_job, to_json(parametres or {}), user_id)
+    )
+    return rows[0]["id"] if rows else None
+
+
+def get_job(job_id: int, with_result: bool = False):
+    """Un travail (dict) ou None ; with_result=True lit aussi resultat"""
+    columns = JOB_COLUMNS + (", resultat" if with_result else "")
+    rows = execute_query(f"SELECT {columns} FROM jobs WHERE id = %s", (job_id,))
+    return dict(rows[0]) if rows else None
+
+
+def list_jobs(type_job: str = None, limit: int = 20) -> list:
+    """Travaux les plus récents, sans leur résultat"""
+    return [dict(r) for r in execute_query(f"""
+        SELECT {JOB_COLUMNS} FROM jobs
+        WHERE %(type)s::VARCHAR IS NULL OR type = %(type)s
+        ORDER BY id DESC
+        LIMIT %(limit)s
+    """, {"type": type_job, "limit": limit})]
+
+
+def annuler_job(job_id: int) -> bool:
+    """
+    Annule un travail en attente ou en cours ; le worker qui l'exécute
+    s'arrête à sa prochaine publication de progression
+    """
+    return execute_query("""
+        UPDATE jobs SET statut = 'ANNULE', finished_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND statut IN ('EN_ATTENTE', 'EN_COURS')
+    """, (job_id,), fetch=False) > 0
@@ -9,6 +9,10 @@ from vice_doyen import vice_doyen_dashboard
 from chef_departement import render_department_head_dashboard
 from etudiant import render_student_dashboard
 from professeur import render_professor_dashboard
+from view_refresher import start_view_refresher
+from audit_flusher import start_audit_flusher
+from query_cache import get_query_cache
+from change_feed import notification_badge
 
 st.set_page_config(
     page_title="🎓 Plateforme Examens Universitaires",
@@ -45,6 +49,24 @@ else:
     user = st.session_state.user
     role = st.session_state.role
 
+    # Vues matérialisées des tableaux de bord : un rafraîchisseur par processus
+    try:
+        start_view_refresher()
+    except Exception:
+        pass
+
+    # Audit : versement de file_audit dans audit_log, un thread par processus
+    try:
+        start_audit_flusher()
+    except Exception:
+        pass
+
+    # Cache des requêtes partagé : démarre l'écoute des notifications
+    try:
+        get_query_cache()
+    except Exception:
+        pass
+
     # Sidebar Premium
     with st.sidebar:
         st.markdown(
@@ -59,6 +81,12 @@ else:
         )
         st.write("")
 
+        # Non lues : compteur maintenu en base, relu quand une notification arrive
+        try:
+            notification_badge(role, user.get("linked_id"))
+        except Exception:
+            pass
+
         if st.button("🚪 Déconnexion", use_container_width=True):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
@@ -0,0 +1,139 @@
+"""
+migrate_partitions.py - Passage d'une base existante aux tables examens et
+inscriptions partitionnées par année (bdd.sql, PARTIE 21)
+    python migrate_partitions.py                  # migration, en une transaction
+    python migrate_partitions.py --dry-run        # même chose puis ROLLBACK
+    python migrate_partitions.py --archiver 2025  # fige une année passée
+bdd.sql commence par remettre le schéma à zéro : seule la PARTIE 21 en est
+extraite. Elle est idempotente (une base déjà migrée ne reçoit que les
+fonctions à jour) et prend un verrou exclusif sur examens et inscriptions
+le temps de la copie : à lancer application arrêtée.
+--archiver appelle archiver_annee() puis VACUUM (FREEZE, ANALYZE) sur les
+partitions figées, ce que la fonction ne peut pas faire elle-même.
+Identifiants : st.secrets["postgres"], comme l'application.
+"""
+
+import argparse
+import os
+import re
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+from connection import SimpleConnection
+
+PARTIE = 21
+TABLES = ("examens", "inscriptions")
+
+
+def extract_partie(path, numero):
+    """Texte de la PARTIE numero de bdd.sql, jusqu'à la PARTIE suivante"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    start = re.search(rf"^-- PARTIE {numero}:", text, re.MULTILINE)
+    if start is None:
+        raise ValueError(f"PARTIE {numero} absente de {path}")
+    end = re.search(r"^-- PARTIE \d+:", text[start.end():], re.MULTILINE)
+    return text[start.start():start.end() + end.start()] if end else text[start.start():]
+
+
+def table_state(cur):
+    """{table: (relkind, lignes, {partition: lignes})}"""
+    state = {}
+    for table in TABLES:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        relkind = cur.fetchone()[0]
+        cur.execute(
+            sql.SQL("SELECT tableoid::regclass::text, COUNT(*) FROM {} GROUP BY 1 ORDER BY 1").format(sql.Identifier(table))
+        )
+        partitions = dict(cur.fetchall())
+        state[table] = (relkind, sum(partitions.values()), partitions)
+    return state
+
+
+def migrate(path, dry_run=False, lock_timeout="10s"):
+    script = extract_partie(path, PARTIE)
+    conn = SimpleConnection.connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET lock_timeout = %s", (lock_timeout,))
+            # Avertissements seulement (chevauchements empêchant une exclusion...)
+            cur.execute("SET client_min_messages = warning")
+            before = table_state(cur)
+            for table, (relkind, count, _) in before.items():
+                kind = "partitionnée" if relkind == "p" else "non partitionnée"
+                print(f"{table} : {count:,} ligne(s), {kind}", flush=True)
+
+            started = time.perf_counter()
+            cur.execute(script)
+            elapsed = time.perf_counter() - started
+            for notice in conn.notices:
+                print(notice.strip())
+
+            after = table_state(cur)
+
+        errors = []
+        for table, (relkind, count, partitions) in after.items():
+            print(f"\n{table} : {count:,} ligne(s)")
+            for partition, rows in partitions.items():
+                print(f"    {partition:<28} {rows:>10,}")
+            if relkind != "p":
+                errors.append(f"{table} n'est pas partitionnée")
+            if count != before[table][1]:
+                errors.append(f"{table} : {before[table][1]:,} ligne(s) avant, {count:,} après")
+
+        if errors or dry_run:
+            conn.rollback()
+            for error in errors:
+                print(f"❌ {error}")
+            print(f"\nPARTIE {PARTIE} exécutée en {elapsed:.1f}s, annulée (ROLLBACK)")
+            return not errors
+        conn.commit()
+        print(f"\n✅ PARTIE {PARTIE} appliquée en {elapsed:.1f}s")
+        return True
+    finally:
+        conn.close()
+
+
+def archive(annee):
+    conn = SimpleConnection.connect()
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            cur.execute("SELECT partition, lignes FROM archiver_annee(%s)", (annee,))
+            partitions = cur.fetchall()
+        conn.commit()
+        print(f"✅ Année {annee} archivée en {time.perf_counter() - started:.1f}s")
+
+        # VACUUM hors transaction
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for partition, rows in partitions:
+                cur.execute(sql.SQL("VACUUM (FREEZE, ANALYZE) {}").format(sql.Identifier(partition)))
+                print(f"    {partition:<28} {rows:>10,} ligne(s), figée")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sql", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bdd.sql"))
+    parser.add_argument("--dry-run", action="store_true", help="exécute puis annule (ROLLBACK)")
+    parser.add_argument("--lock-timeout", default="10s", help="attente maximale des verrous (application active)")
+    parser.add_argument("--archiver", type=int, metavar="ANNEE", help="fige une année passée au lieu de migrer")
+    args = parser.parse_args()
+
+    try:
+        if args.archiver is not None:
+            archive(args.archiver)
+        elif not migrate(args.sql, dry_run=args.dry_run, lock_timeout=args.lock_timeout):
+            raise SystemExit(1)
+    except psycopg2.Error as e:
+        # Transaction annulée : la base est inchangée
+        print(f"❌ {e.pgerror or e}".strip())
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
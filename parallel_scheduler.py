@@ -0,0 +1,181 @@
+"""
+parallel_scheduler.py - Génération du planning sur plusieurs processus
+1. découpage en groupes faiblement couplés : composantes connexes du graphe
+   des étudiants communs, ou départements si une composante domine
+2. K redémarrages (ordre et graine différents) par groupe dans un
+   ProcessPoolExecutor ; le meilleur coût de chaque groupe est conservé
+3. fusion : ExamScheduleOptimizer.adopt_schedule replace les examens en
+   conflit entre groupes (salles, professeurs, étudiants partagés)
+Aucun appel Streamlit dans les processus de calcul.
+"""
+
+import multiprocessing
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from admin_examens import ExamScheduleOptimizer
+from scheduling import ConflictGraph, balanced_bins, connected_components
+
+# Au-delà de cette part des modules, une composante est trop grosse pour
+# paralléliser : on découpe par département
+COMPOSANTE_DOMINANTE = 0.5
+
+
+def partition_modules(modules, n_groups: int, mode: str = "auto"):
+    """
+    Regroupe les modules en au plus n_groups lots équilibrés.
+    mode : "composantes", "departements" ou "auto"
+    """
+    if mode not in ("auto", "composantes", "departements"):
+        raise ValueError(f"Découpage inconnu : {mode}")
+
+    units = []
+    if mode in ("auto", "composantes"):
+        graph = ConflictGraph.from_student_lists([m.get('student_ids') or [] for m in modules])
+        by_label = defaultdict(list)
+        for module, label in zip(modules, connected_components(graph).tolist()):
+            by_label[label].append(module)
+        units = list(by_label.values())
+
+        largest = max((len(u) for u in units), default=0)
+        if mode == "auto" and largest > COMPOSANTE_DOMINANTE * len(modules):
+            units = []
+
+    if not units:
+        by_dept = defaultdict(list)
+        for module in modules:
+            by_dept[module.get('departement_id')].append(module)
+        units = list(by_dept.values())
+
+    bins = balanced_bins([len(u) for u in units], n_groups)
+    return [[m for i in b for m in units[i]] for b in bins]
+
+
+def split_rooms(rooms, groups):
+    """
+    Partage les salles entre groupes pour éviter qu'ils se les disputent :
+    d'abord une salle assez grande pour le plus gros module de chaque groupe,
+    puis le reste au groupe le plus loin de sa part de capacité (au prorata
+    étudiants x durée).
+    """
+    remaining = sorted(rooms, key=lambda r: r.get('capacite', 0), reverse=True)
+    demand = [sum(m.get('student_count', 0) * m.get('duration_minutes', 120) for m in g) for g in groups]
+    total_demand = sum(demand) or 1
+    total_capacity = sum(r.get('capacite', 0) for r in remaining)
+    target = [total_capacity * d / total_demand for d in demand]
+
+    shares = [[] for _ in groups]
+    assigned = [0] * len(groups)
+
+    largest_module = [max((m.get('student_count', 0) for m in g), default=0) for g in groups]
+    for g in sorted(range(len(groups)), key=lambda g: -largest_module[g]):
+        fitting = [r for r in remaining if r.get('capacite', 0) >= largest_module[g]]
+        if fitting:
+            room = fitting[-1]
+            remaining.remove(room)
+            shares[g].append(room)
+            assigned[g] += room.get('capacite', 0)
+
+    for room in remaining:
+        g = max(range(len(groups)), key=lambda g: target[g] - assigned[g])
+        shares[g].append(room)
+        assigned[g] += room.get('capacite', 0)
+
+    return shares
+
+
+def _solve_group(task):
+    """Exécuté dans un processus de calcul : un groupe, un redémarrage"""
+    (group, restart, modules, rooms, existing_exams, start_date, end_date,
+     department_id, engine, budget_seconds, seed) = task
+    started = time.process_time()
+
+    if restart:
+        # Ordre différent à priorité égale -> autre coloration
+        modules = list(modules)
+        random.Random(seed).shuffle(modules)
+
+    optimizer = ExamScheduleOptimizer(start_date, end_date, department_id, engine=engine)
+    optimizer.modules_data = modules
+    optimizer.rooms = rooms
+    optimizer.professors = []
+    optimizer.existing_exams = existing_exams
+
+    optimizer.build_schedule()
+    if budget_seconds > 0:
+        optimizer.improve_schedule(budget_seconds, seed=seed)
+        cost = optimizer.search.best_cost
+    else:
+        cost = optimizer.schedule_cost()
+
+    return group, restart, cost, optimizer.generated_schedule, time.process_time() - started
+
+
+def generate_parallel(modules, rooms, start_date, end_date, department_id=None,
+                      existing_exams=None, engine="coloration", partition="auto", restarts=4,
+                      budget_seconds=0.0, max_workers=None, seed=0, on_progress=None):
+    """
+    Planning complet calculé en parallèle ; retourne un ExamScheduleOptimizer
+    fusionné (generated_schedule, conflicts, save_schedule...) et renseigne
+    optimizer.parallel_stats.
+    existing_exams : examens déjà en base (cf. ExamScheduleOptimizer.load_data),
+    réservés dans chaque groupe.
+    on_progress(tâches terminées, total) est appelé dans le processus appelant.
+    """
+    started = time.perf_counter()
+    workers = max_workers or os.cpu_count() or 1
+
+    groups = partition_modules(modules, workers, partition)
+    room_shares = split_rooms(rooms, groups)
+
+    tasks = [
+        (g, k, groups[g], room_shares[g], existing_exams or [], start_date, end_date,
+         department_id, engine, budget_seconds, seed * 1000 + g * 100 + k)
+        for g in range(len(groups))
+        for k in range(max(1, restarts))
+    ]
+
+    best = {}
+    task_time = 0.0
+
+    def collect(result, done):
+        nonlocal task_time
+        group, _, cost, schedule, elapsed = result
+        task_time += elapsed
+        if group not in best or cost < best[group][0]:
+            best[group] = (cost, schedule)
+        if on_progress:
+            on_progress(done, len(tasks))
+
+    if workers == 1:
+        for done, task in enumerate(tasks, 1):
+            collect(_solve_group(task), done)
+    else:
+        # "spawn" : pas de fork du serveur Streamlit et de ses threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_solve_group, task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                collect(future.result(), done)
+
+    solved = time.perf_counter()
+
+    optimizer = ExamScheduleOptimizer(start_date, end_date, department_id, engine=engine)
+    optimizer.modules_data = modules
+    optimizer.rooms = rooms
+    optimizer.professors = []
+    optimizer.existing_exams = existing_exams or []
+    optimizer.adopt_schedule([e for _, schedule in best.values() for e in schedule])
+
+    optimizer.parallel_stats = {
+        'workers': workers,
+        'groups': len(groups),
+        'tasks': len(tasks),
+        'task_time': task_time,  # temps CPU cumulé des tâches
+        'solve_time': solved - started,
+        'merge_time': time.perf_counter() - solved,
+        'repaired': optimizer.repaired,
+    }
+    return optimizer
@@ -6,7 +6,8 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta, date
-from connection import execute_query, load_dataframe
+from connection import execute_query, load_columns
+from change_feed import subscribe_session, live_data, live_updates, mark_changed
 
 # ========== CONSTANTES DU PROJET ==========
 PROJECT_CONSTRAINTS = {
@@ -73,10 +74,12 @@ def safe_date(value, default=None):
 
 # ========== FONCTIONS UTILITAIRES ==========
 
-def get_professor_dashboard_data(prof_id: int):
+def get_professor_dashboard_data(prof_id: int, exam_ids=None, readonly=True):
     """
     Récupère les données principales pour le dashboard du professeur
     Version sécurisée avec COALESCE
+    exam_ids : seulement ces examens, lus sur le primaire (flux des changements)
+    readonly=False : tout relire sur le primaire (rechargement dû au flux)
     """
     query = """
     SELECT 
@@ -107,12 +110,27 @@ def get_professor_dashboard_data(prof_id: int):
     WHERE e.professeur_id = %s
         AND e.date_heure >= CURRENT_DATE
         AND e.statut IN ('Planifie', 'Confirme')
+        {filtre_examens}
     GROUP BY e.id, e.date_heure, e.duree_minutes, e.statut, 
              m.nom, m.code, f.nom, f.code, l.nom, l.capacite, 
              l.type, l.batiment, p.nom, p.prenom, d.nom
     ORDER BY e.date_heure
     """
-    return execute_query(query, (prof_id,))
+    if exam_ids is None:
+        return execute_query(query.format(filtre_examens=""), (prof_id,), readonly=readonly)
+    return execute_query(query.format(filtre_examens="AND e.id = ANY(%s)"), (prof_id, list(exam_ids)))
+
+def patch_professor_exams(prof_id: int, exams_data, changes: dict):
+    """
+    Examens du professeur mis à jour pour les seuls examens signalés :
+    relus, remplacés ou retirés (réattribués, annulés)
+    """
+    exam_ids = changes.get('examens')
+    if not exam_ids:
+        return exams_data
+    kept = [exam for exam in (exams_data or []) if exam.get('exam_id') not in exam_ids]
+    fresh = get_professor_dashboard_data(prof_id, exam_ids) or []
+    return sorted(kept + list(fresh), key=lambda exam: exam['date_heure'])
 
 def check_professor_constraints(prof_id: int):
     """
@@ -127,12 +145,12 @@ def check_professor_constraints(prof_id: int):
     FROM examens
     WHERE professeur_id = %s
         AND statut IN ('planifie', 'confirme')
-        AND DATE(date_heure) >= CURRENT_DATE
+        AND date_heure >= CURRENT_DATE
     GROUP BY DATE(date_heure)
     HAVING COUNT(*) > 3
     """
     
-    violations = execute_query(query, (prof_id,))
+    violations = execute_query(query, (prof_id,), readonly=True)
     if violations:
         for v in violations:
             nb_examens = safe_int(v.get('nb_examens'), 0)
@@ -164,7 +182,7 @@ def check_professor_constraints(prof_id: int):
     SELECT * FROM stats_departement WHERE id = %s
     """
     
-    stats = execute_query(query, (prof_id, prof_id))
+    stats = execute_query(query, (prof_id, prof_id), readonly=True)
     if stats:
         stats = stats[0]
         nb_examens = safe_int(stats.get('nb_examens'), 0)
@@ -202,13 +220,13 @@ def get_professor_workload_stats(prof_id: int, start_date: date = None, end_date
     JOIN modules m ON e.module_id = m.id
     JOIN formations f ON m.formation_id = f.id
     WHERE e.professeur_id = %s
-        AND e.date_heure::date BETWEEN %s AND %s
-        AND e.statut IN ('planifie', 'confirme')
+        AND e.date_heure >= %s AND e.date_heure < %s::DATE + 1
+        AND e.statut IN ('Planifie', 'Confirme')
     GROUP BY DATE(e.date_heure)
     ORDER BY jour
     """
     
-    return load_dataframe(query, (prof_id, start_date, end_date))
+    return load_columns(query, (prof_id, start_date, end_date), readonly=True)
 
 def get_department_exams(prof_id: int):
     """
@@ -239,7 +257,7 @@ def get_department_exams(prof_id: int):
     LIMIT 50
     """
     
-    return execute_query(query, (prof_id,))
+    return execute_query(query, (prof_id,), readonly=True)
 
 def format_date(date_value):
     """Formate une date de manière sécurisée"""
@@ -293,8 +311,15 @@ def render_professor_dashboard():
         # Dashboard principal
         st.subheader("📊 Vue d'ensemble des surveillances")
         
-        # Récupérer les données
-        exams_data = get_professor_dashboard_data(prof_id)
+        # Récupérer les données : chargées une fois, puis mises à jour
+        # ligne à ligne quand un de ses examens change
+        subscription = subscribe_session("professeur", ("examens",), [f"p:{prof_id}"])
+        exams_data = live_data(
+            "professeur", subscription,
+            load=lambda readonly: get_professor_dashboard_data(prof_id, readonly=readonly),
+            patch=lambda data, changes: patch_professor_exams(prof_id, data, changes),
+        )
+        live_updates(subscription)
         constraints = check_professor_constraints(prof_id)
         
         # KPI Cards - SÉCURISÉES
@@ -437,6 +462,7 @@ def render_my_exams(prof_id: int, exams_data):
                         (exam_id,), 
                         fetch=False
                     )
+                    mark_changed("professeur", "examens", [exam_id])
                     st.success("Disponibilité confirmée")
                     st.rerun()
     
@@ -2,58 +2,64 @@
 Toutes les requêtes SQL organisées par module et optimisées
 VERSION CORRIGÉE - Problèmes d'authentification résolus
 """
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union, Tuple
 import pandas as pd
-from datetime import datetime, date
-from connection import execute_query, load_dataframe
+from datetime import datetime, date, timedelta
+import io
+from connection import execute_query, load_dataframe, load_columns, iter_dataframes, copy_csv, write_parquet
+from query_cache import cached_query, invalidate_cache
 
 
 class ExamQueries:
     """Requêtes liées aux examens"""
     
     @staticmethod
-    def get_student_exams(student_id: int, start_date: date = None, end_date: date = None) -> List[Dict]:
+    def get_student_exams(student_id: int, start_date: date = None, end_date: date = None,
+                          exam_ids: List[int] = None, readonly: bool = True) -> List[Dict]:
         """
-        Récupère les examens d'un étudiant
-        Note : statut avec accents ('Planifié', 'Confirmé') pour correspondre à la base
+        Récupère les examens actifs d'un étudiant (bornes incluses, au jour près)
+        Lecture de student_timetable, tenue à jour par triggers (bdd.sql, PARTIE 14)
+        exam_ids : seulement ces examens, lus sur le primaire (lignes signalées
+        par le flux des changements, pas encore sur un réplica)
+        readonly=False : tout relire sur le primaire (rechargement dû au flux)
         """
         query = """
         SELECT 
-            e.id,
-            e.uuid,
-            m.code as module_code,
-            m.nom as module_nom,
-            f.nom as formation_nom,
-            d.nom as departement_nom,
-            CONCAT(p.nom, ' ', p.prenom) as professeur_nom,
-            l.nom as salle_nom,
-            l.type as salle_type,
-            l.batiment,
-            l.capacite,
-            e.date_heure,
-            e.duree_minutes,
-            e.date_heure + (e.duree_minutes || ' minutes')::INTERVAL as date_fin,
-            e.type_examen,
-            e.statut,
-            COUNT(i.etudiant_id) as nb_etudiants_inscrits,
-            ROUND((COUNT(i.etudiant_id)::DECIMAL / l.capacite) * 100, 2) as taux_occupation
-        FROM examens e
-        JOIN modules m ON e.module_id = m.id
-        JOIN formations f ON m.formation_id = f.id
-        JOIN departements d ON f.departement_id = d.id
-        JOIN professeurs p ON e.professeur_id = p.id
-        JOIN lieux_examen l ON e.salle_id = l.id
-        JOIN inscriptions i ON e.module_id = i.module_id AND i.statut = 'Inscrit'
-        WHERE i.etudiant_id = %s
-            AND e.statut IN ('Planifié', 'Confirmé')
-            AND (%s IS NULL OR e.date_heure >= %s)
-            AND (%s IS NULL OR e.date_heure <= %s)
-        GROUP BY e.id, e.uuid, m.code, m.nom, f.nom, d.nom, p.nom, p.prenom, 
-                 l.nom, l.type, l.batiment, l.capacite, e.date_heure, 
-                 e.duree_minutes, e.type_examen, e.statut
-        ORDER BY e.date_heure
-        """
-        return execute_query(query, (student_id, start_date, start_date, end_date, end_date)) or []
+            examen_id as id,
+            module_id,
+            module_code,
+            module_nom,
+            formation_nom,
+            departement_nom,
+            professeur_nom,
+            salle_nom,
+            salle_type,
+            batiment,
+            capacite,
+            date_heure,
+            duree_minutes,
+            date_fin,
+            type_examen,
+            statut
+        FROM student_timetable
+        WHERE etudiant_id = %s
+        """
+        params = [student_id]
+        
+        if start_date:
+            query += " AND date_heure >= %s"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND date_heure < %s"
+            params.append(end_date + timedelta(days=1))
+        
+        if exam_ids is not None:
+            query += " AND examen_id = ANY(%s)"
+            params.append(list(exam_ids))
+        
+        query += " ORDER BY date_heure"
+        return execute_query(query, tuple(params), readonly=readonly and exam_ids is None) or []
     
     @staticmethod
     def get_professor_exams(professor_id: int, days_ahead: int = 30) -> pd.DataFrame:
@@ -79,6 +85,7 @@ class ExamQueries:
             JOIN formations f ON m.formation_id = f.id
             JOIN lieux_examen l ON e.salle_id = l.id
             LEFT JOIN inscriptions i ON e.module_id = i.module_id AND i.statut = 'Inscrit'
+                AND i.annee_academique >= premiere_annee_active()
             WHERE e.professeur_id = %s
                 AND e.date_heure BETWEEN CURRENT_TIMESTAMP AND CURRENT_TIMESTAMP + %s * INTERVAL '1 day'
                 AND e.statut IN ('Planifié', 'Confirmé')
@@ -86,7 +93,7 @@ class ExamQueries:
                      e.duree_minutes, e.type_examen, e.statut
             ORDER BY e.date_heure
         """
-        result = execute_query(query, (professor_id, days_ahead))
+        result = execute_query(query, (professor_id, days_ahead), readonly=True)
         if result:
             df = pd.DataFrame(result)
             if not df.empty and 'date_heure' in df.columns:
@@ -127,6 +134,7 @@ class ExamQueries:
             JOIN professeurs p ON e.professeur_id = p.id
             JOIN lieux_examen l ON e.salle_id = l.id
             LEFT JOIN inscriptions i ON e.module_id = i.module_id AND i.statut = 'Inscrit'
+                AND i.annee_academique >= premiere_annee_active()
             WHERE f.departement_id = %s
                 AND e.date_heure >= %s
                 AND e.date_heure <= %s
@@ -136,7 +144,7 @@ class ExamQueries:
                      e.duree_minutes, e.type_examen, e.statut
             ORDER BY e.date_heure, f.nom
         """
-        result = load_dataframe(query, (department_id, start_date, end_date))
+        result = load_dataframe(query, (department_id, start_date, end_date), readonly=True)
         return result if not result.empty else pd.DataFrame()
     
     @staticmethod
@@ -157,7 +165,7 @@ class ExamQueries:
             JOIN departements d ON p.departement_id = d.id
             WHERE p.id = %s
         """
-        result = execute_query(query, (professor_id,))
+        result = execute_query(query, (professor_id,), readonly=True)
         return result[0] if result else {}
     
     @staticmethod
@@ -178,7 +186,7 @@ class ExamQueries:
             WHERE m.responsable_id = %s
             ORDER BY m.semestre, m.code
         """
-        result = execute_query(query, (professor_id,))
+        result = execute_query(query, (professor_id,), readonly=True)
         return pd.DataFrame(result) if result else pd.DataFrame()
 
 
@@ -201,54 +209,25 @@ class AnalyticsQueries:
                 capacite_moyenne_salles,
                 dernier_examen,
                 premier_examen
-            FROM v_stats_departement
+            FROM mv_stats_departement
             WHERE departement_id = %s
         """
-        result = execute_query(query, (department_id,))
+        result = execute_query(query, (department_id,), readonly=True)
         return result[0] if result else {}
     
     @staticmethod
-    def get_conflicts_report(department_id: int) -> pd.DataFrame:
+    def get_conflicts_report(department_id: int = None, formation_id: int = None,
+                             start_date: date = None, end_date: date = None,
+                             readonly: bool = True) -> pd.DataFrame:
         """
-        Génère un rapport détaillé des conflits pour un département
-        Note: La fonction detecter_conflits() retourne tous les conflits.
-        Pour filtrer par département, on vérifie si le département est mentionné dans les détails.
+        Conflits d'un département (ou d'une formation, d'une période) : le
+        filtre est appliqué en base par detecter_conflits_filtre(), qui ne lit
+        que les conflits touchant un examen du périmètre.
+        Colonnes : type_conflit, severite, entite, entite_id, jour, examens_ids, nb
+        readonly=False : lecture sur le primaire (analyse relancée par le flux)
         """
-        # Récupérer tous les conflits puis filtrer manuellement par département
-        query = """
-            SELECT 
-                type_conflit,
-                details,
-                severite,
-                COUNT(*) as nombre
-            FROM detecter_conflits()
-            GROUP BY type_conflit, details, severite
-            ORDER BY 
-                CASE severite 
-                    WHEN 'CRITIQUE' THEN 1
-                    WHEN 'ÉLEVÉ' THEN 2
-                    WHEN 'MOYEN' THEN 3
-                    ELSE 4
-                END,
-                nombre DESC
-        """
-        result = load_dataframe(query)
-        if not result.empty and department_id and 'details' in result.columns:
-            # Filtrer par département si spécifié (recherche dans les détails)
-            try:
-                dept_query = """
-                    SELECT nom FROM departements WHERE id = %s
-                """
-                dept_result = execute_query(dept_query, (department_id,))
-                if dept_result:
-                    dept_nom = dept_result[0].get('nom', '')
-                    if dept_nom:
-                        # Filtrer les lignes qui mentionnent le département dans les détails
-                        result = result[result['details'].astype(str).str.contains(dept_nom, case=False, na=False)]
-            except Exception:
-                # Si erreur lors du filtrage, retourner tous les conflits
-                pass
-        return result if not result.empty else pd.DataFrame()
+        query = "SELECT * FROM detecter_conflits_filtre(%s, %s, %s, %s)"
+        return load_dataframe(query, (department_id, formation_id, start_date, end_date), readonly=readonly)
     
     @staticmethod
     def get_resource_utilization(start_date: date, end_date: date) -> pd.DataFrame:
@@ -265,20 +244,22 @@ class AnalyticsQueries:
                 COALESCE(ROUND(AVG(
                     (SELECT COUNT(DISTINCT i.etudiant_id) 
                      FROM inscriptions i 
-                     WHERE i.module_id = e.module_id AND i.statut = 'Inscrit')::DECIMAL / l.capacite * 100
+                     WHERE i.module_id = e.module_id AND i.statut = 'Inscrit'
+                       AND i.annee_academique >= premiere_annee_active())::DECIMAL / l.capacite * 100
                 ), 2), 0) as taux_occupation_moyen,
                 ROUND(COUNT(e.id) * 100.0 / 
                     NULLIF((SELECT COUNT(*) FROM examens 
                      WHERE date_heure BETWEEN %s AND %s 
-                     AND statut IN ('Planifié', 'Confirmé')), 0), 2) as pourcentage_utilisation
+                     AND statut IN ('Planifie', 'Confirme')), 0), 2) as pourcentage_utilisation
             FROM lieux_examen l
             LEFT JOIN examens e ON l.id = e.salle_id 
                 AND e.date_heure BETWEEN %s AND %s
-                AND e.statut IN ('Planifié', 'Confirmé')
+                AND e.statut IN ('Planifie', 'Confirme')
             GROUP BY l.id, l.nom, l.type, l.capacite
             ORDER BY pourcentage_utilisation DESC NULLS LAST
         """
-        result = load_dataframe(query, (start_date, end_date, start_date, end_date))
+        result = load_columns(query, (start_date, end_date, start_date, end_date),
+                              categorical=("salle_type",), readonly=True)
         return result if not result.empty else pd.DataFrame()
     
     @staticmethod
@@ -295,7 +276,8 @@ class AnalyticsQueries:
                     (SELECT COUNT(*) 
                      FROM inscriptions i2 
                      WHERE i2.module_id = e.module_id 
-                     AND i2.statut = 'Inscrit')
+                     AND i2.statut = 'Inscrit'
+                     AND i2.annee_academique >= premiere_annee_active())
                 ), 2) as moyenne_etudiants_par_examen,
                 CASE 
                     WHEN COUNT(DISTINCT i.etudiant_id) > 1000 THEN 'Surcharge'
@@ -306,16 +288,30 @@ class AnalyticsQueries:
             JOIN modules m ON e.module_id = m.id
             JOIN formations f ON m.formation_id = f.id
             JOIN inscriptions i ON e.module_id = i.module_id AND i.statut = 'Inscrit'
+                AND i.annee_academique >= premiere_annee_active()
             WHERE f.departement_id = %s
                 AND e.date_heure >= CURRENT_DATE
-                AND e.statut IN ('Planifié', 'Confirmé')
+                AND e.statut IN ('Planifie', 'Confirme')
             GROUP BY DATE(e.date_heure)
             ORDER BY jour
         """
-        result = load_dataframe(query, (department_id,))
+        result = load_columns(query, (department_id,), categorical=("niveau_charge",), readonly=True)
         return result if not result.empty else pd.DataFrame()
 
 
+# Conflits du planning, les plus graves d'abord (aussi lu par worker.py)
+CONFLITS_QUERY = """
+    SELECT * FROM detecter_conflits() 
+    ORDER BY 
+        CASE severite 
+            WHEN 'CRITIQUE' THEN 1
+            WHEN 'ÉLEVÉ' THEN 2
+            WHEN 'MOYEN' THEN 3
+            ELSE 4
+        END
+"""
+
+
 class OptimizationQueries:
     """Requêtes pour l'optimisation automatique"""
     
@@ -346,23 +342,14 @@ class OptimizationQueries:
    
     
     @staticmethod
+    @cached_query("conflits_actifs")
     def detect_all_conflicts() -> pd.DataFrame:
         """
         Détecte tous les conflits dans le planning actuel
         VERSION CORRIGÉE - Retourne toujours un DataFrame
         """
         try:
-            query = """
-                SELECT * FROM detecter_conflits() 
-                ORDER BY 
-                    CASE severite 
-                        WHEN 'CRITIQUE' THEN 1
-                        WHEN 'ÉLEVÉ' THEN 2
-                        WHEN 'MOYEN' THEN 3
-                        ELSE 4
-                    END
-            """
-            result = load_dataframe(query)
+            result = load_dataframe(CONFLITS_QUERY)
             
             # Assurer que nous retournons toujours un DataFrame
             if result is None:
@@ -390,7 +377,7 @@ class OptimizationQueries:
             AND NOT EXISTS (
                 SELECT 1 FROM examens e
                 WHERE e.salle_id = l.id
-                AND DATE(e.date_heure) = %s
+                AND e.date_heure >= %s::DATE AND e.date_heure < %s::DATE + 1
                 AND e.statut IN ('Planifié', 'Confirmé')
             )
             ORDER BY l.capacite DESC
@@ -405,13 +392,13 @@ class OptimizationQueries:
                 SELECT COUNT(*)
                 FROM examens e
                 WHERE e.professeur_id = p.id
-                AND DATE(e.date_heure) = %s
+                AND e.date_heure >= %s::DATE AND e.date_heure < %s::DATE + 1
             ) < 3
             ORDER BY p.nom
         """
         
-        rooms = execute_query(rooms_query, (date_filter,)) or []
-        profs = execute_query(profs_query, (date_filter,)) or []
+        rooms = execute_query(rooms_query, (date_filter, date_filter)) or []
+        profs = execute_query(profs_query, (date_filter, date_filter)) or []
         
         return {
             'salles_disponibles': rooms,
@@ -507,6 +494,7 @@ class UserQueries:
                 JOIN formations f ON e.formation_id = f.id
                 JOIN departements d ON f.departement_id = d.id
                 LEFT JOIN inscriptions i ON e.id = i.etudiant_id AND i.statut = 'Inscrit'
+                    AND i.annee_academique >= premiere_annee_active()
                 LEFT JOIN examens ex ON i.module_id = ex.module_id 
                     AND ex.date_heure > CURRENT_TIMESTAMP
                     AND ex.statut IN ('Planifié', 'Confirmé')
@@ -624,21 +612,24 @@ class UserQueries:
     @staticmethod
     def get_notifications(user_id: int, user_role: str, limit: int = 10) -> List[Dict]:
         """
-        Récupère les notifications de l'utilisateur
+        Récupère les notifications remises à l'utilisateur (personnelles et
+        diffusions de son rôle)
         """
         try:
             query = """
                 SELECT 
-                    id,
-                    type_notification,
-                    titre,
-                    contenu,
-                    is_lu,
-                    created_at,
-                    priority
-                FROM notifications
-                WHERE user_id = %s OR user_role = %s
-                ORDER BY priority DESC, created_at DESC
+                    n.id,
+                    n.type_notification,
+                    n.titre,
+                    n.contenu,
+                    d.is_lu,
+                    d.created_at,
+                    n.priority
+                FROM notifications_destinataires d
+                JOIN notifications n ON n.id = d.notification_id
+                WHERE d.user_id = %s AND d.user_role = %s
+                    AND (n.expires_at IS NULL OR n.expires_at > CURRENT_TIMESTAMP)
+                ORDER BY d.is_lu, n.priority DESC, d.created_at DESC
                 LIMIT %s
             """
             return execute_query(query, (user_id, user_role, limit)) or []
@@ -647,22 +638,44 @@ class UserQueries:
             return []
     
     @staticmethod
-    def mark_notification_as_read(notification_id: int) -> int:
+    def mark_notification_as_read(notification_id: int, user_id: int, user_role: str) -> int:
         """
-        Marque une notification comme lue
+        Marque une notification comme lue pour cet utilisateur seulement
         """
         try:
-            query = "UPDATE notifications SET is_lu = TRUE WHERE id = %s"
-            return execute_query(query, (notification_id,), fetch=False)
+            query = """
+                UPDATE notifications_destinataires
+                SET is_lu = TRUE, lu_at = CURRENT_TIMESTAMP
+                WHERE notification_id = %s AND user_id = %s AND user_role = %s
+                    AND NOT is_lu
+            """
+            return execute_query(query, (notification_id, user_id, user_role), fetch=False)
         except Exception as e:
             print(f"Erreur dans mark_notification_as_read: {e}")
             return 0
     
+    @staticmethod
+    def mark_all_notifications_as_read(user_id: int, user_role: str) -> int:
+        """
+        Marque toutes les notifications de l'utilisateur comme lues
+        """
+        try:
+            query = """
+                UPDATE notifications_destinataires
+                SET is_lu = TRUE, lu_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND user_role = %s AND NOT is_lu
+            """
+            return execute_query(query, (user_id, user_role), fetch=False)
+        except Exception as e:
+            print(f"Erreur dans mark_all_notifications_as_read: {e}")
+            return 0
+    
     @staticmethod
     def add_notification(user_id: int, user_role: str, type_notif: str, 
                         titre: str, contenu: str, priority: int = 1) -> List:
         """
-        Ajoute une nouvelle notification
+        Ajoute une nouvelle notification ; user_id None la diffuse à tout le
+        rôle (remise par le trigger trg_distribuer_notifications)
         """
         try:
             query = """
@@ -677,18 +690,43 @@ class UserQueries:
             print(f"Erreur dans add_notification: {e}")
             return []
     
+    @staticmethod
+    def notify_role(user_role: str, type_notif: str, titre: str, contenu: str,
+                    priority: int = 1, expires_at: datetime = None) -> Optional[int]:
+        """
+        Diffuse une notification à tous les comptes actifs d'un rôle
+        (un seul INSERT ... SELECT côté base) ; retourne son id
+        """
+        try:
+            result = execute_query(
+                "SELECT notifier_role(%s, %s, %s, %s, %s, %s) AS id",
+                (user_role, type_notif, titre, contenu, priority, expires_at)
+            )
+            return result[0]['id'] if result else None
+        except Exception as e:
+            print(f"Erreur dans notify_role: {e}")
+            return None
+    
     @staticmethod
     def get_unread_notifications_count(user_id: int, user_role: str) -> int:
         """
-        Compte les notifications non lues
+        Nombre de notifications non lues, lu dans le compteur maintenu par
+        les triggers (notifications_non_lues), moins les non lues déjà
+        expirées : get_notifications les masque, la purge ne les retire du
+        compteur qu'au prochain entretien
         """
         try:
             query = """
-                SELECT COUNT(*) as count
-                FROM notifications
-                WHERE (user_id = %s OR user_role = %s)
-                    AND is_lu = FALSE
-                    AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
+                SELECT GREATEST(c.nb - (
+                    SELECT COUNT(*)
+                    FROM notifications_destinataires d
+                    JOIN notifications n ON n.id = d.notification_id
+                    WHERE d.user_id = c.user_id AND d.user_role = c.user_role
+                        AND NOT d.is_lu
+                        AND n.expires_at <= CURRENT_TIMESTAMP
+                ), 0) as count
+                FROM notifications_non_lues c
+                WHERE c.user_id = %s AND c.user_role = %s
             """
             result = execute_query(query, (user_id, user_role))
             return result[0]['count'] if result else 0
@@ -725,9 +763,10 @@ class UserQueries:
             return []
 
 
-def get_recent_audit_logs(limit: int = 50) -> List[Dict]:
+def get_recent_audit_logs(limit: int = 50, days: int = 30) -> List[Dict]:
     """
-    Récupère les logs d'audit récents
+    Récupère les logs d'audit récents (des `days` derniers jours : seules
+    les partitions mensuelles de la période sont lues)
     """
     query = """
     SELECT 
@@ -739,16 +778,18 @@ def get_recent_audit_logs(limit: int = 50) -> List[Dict]:
         TO_CHAR(changed_at, 'DD/MM/YYYY HH24:MI:SS') as date_heure,
         ip_address
     FROM audit_log 
+    WHERE changed_at >= LOCALTIMESTAMP - %s * INTERVAL '1 day'
     ORDER BY changed_at DESC
     LIMIT %s
     """
-    return execute_query(query, (limit,))
+    return execute_query(query, (days, limit), readonly=True)
 
 
 def get_audit_stats(start_date: date = None, end_date: date = None) -> List[Dict]:
     """
     Récupère les statistiques d'audit
     """
+    # Bornes toujours présentes (COALESCE) : élagage des partitions hors période
     query = """
     SELECT 
         table_name,
@@ -756,19 +797,57 @@ def get_audit_stats(start_date: date = None, end_date: date = None) -> List[Dict
         COUNT(*) as count,
         MAX(changed_at) as last_date
     FROM audit_log 
-    WHERE (%s IS NULL OR changed_at >= %s)
-      AND (%s IS NULL OR changed_at <= %s)
+    WHERE changed_at >= COALESCE(%s::TIMESTAMP, '-infinity')
+      AND changed_at <= COALESCE(%s::TIMESTAMP, 'infinity')
     GROUP BY table_name, action
     ORDER BY count DESC
     """
-    return execute_query(query, (start_date, start_date, end_date, end_date))
+    return execute_query(query, (start_date, end_date), readonly=True)
+
+
+def fetch_kpis(kpis: Dict[str, Union[str, Tuple[str, tuple]]],
+               defaults: Dict[str, Any] = None, readonly: bool = True) -> Dict[str, Any]:
+    """
+    Calcule plusieurs KPIs scalaires en un seul aller-retour
+    kpis : {nom: sql} ou {nom: (sql, params)} - chaque requête renvoie une seule valeur
+    Les requêtes sont combinées en un unique SELECT de sous-requêtes scalaires.
+    Retourne {nom: valeur}, avec defaults[nom] (ou 0) si NULL ou en cas d'erreur.
+    readonly : lecture servie par un réplica si disponible (cf. connection.ReplicaRouter)
+    """
+    defaults = defaults or {}
+    if not kpis:
+        return {}
+
+    columns = []
+    params = []
+    has_params = any(isinstance(v, tuple) and v[1] for v in kpis.values())
+
+    for name, spec in kpis.items():
+        sql, sql_params = spec if isinstance(spec, tuple) else (spec, ())
+        sql = sql.strip().rstrip(';')
+        # Les requêtes sans paramètres peuvent contenir des % littéraux
+        if has_params and not sql_params:
+            sql = sql.replace('%', '%%')
+        columns.append(f'({sql}) AS "{name}"')
+        params.extend(sql_params)
+
+    query = "SELECT\n" + ",\n".join(columns)
+    rows = execute_query(query, tuple(params), readonly=readonly)
+    row = rows[0] if rows else {}
+
+    result = {}
+    for name in kpis:
+        value = row.get(name)
+        result[name] = defaults.get(name, 0) if value is None else value
+    return result
 
 
 # Fonctions standalone pour compatibilité avec les imports
+@cached_query("mv_occupation_salles")
 def get_occupation_salles() -> pd.DataFrame:
     """
     Récupère l'occupation des salles et amphis
-    Utilise la vue v_occupation_salles de la BDD
+    Utilise la vue matérialisée mv_occupation_salles (cf. get_fraicheur_vues)
     """
     query = """
         SELECT 
@@ -777,9 +856,10 @@ def get_occupation_salles() -> pd.DataFrame:
             capacite,
             nb_examens_planifies as nb_examens,
             taux_occupation_moyen
-        FROM v_occupation_salles
+        FROM mv_occupation_salles
         ORDER BY taux_occupation_moyen DESC
     """
+    # Primaire, comme tout chargeur @cached_query (cf. query_cache.cached_query)
     result = execute_query(query)
     if result:
         df = pd.DataFrame(result)
@@ -787,10 +867,11 @@ def get_occupation_salles() -> pd.DataFrame:
     return pd.DataFrame()
 
 
+@cached_query("mv_stats_departement")
 def get_stats_departement() -> pd.DataFrame:
     """
     Récupère les statistiques par département
-    Utilise la vue v_stats_departement de la BDD
+    Utilise la vue matérialisée mv_stats_departement (cf. get_fraicheur_vues)
     """
     query = """
         SELECT 
@@ -800,9 +881,10 @@ def get_stats_departement() -> pd.DataFrame:
             nb_examens_planifies,
             nb_etudiants,
             nb_professeurs
-        FROM v_stats_departement
+        FROM mv_stats_departement
         ORDER BY departement_nom
     """
+    # Primaire, comme tout chargeur @cached_query (cf. query_cache.cached_query)
     result = execute_query(query)
     if result:
         df = pd.DataFrame(result)
@@ -810,6 +892,18 @@ def get_stats_departement() -> pd.DataFrame:
     return pd.DataFrame()
 
 
+def get_fraicheur_vues() -> Dict[str, Dict[str, Any]]:
+    """
+    Date du dernier rafraîchissement de chaque vue matérialisée et présence
+    de changements en attente : {vue: {'rafraichi_at': ..., 'en_attente': ...}}
+    """
+    result = execute_query("SELECT vue, rafraichi_at, en_attente FROM fraicheur_vues()", readonly=True)
+    return {
+        row['vue']: {'rafraichi_at': row['rafraichi_at'], 'en_attente': row['en_attente']}
+        for row in result or []
+    }
+
+
 def generer_planning_optimise(date_debut: date, date_fin: date) -> pd.DataFrame:
     """
     Génère un planning optimisé en utilisant la fonction PL/pgSQL
@@ -824,71 +918,174 @@ def detecter_tous_les_conflits() -> pd.DataFrame:
     return OptimizationQueries.detect_all_conflicts()
 
 
+PLANNING_QUERY = """
+    SELECT 
+        id,
+        uuid,
+        module_code,
+        module_nom,
+        formation_nom,
+        departement_nom,
+        professeur_nom,
+        salle_nom,
+        salle_type,
+        capacite,
+        date_heure,
+        duree_minutes,
+        type_examen,
+        statut,
+        etudiants_inscrits as nb_etudiants_inscrits
+    FROM v_planning_examens
+    WHERE statut IN ('Planifie', 'Confirme')
+      AND date_heure >= debut_annees_actives()
+    ORDER BY date_heure
+"""
+
+# Une ligne par étudiant convoqué et par examen (student_timetable)
+CONVOCATIONS_QUERY = """
+    SELECT 
+        et.matricule,
+        et.nom,
+        et.prenom,
+        st.formation_nom,
+        st.module_code,
+        st.module_nom,
+        st.date_heure,
+        st.date_fin,
+        st.salle_nom,
+        st.batiment,
+        st.type_examen,
+        st.statut
+    FROM student_timetable st
+    JOIN etudiants et ON et.id = st.etudiant_id
+    ORDER BY st.etudiant_id, st.date_heure
+"""
+
+
+@cached_query("examens", "inscriptions", "modules", "formations", "departements", "professeurs", "lieux_examen")
 def get_planning_examens() -> pd.DataFrame:
     """
     Récupère le planning complet des examens
-    Utilise la vue v_planning_examens de la BDD
+    Utilise la vue v_planning_examens de la BDD, lue en flux (DataFrames typés
+    assemblés au fur et à mesure, sans liste intermédiaire de dictionnaires)
     """
-    query = """
-        SELECT 
-            id,
-            uuid,
-            module_code,
-            module_nom,
-            formation_nom,
-            departement_nom,
-            professeur_nom,
-            salle_nom,
-            salle_type,
-            capacite,
-            date_heure,
-            duree_minutes,
-            type_examen,
-            statut,
-            etudiants_inscrits as nb_etudiants_inscrits
-        FROM v_planning_examens
-        WHERE statut IN ('Planifié', 'Confirmé')
-        ORDER BY date_heure
+    try:
+        # Primaire, comme tout chargeur @cached_query (cf. query_cache.cached_query)
+        return pd.concat(iter_dataframes(PLANNING_QUERY), ignore_index=True)
+    except Exception as e:
+        print(f"Erreur dans get_planning_examens: {e}")
+        return pd.DataFrame()
+
+
+def export_query(query: str, fmt: str = "csv", params=None) -> io.BytesIO:
     """
-    result = execute_query(query)
-    if result:
-        df = pd.DataFrame(result)
-        if not df.empty and 'date_heure' in df.columns:
-            df['date_heure'] = pd.to_datetime(df['date_heure'])
-        return df
-    return pd.DataFrame()
+    Export d'un résultat potentiellement volumineux vers un tampon de
+    téléchargement (st.download_button) : "csv" via COPY côté serveur,
+    "parquet" par morceaux. La mémoire reste bornée au fichier produit.
+    """
+    buffer = io.BytesIO()
+    if fmt == "csv":
+        copy_csv(query, buffer, params, readonly=True)
+    elif fmt == "parquet":
+        write_parquet(query, buffer, params, readonly=True)
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    buffer.seek(0)
+    return buffer
+
+
+def export_planning(fmt: str = "csv") -> io.BytesIO:
+    """Planning complet (examens actifs)"""
+    return export_query(PLANNING_QUERY, fmt)
+
+
+def export_convocations(fmt: str = "csv") -> io.BytesIO:
+    """Convocations : une ligne par étudiant et par examen"""
+    return export_query(CONVOCATIONS_QUERY, fmt)
 
 
 def valider_examen(examen_id: int) -> bool:
     """
-    Valide un examen (passe le statut à 'Confirmé')
+    Valide un examen (passe le statut à 'Confirme')
     """
     try:
         query = """
             UPDATE examens 
-            SET statut = 'Confirmé'
-            WHERE id = %s AND statut = 'Planifié'
+            SET statut = 'Confirme'
+            WHERE id = %s AND statut = 'Planifie'
             RETURNING id
         """
         result = execute_query(query, (examen_id,), fetch=True)
+        # Sans attendre la notification : le rerun qui suit relit le planning
+        invalidate_cache("examens")
         return len(result) > 0 if result else False
     except Exception as e:
         print(f"Erreur dans valider_examen: {e}")
         return False
 
 
-def valider_tout_le_planning() -> bool:
+def valider_planning_par_lots(examens_ids: List[int] = None, department_id: int = None,
+                              start_date: date = None, end_date: date = None,
+                              taille_lot: int = 1000, apres_id: int = 0,
+                              on_progress=None, user_id: int = None) -> Dict[str, Any]:
     """
-    Valide tout le planning (passe tous les examens planifiés à 'Confirmé')
+    Passe les examens planifiés du périmètre à 'Confirme', lot par lot
+    (valider_examens_lot, bdd.sql PARTIE 18) : une transaction courte et une
+    entrée d'audit par lot. on_progress(valides, total) après chaque lot.
+    Reprise : relancer avec apres_id = dernier_id du résultat (ou depuis le
+    début, les examens déjà confirmés ne sont plus sélectionnés).
+    Retourne {"valides", "total", "lots", "dernier_id", "termine"}.
+    """
+    ids = [int(i) for i in examens_ids] if examens_ids is not None else None
+    params = {"ids": ids, "dept": department_id, "debut": start_date, "fin": end_date,
+              "apres": apres_id, "taille": taille_lot, "user": user_id}
+    total_rows = execute_query("""
+        SELECT COUNT(*) AS total
+        FROM examens e
+        WHERE e.statut = 'Planifie'
+          AND e.date_heure >= debut_annees_actives()
+          AND e.id > %(apres)s
+          AND (%(ids)s::INT[] IS NULL OR e.id = ANY(%(ids)s::INT[]))
+          AND (%(debut)s::DATE IS NULL OR e.date_heure >= %(debut)s::DATE)
+          AND (%(fin)s::DATE IS NULL OR e.date_heure < %(fin)s::DATE + 1)
+          AND (%(dept)s::INT IS NULL OR EXISTS (
+                SELECT 1 FROM modules m JOIN formations f ON f.id = m.formation_id
+                WHERE m.id = e.module_id AND f.departement_id = %(dept)s::INT
+          ))
+    """, params)
+    resultat = {"valides": 0, "total": total_rows[0]["total"] if total_rows else 0,
+                "lots": 0, "dernier_id": apres_id, "termine": False}
+
+    while True:
+        rows = execute_query("""
+            SELECT * FROM valider_examens_lot(
+                %(apres)s, %(taille)s, %(ids)s::INT[], %(dept)s, %(debut)s, %(fin)s, %(user)s
+            )
+        """, params)
+        if not rows:
+            # Erreur déjà affichée par execute_query : les lots précédents restent validés
+            break
+        if rows[0]["dernier_id"] is None:
+            resultat["termine"] = True
+            break
+        params["apres"] = resultat["dernier_id"] = rows[0]["dernier_id"]
+        resultat["valides"] += rows[0]["valides"]
+        resultat["lots"] += 1
+        if on_progress is not None:
+            on_progress(resultat["valides"], max(resultat["total"], resultat["valides"]))
+
+    if resultat["valides"]:
+        invalidate_cache("examens")
+    return resultat
+
+
+def valider_tout_le_planning(on_progress=None, user_id: int = None) -> bool:
+    """
+    Valide tout le planning (passe tous les examens planifiés à 'Confirme')
     """
     try:
-        query = """
-            UPDATE examens 
-            SET statut = 'Confirmé'
-            WHERE statut = 'Planifié'
-        """
-        result = execute_query(query, fetch=False)
-        return result > 0
+        resultat = valider_planning_par_lots(on_progress=on_progress, user_id=user_id)
+        return resultat["termine"] and resultat["valides"] > 0
     except Exception as e:
         print(f"Erreur dans valider_tout_le_planning: {e}")
         return False
@@ -0,0 +1,318 @@
+"""
+query_cache.py - Cache des résultats de requêtes partagé entre les sessions
+Les tableaux de bord relisent les mêmes données à chaque rerun Streamlit :
+les résultats sont gardés en mémoire (TTL + éviction LRU par nombre et par
+taille) et invalidés précisément par LISTEN/NOTIFY : les triggers de bdd.sql
+(PARTIE 15) publient le nom de la table modifiée sur 'changements_tables',
+un thread d'écoute supprime les entrées qui en dépendent.
+Sans écoute active (connexion perdue...), le cache est contourné.
+La même connexion d'écoute sert les autres canaux du processus
+(PgListener.add_channel : flux des tableaux de bord, change_feed.py).
+Paramètres optionnels dans st.secrets["postgres"] :
+    cache_ttl            secondes de validité d'une entrée (300)
+    cache_max_entries    nombre maximum d'entrées (256)
+    cache_max_mb         taille maximum estimée en Mo (64)
+"""
+
+import copy
+import functools
+import os
+import select
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+import streamlit as st
+
+from connection import SimpleConnection
+
+CANAL = "changements_tables"
+
+
+def _copy(value):
+    return value.copy() if isinstance(value, pd.DataFrame) else copy.copy(value)
+
+
+def _size_of(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    Cache thread-safe {clé: résultat} ; chaque entrée déclare les tables
+    dont elle dépend. Compteurs : hits, misses, evictions, invalidations.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=256, max_bytes=64 * 2**20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()        # clé -> (valeur, tables, expiration, taille)
+        self._by_table = defaultdict(set)    # table -> clés
+        self._generation = defaultdict(int)  # table -> nombre d'invalidations
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "invalidations": 0}
+
+    # ---------- entrées ----------
+
+    def _drop(self, key):
+        """Supprime une entrée (appelé sous verrou)"""
+        _, tables, _, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            self._by_table[table].discard(key)
+
+    def get_or_load(self, key, tables, loader, ttl=None):
+        """
+        Résultat en cache pour key, sinon loader() (hors verrou) puis mise en
+        cache. Une invalidation d'une des tables pendant le chargement
+        empêche la mise en cache (le résultat peut déjà être périmé).
+        Une copie est rendue : les appelants peuvent modifier leur DataFrame.
+        """
+        now = time.monotonic()
+        with self._lock:
+            enabled = self.enabled
+            if not enabled:
+                self._stats["bypassed"] += 1
+        if not enabled:
+            # Chargement hors verrou : sans écoute, toutes les lectures passent ici
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return _copy(entry[0])
+            if entry is not None:
+                self._drop(key)
+            self._stats["misses"] += 1
+            generations = {t: self._generation[t] for t in tables}
+
+        value = loader()
+        # Un résultat vide peut être une erreur déjà affichée par execute_query
+        if value is None or (isinstance(value, pd.DataFrame) and value.empty):
+            return value
+
+        size = _size_of(value)
+        with self._lock:
+            if (not self.enabled or size > self.max_bytes
+                    or any(self._generation[t] != g for t, g in generations.items())):
+                return value
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, frozenset(tables), time.monotonic() + (ttl or self.ttl), size)
+            self._bytes += size
+            for table in tables:
+                self._by_table[table].add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return _copy(value)
+
+    def invalidate(self, table):
+        """Supprime les entrées qui dépendent de table"""
+        with self._lock:
+            self._generation[table] += 1
+            keys = list(self._by_table.pop(table, ()))
+            for key in keys:
+                if key in self._entries:
+                    self._drop(key)
+            self._stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            for table in list(self._generation) + list(self._by_table):
+                self._generation[table] += 1
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def set_enabled(self, enabled):
+        """Désactivé, le cache est vidé et contourné (invalidations non reçues)"""
+        if not enabled:
+            self.clear()
+        with self._lock:
+            self.enabled = enabled
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+            s["bytes"] = self._bytes
+            s["enabled"] = self.enabled
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
+
+
+class PgListener(threading.Thread):
+    """
+    Thread démon : LISTEN sur 'changements_tables' avec une connexion
+    dédiée (hors pool), invalide le cache à chaque notification.
+    Connexion perdue : cache désactivé, reconnexion avec attente croissante.
+    D'autres canaux s'ajoutent par add_channel(), sur la même connexion.
+    """
+
+    def __init__(self, cache, connect=SimpleConnection.connect, channel=CANAL, poll_interval=5.0):
+        super().__init__(name="pg-listener", daemon=True)
+        self.cache = cache
+        self.connect = connect
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.notifications = 0
+        self.reconnections = 0
+        self.last_error = None
+        self.listening = threading.Event()
+        self._stop_event = threading.Event()
+
+        self._lock = threading.Lock()
+        self._handlers = {channel: cache.invalidate}  # canal -> handler(payload)
+        self._on_connect = []
+        self._listened = set()
+        # Réveille select() quand un canal est ajouté
+        self._wake_r, self._wake_w = os.pipe()
+
+    def add_channel(self, channel, handler, on_connect=None):
+        """
+        Écoute channel en plus : handler(payload) est appelé par le thread
+        d'écoute à chaque notification, on_connect() à chaque (re)connexion
+        (les notifications de la coupure sont perdues)
+        """
+        with self._lock:
+            self._handlers[channel] = handler
+            if on_connect is not None:
+                self._on_connect.append(on_connect)
+        os.write(self._wake_w, b"\0")
+
+    def _listen_channels(self, conn):
+        """LISTEN sur les canaux pas encore écoutés (thread d'écoute seulement)"""
+        with self._lock:
+            channels = [c for c in self._handlers if c not in self._listened]
+        with conn.cursor() as cur:
+            for channel in channels:
+                cur.execute(f'LISTEN "{channel}"')
+        self._listened.update(channels)
+        return channels
+
+    def run(self):
+        delay = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                self._listened = set()
+                self._listen_channels(conn)
+                # Rien n'a pu être reçu pendant la coupure
+                self.cache.clear()
+                self.cache.set_enabled(True)
+                with self._lock:
+                    callbacks = list(self._on_connect)
+                for callback in callbacks:
+                    callback()
+                self.listening.set()
+                delay = 1.0
+                self._listen(conn)
+            except Exception as e:
+                # Pas d'affichage Streamlit hors du thread de rendu
+                self.last_error = str(e)
+            finally:
+                self.listening.clear()
+                self.cache.set_enabled(False)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            if self._stop_event.wait(delay):
+                break
+            delay = min(delay * 2, 60.0)
+            self.reconnections += 1
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([conn, self._wake_r], [], [], self.poll_interval)
+            if not ready:
+                # Délai écoulé : vérifie que la connexion répond encore
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                continue
+            if self._wake_r in ready:
+                os.read(self._wake_r, 512)
+                self._listen_channels(conn)
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.notifications += 1
+                with self._lock:
+                    handler = self._handlers.get(notify.channel)
+                if handler is None:
+                    continue
+                try:
+                    handler(notify.payload)
+                except Exception as e:
+                    # Un abonné défaillant n'interrompt pas l'écoute
+                    self.last_error = str(e)
+
+    def stop(self):
+        self._stop_event.set()
+        os.write(self._wake_w, b"\0")
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache() -> QueryCache:
+    """Cache unique par processus ; démarre son thread d'écoute"""
+    cfg = st.secrets["postgres"]
+    cache = QueryCache(
+        ttl=float(cfg.get("cache_ttl", 300)),
+        max_entries=int(cfg.get("cache_max_entries", 256)),
+        max_bytes=int(float(cfg.get("cache_max_mb", 64)) * 2**20),
+    )
+    # Contourné jusqu'à ce que l'écoute soit active
+    cache.set_enabled(False)
+    cache.listener = PgListener(cache)
+    cache.listener.start()
+    return cache
+
+
+def cached_query(*tables, ttl=None):
+    """
+    Décorateur : résultat mis en cache par fonction et arguments, invalidé
+    quand une des tables (ou vues matérialisées) change.
+    Les arguments doivent être hachables. La fonction lit sur le primaire
+    (pas de readonly=True) : la notification part du primaire au COMMIT,
+    un réplica en retard remettrait en cache l'état d'avant pour tout le TTL.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                cache = get_query_cache()
+            except Exception:
+                return func(*args, **kwargs)
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return cache.get_or_load(key, tables, lambda: func(*args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+
+def invalidate_cache(*tables):
+    """
+    Invalidation immédiate après une écriture de ce processus, sans attendre
+    la notification (le rerun qui suit l'écriture relit les données)
+    """
+    try:
+        cache = get_query_cache()
+    except Exception:
+        return
+    for table in tables:
+        cache.invalidate(table)
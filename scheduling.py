@@ -0,0 +1,557 @@
+"""
+scheduling.py - Structures d'occupation pour la génération de planning
+Aucune dépendance à Streamlit : utilisable depuis l'interface, un script
+ou un benchmark.
+"""
+
+import heapq
+import math
+import random
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+
+
+class IntervalIndex:
+    """
+    Intervalles [début, fin) triés et disjoints, par ressource (salle, professeur).
+    Test de chevauchement en O(log n) par recherche dichotomique.
+    """
+
+    def __init__(self):
+        self._starts = defaultdict(list)
+        self._ends = defaultdict(list)
+
+    def is_free(self, key, start, end) -> bool:
+        starts = self._starts.get(key)
+        if not starts:
+            return True
+        # Intervalles disjoints et triés : seul le dernier qui commence
+        # avant `end` peut chevaucher [start, end)
+        i = bisect_left(starts, end)
+        return i == 0 or self._ends[key][i - 1] <= start
+
+    def add(self, key, start, end):
+        """Ajoute un intervalle (supposé libre, cf. is_free)"""
+        starts = self._starts[key]
+        i = bisect_left(starts, start)
+        starts.insert(i, start)
+        self._ends[key].insert(i, end)
+
+    def remove(self, key, start, end):
+        starts = self._starts.get(key, [])
+        i = bisect_left(starts, start)
+        ends = self._ends[key]
+        while i < len(starts) and starts[i] == start:
+            if ends[i] == end:
+                del starts[i]
+                del ends[i]
+                return
+            i += 1
+        raise KeyError((key, start, end))
+
+    def count(self, key) -> int:
+        return len(self._starts.get(key, ()))
+
+
+class OccupancyIndex:
+    """
+    Occupation courante du planning en cours de construction :
+    - salles et professeurs : pas de chevauchement (IntervalIndex)
+    - professeurs : au plus `max_prof_per_day` examens par jour
+    - groupes d'étudiants (formation) : au plus un examen par jour
+    """
+
+    def __init__(self, max_prof_per_day: int = 3):
+        self.max_prof_per_day = max_prof_per_day
+        self.rooms = IntervalIndex()
+        self.professors = IntervalIndex()
+        self.prof_day = defaultdict(int)  # (professeur, jour) -> nb examens
+        self.group_day = defaultdict(int)  # (groupe, jour) -> nb examens
+
+    def day_is_free(self, day, professor_id=None, group_id=None) -> bool:
+        """Contraintes journalières seules (O(1)), avant tout test de salle"""
+        if group_id is not None and self.group_day.get((group_id, day), 0) > 0:
+            return False
+        if professor_id is not None and self.prof_day.get((professor_id, day), 0) >= self.max_prof_per_day:
+            return False
+        return True
+
+    def can_place(self, room_id, start, end, professor_id=None, group_id=None) -> bool:
+        if not self.day_is_free(start.date(), professor_id, group_id):
+            return False
+        if professor_id is not None and not self.professors.is_free(professor_id, start, end):
+            return False
+        return self.rooms.is_free(room_id, start, end)
+
+    def place(self, room_id, start, end, professor_id=None, group_id=None):
+        day = start.date()
+        self.rooms.add(room_id, start, end)
+        if professor_id is not None:
+            self.professors.add(professor_id, start, end)
+            self.prof_day[(professor_id, day)] += 1
+        if group_id is not None:
+            self.group_day[(group_id, day)] += 1
+
+    def release(self, room_id, start, end, professor_id=None, group_id=None):
+        day = start.date()
+        self.rooms.remove(room_id, start, end)
+        if professor_id is not None:
+            self.professors.remove(professor_id, start, end)
+            self.prof_day[(professor_id, day)] -= 1
+        if group_id is not None:
+            self.group_day[(group_id, day)] -= 1
+
+
+class SlotBitmap:
+    """
+    Pour chaque instant de début de créneau, bitmap (int) des ressources
+    occupées à cet instant. Les ressources libres se lisent par opérations
+    bit à bit, sans parcourir les ressources occupées.
+    """
+
+    def __init__(self, slot_times, size: int):
+        self._times = sorted(slot_times)
+        self._busy = dict.fromkeys(self._times, 0)
+        self._all = (1 << size) - 1
+
+    def _covered(self, start, end):
+        i = bisect_left(self._times, start)
+        while i < len(self._times) and self._times[i] < end:
+            yield self._times[i]
+            i += 1
+
+    def mark(self, bit, start, end):
+        for t in self._covered(start, end):
+            self._busy[t] |= 1 << bit
+
+    def unmark(self, bit, start, end):
+        for t in self._covered(start, end):
+            self._busy[t] &= ~(1 << bit)
+
+    def is_free(self, bit, slot_time) -> bool:
+        return not (self._busy.get(slot_time, 0) >> bit) & 1
+
+    def free_bits(self, slot_time, first: int = 0):
+        """Bits libres >= first, par ordre croissant"""
+        free = self._all & ~self._busy.get(slot_time, 0) & ~((1 << first) - 1)
+        while free:
+            low = free & -free
+            yield low.bit_length() - 1
+            free ^= low
+
+
+class ConflictGraph:
+    """
+    Graphe de conflits entre modules au format CSR (NumPy) :
+    arête u-v si au moins un étudiant est inscrit aux deux modules,
+    weights = nombre d'étudiants communs.
+    """
+
+    def __init__(self, n, indptr, indices, weights):
+        self.n = n
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def from_student_lists(cls, student_lists):
+        """student_lists[i] = identifiants des étudiants du module i"""
+        n = len(student_lists)
+        lengths = np.fromiter((len(s) if s else 0 for s in student_lists), dtype=np.int64, count=n)
+        modules = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        students = np.fromiter(
+            chain.from_iterable(s for s in student_lists if s),
+            dtype=np.int64, count=int(lengths.sum())
+        )
+
+        # Incidences triées par étudiant : les modules d'un même étudiant sont
+        # contigus, les paires se lisent par décalage d = 1, 2, ...
+        order = np.lexsort((modules, students))
+        students, modules = students[order], modules[order]
+        if len(students):
+            first = np.ones(len(students), dtype=bool)
+            first[1:] = (students[1:] != students[:-1]) | (modules[1:] != modules[:-1])
+            students, modules = students[first], modules[first]
+
+        src, dst = [], []
+        for d in range(1, len(students)):
+            same = students[d:] == students[:-d]
+            if not same.any():
+                break
+            src.append(modules[:-d][same])
+            dst.append(modules[d:][same])
+
+        if src:
+            a = np.concatenate(src)
+            b = np.concatenate(dst)
+            keys, counts = np.unique(np.minimum(a, b) * n + np.maximum(a, b), return_counts=True)
+            lo, hi = keys // n, keys % n
+        else:
+            lo = hi = counts = np.empty(0, dtype=np.int64)
+
+        # Symétrisation puis tri par sommet source
+        rows = np.concatenate([lo, hi])
+        cols = np.concatenate([hi, lo])
+        w = np.concatenate([counts, counts])
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(n, indptr, cols[order], w[order])
+
+    def neighbors(self, v):
+        return self.indices[self.indptr[v]:self.indptr[v + 1]]
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices) // 2
+
+
+def connected_components(graph: ConflictGraph):
+    """Étiquette de composante connexe de chaque sommet (parcours en profondeur)"""
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    labels = [-1] * graph.n
+    current = 0
+
+    for root in range(graph.n):
+        if labels[root] >= 0:
+            continue
+        labels[root] = current
+        stack = [root]
+        while stack:
+            v = stack.pop()
+            for u in indices[indptr[v]:indptr[v + 1]]:
+                if labels[u] < 0:
+                    labels[u] = current
+                    stack.append(u)
+        current += 1
+
+    return np.asarray(labels, dtype=np.int64)
+
+
+def balanced_bins(sizes, n_bins: int):
+    """Répartit des éléments de tailles données en n_bins groupes équilibrés (plus grand d'abord)"""
+    bins = [[] for _ in range(max(1, n_bins))]
+    loads = [(0, b) for b in range(len(bins))]
+    heapq.heapify(loads)
+    for item in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        load, b = heapq.heappop(loads)
+        bins[b].append(item)
+        heapq.heappush(loads, (load + sizes[item], b))
+    return [b for b in bins if b]
+
+
+def dsatur(graph: ConflictGraph, try_colour, priority=None):
+    """
+    Coloration DSATUR : le sommet suivant est celui dont les voisins utilisent
+    le plus de couleurs distinctes (puis degré, puis priorité décroissants).
+
+    try_colour(v, interdites) reçoit le masque (int) des couleurs des voisins
+    et renvoie la couleur retenue, ou None si le sommet ne peut être placé.
+    Retourne le tableau des couleurs (-1 = non placé).
+    """
+    n = graph.n
+    degrees = graph.degrees().tolist()
+    priority = list(priority) if priority is not None else [0] * n
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+
+    forbidden = [0] * n
+    saturation = [0] * n
+    done = bytearray(n)
+    colours = np.full(n, -1, dtype=np.int64)
+
+    heap = [(0, -degrees[v], -priority[v], v) for v in range(n)]
+    heapq.heapify(heap)
+
+    while heap:
+        neg_sat, _, _, v = heapq.heappop(heap)
+        if done[v] or -neg_sat != saturation[v]:
+            continue  # entrée périmée
+        done[v] = 1
+
+        colour = try_colour(v, forbidden[v])
+        if colour is None:
+            continue
+        colours[v] = colour
+
+        bit = 1 << colour
+        for u in indices[indptr[v]:indptr[v + 1]]:
+            if not done[u] and not forbidden[u] & bit:
+                forbidden[u] |= bit
+                saturation[u] += 1
+                heapq.heappush(heap, (-saturation[u], -degrees[u], -priority[u], u))
+
+    return colours
+
+
+class LocalSearch:
+    """
+    Amélioration "anytime" d'un planning réalisable par recuit simulé.
+
+    Coût à minimiser, évalué par différence (delta) à chaque mouvement :
+    - remplissage : écart de chaque examen au taux cible 60-90 % de sa salle
+    - équilibre professeurs : somme des carrés des examens par professeur et par jour
+    - espacement étudiants : étudiants communs / écart en jours (examens à <= 2 jours)
+    - module non placé : pénalité forte, la recherche tente de l'insérer
+
+    Mouvements : déplacer un module, échanger les créneaux de deux modules,
+    changer de salle, échanger les salles de deux modules au même créneau.
+    Les contraintes dures (salle, professeur, étudiant/jour) restent garanties.
+    La meilleure solution rencontrée est disponible à tout moment (best_assignment).
+    """
+
+    W_FILL = 100.0
+    W_PROF = 1.0
+    W_SPACING = 0.5
+    W_SAME_DAY = 20.0
+    W_UNPLACED = 1000.0
+    FILL_MIN, FILL_MAX = 0.60, 0.90
+    SPACING_DAYS = 2
+    T_START, T_END = 10.0, 0.05
+
+    def __init__(self, modules, rooms, graph, slots, occupancy, assignment,
+                 groups=None, weights=None, seed=None):
+        """
+        modules[v] / assignment[v] : sommet v du graphe, placé en (date_heure, salle_id) ou None
+        occupancy : OccupancyIndex contenant déjà ce placement
+        weights : surcharge des poids, ex. {"W_FILL": 0}
+        """
+        for name, value in (weights or {}).items():
+            setattr(self, name, value)
+
+        self.n = len(modules)
+        self.graph = graph
+        self.occupancy = occupancy
+        self.rng = random.Random(seed)
+
+        self.students = [m.get('student_count', 0) or 0 for m in modules]
+        self.profs = [m.get('professor_id') for m in modules]
+        self.groups = list(groups) if groups is not None else [None] * self.n
+        self.durations = [timedelta(minutes=m.get('duration_minutes', 120)) for m in modules]
+
+        self.capacity = {r['id']: r.get('capacite', 0) or 0 for r in rooms}
+        by_capacity = sorted(self.capacity.items(), key=lambda x: x[1])
+        self._room_ids = [room_id for room_id, _ in by_capacity]
+        self._caps = [cap for _, cap in by_capacity]
+        self.slot_times = [t for _, slot_times in slots for t in slot_times]
+
+        indptr = graph.indptr.tolist()
+        indices = graph.indices.tolist()
+        weights_ = graph.weights.tolist()
+        self._nbr = [indices[indptr[v]:indptr[v + 1]] for v in range(self.n)]
+        self._nbr_w = [weights_[indptr[v]:indptr[v + 1]] for v in range(self.n)]
+
+        self.time = [None] * self.n
+        self.room = [None] * self.n
+        self.day = [None] * self.n
+        self.at_time = defaultdict(set)
+
+        # Coût initial = somme des contributions en plaçant les modules un à un
+        for v, placement in enumerate(assignment):
+            if placement is None:
+                continue
+            t, room_id = placement
+            self.occupancy.release(room_id, t, t + self.durations[v], self.profs[v], self.groups[v])
+        self.cost = 0.0
+        for v, placement in enumerate(assignment):
+            if placement is None:
+                self.cost += self.W_UNPLACED
+            else:
+                self.cost += self._contribution(v, *placement)
+                self._assign(v, *placement)
+
+        self.initial_cost = self.cost
+        self.best_cost = self.cost
+        self._best = None
+        self._at_best = True
+        self.temperature = self.T_START
+        self.iterations = 0
+        self.accepted = 0
+
+    # ---------- évaluation ----------
+
+    def _fill_cost(self, v, room_id):
+        cap = self.capacity.get(room_id, 0)
+        if not cap:
+            return 0.0
+        fill = self.students[v] / cap
+        return self.W_FILL * (max(0.0, self.FILL_MIN - fill) + max(0.0, fill - self.FILL_MAX))
+
+    def _spacing_cost(self, v, day):
+        total = 0.0
+        for u, shared in zip(self._nbr[v], self._nbr_w[v]):
+            du = self.day[u]
+            if du is None:
+                continue
+            gap = abs(day - du)
+            if gap == 0:
+                total += self.W_SAME_DAY * shared
+            elif gap <= self.SPACING_DAYS:
+                total += self.W_SPACING * shared / gap
+        return total
+
+    def _contribution(self, v, t, room_id):
+        """Coût ajouté en plaçant v (actuellement non placé) en (t, room_id)"""
+        cost = self._fill_cost(v, room_id) + self._spacing_cost(v, t.toordinal())
+        prof = self.profs[v]
+        if prof is not None:
+            c = self.occupancy.prof_day.get((prof, t.date()), 0)
+            cost += self.W_PROF * (2 * c + 1)
+        return cost
+
+    # ---------- état ----------
+
+    def _assign(self, v, t, room_id):
+        self.occupancy.place(room_id, t, t + self.durations[v], self.profs[v], self.groups[v])
+        self.time[v], self.room[v], self.day[v] = t, room_id, t.toordinal()
+        self.at_time[t].add(v)
+
+    def _unassign(self, v):
+        t, room_id = self.time[v], self.room[v]
+        self.occupancy.release(room_id, t, t + self.durations[v], self.profs[v], self.groups[v])
+        self.time[v] = self.room[v] = self.day[v] = None
+        self.at_time[t].discard(v)
+
+    def _feasible(self, v, t, room_id) -> bool:
+        if self.capacity.get(room_id, 0) < self.students[v]:
+            return False
+        if not self.occupancy.can_place(room_id, t, t + self.durations[v], self.profs[v], self.groups[v]):
+            return False
+        day = t.toordinal()
+        return all(self.day[u] != day for u in self._nbr[v])
+
+    # ---------- mouvements ----------
+
+    def _random_room(self, v):
+        first = bisect_left(self._caps, self.students[v])
+        if first >= len(self._caps):
+            return None
+        return self._room_ids[self.rng.randrange(first, len(self._caps))]
+
+    def _random_move(self):
+        """Liste de (module, nouveau créneau, nouvelle salle), ou None"""
+        rng = self.rng
+        v = rng.randrange(self.n)
+        r = rng.random()
+
+        if self.time[v] is None or r < 0.4:
+            # Déplacer (ou insérer) un module
+            room_id = self._random_room(v)
+            if room_id is None or not self.slot_times:
+                return None
+            return [(v, rng.choice(self.slot_times), room_id)]
+
+        if r < 0.7:
+            # Échanger les créneaux de deux modules (chacun garde sa salle)
+            u = rng.randrange(self.n)
+            if u == v or self.time[u] is None or self.time[u] == self.time[v]:
+                return None
+            return [(v, self.time[u], self.room[v]), (u, self.time[v], self.room[u])]
+
+        if r < 0.85:
+            # Changer de salle au même créneau
+            room_id = self._random_room(v)
+            if room_id is None or room_id == self.room[v]:
+                return None
+            return [(v, self.time[v], room_id)]
+
+        # Échanger les salles de deux modules au même créneau
+        same_slot = self.at_time.get(self.time[v])
+        if not same_slot or len(same_slot) < 2:
+            return None
+        u = rng.choice(tuple(same_slot))
+        if u == v:
+            return None
+        return [(v, self.time[v], self.room[u]), (u, self.time[u], self.room[v])]
+
+    def _try(self, moves) -> bool:
+        old = [(v, self.time[v], self.room[v]) for v, _, _ in moves]
+
+        delta = 0.0
+        for v, t, room_id in old:
+            if t is None:
+                delta -= self.W_UNPLACED
+            else:
+                self._unassign(v)
+                delta -= self._contribution(v, t, room_id)
+
+        placed = []
+        feasible = True
+        for v, t, room_id in moves:
+            if not self._feasible(v, t, room_id):
+                feasible = False
+                break
+            delta += self._contribution(v, t, room_id)
+            self._assign(v, t, room_id)
+            placed.append(v)
+
+        if feasible and (delta <= 0 or self.rng.random() < math.exp(-delta / self.temperature)):
+            if delta > 0 and self._at_best:
+                self._save_best(old)
+            self.cost += delta
+            self.accepted += 1
+            if self.cost < self.best_cost - 1e-9:
+                self.best_cost = self.cost
+                self._at_best = True
+            elif delta > 0:
+                self._at_best = False
+            return True
+
+        for v in placed:
+            self._unassign(v)
+        for v, t, room_id in old:
+            if t is not None:
+                self._assign(v, t, room_id)
+        return False
+
+    def _save_best(self, previous):
+        """L'état courant (avant `previous` annulé) est le meilleur : on le copie"""
+        times, rooms = list(self.time), list(self.room)
+        for v, t, room_id in previous:
+            times[v], rooms[v] = t, room_id
+        self._best = (times, rooms)
+
+    def best_assignment(self):
+        """Meilleure solution rencontrée : [(date_heure, salle_id) ou None, ...]"""
+        times, rooms = (self.time, self.room) if self._at_best else self._best
+        return [(t, r) if t is not None else None for t, r in zip(times, rooms)]
+
+    # ---------- boucle ----------
+
+    def run(self, budget_seconds: float, on_progress=None, report_every: float = 0.25):
+        """
+        Recuit simulé jusqu'à épuisement du budget (secondes).
+        on_progress(écoulé, coût courant, meilleur coût) est appelé régulièrement.
+        """
+        start = time.monotonic()
+        deadline = start + budget_seconds
+        next_report = start
+        ratio = self.T_END / self.T_START
+
+        while True:
+            if self.iterations % 128 == 0:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                self.temperature = self.T_START * ratio ** ((now - start) / budget_seconds)
+                if on_progress and now >= next_report:
+                    on_progress(now - start, self.cost, self.best_cost)
+                    next_report = now + report_every
+
+            self.iterations += 1
+            moves = self._random_move()
+            if moves:
+                self._try(moves)
+
+        if on_progress:
+            on_progress(time.monotonic() - start, self.cost, self.best_cost)
+        return self.best_cost
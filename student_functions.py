@@ -6,61 +6,145 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 
-# IMPORT CORRECT - Utiliser execute_query directement
-from connection import execute_query
+from queries import ExamQueries
+from student_requests import StudentRequests
+from change_feed import subscribe_session, live_data
+
+# Durée de vie du lot de données étudiant (secondes)
+STUDENT_BUNDLE_TTL = 60
+
+STUDENT_EXAM_COLUMNS = [
+    'id', 'module_id', 'module_code', 'module_nom', 'formation_nom', 'departement_nom',
+    'professeur_nom', 'salle_nom', 'salle_type', 'batiment', 'capacite',
+    'date_heure', 'duree_minutes', 'date_fin', 'type_examen', 'statut'
+]
+
+
+def student_exams_frame(rows) -> pd.DataFrame:
+    """Lignes de student_timetable en DataFrame (dates converties)"""
+    exams = pd.DataFrame(rows, columns=STUDENT_EXAM_COLUMNS)
+    if not exams.empty:
+        exams['date_heure'] = pd.to_datetime(exams['date_heure'])
+        exams['date_fin'] = pd.to_datetime(exams['date_fin'])
+    return exams
+
+
+def build_student_bundle(student_id: int, readonly: bool = True) -> dict:
+    """
+    Données communes à tous les onglets étudiant, filtrées ensuite en pandas :
+    - exams : examens actifs des modules suivis (DataFrame trié par date)
+    - modules : modules suivis
+    - conflicts : conflits personnels, déduits de exams
+    readonly=False : examens relus sur le primaire (rechargement dû au flux)
+    """
+    exams = student_exams_frame(ExamQueries.get_student_exams(student_id, readonly=readonly))
+    
+    return {
+        'exams': exams,
+        'modules': StudentRequests.get_registered_modules(student_id),
+        'conflicts': student_conflicts(exams),
+    }
+
+
+@st.cache_data(ttl=STUDENT_BUNDLE_TTL, show_spinner=False)
+def load_student_bundle(student_id: int) -> dict:
+    """
+    Lot étudiant chargé une seule fois (cache court, partagé entre les reruns)
+    """
+    return build_student_bundle(student_id)
+
+
+def patch_student_bundle(student_id: int, bundle: dict, changes: dict) -> dict:
+    """
+    Lot mis à jour pour les seuls examens signalés : relus, remplacés ou
+    retirés (annulés, déplacés vers un autre module), conflits recalculés
+    """
+    exam_ids = changes.get('examens')
+    if not exam_ids:
+        return bundle
+    
+    exams = bundle['exams']
+    fresh = student_exams_frame(ExamQueries.get_student_exams(student_id, exam_ids=exam_ids))
+    kept = exams[~exams['id'].isin(exam_ids)]
+    exams = fresh if kept.empty else (kept if fresh.empty else pd.concat([kept, fresh]))
+    exams = exams.sort_values('date_heure').reset_index(drop=True)
+    
+    return {**bundle, 'exams': exams, 'conflicts': student_conflicts(exams)}
+
+
+def load_live_student_bundle(student_id: int):
+    """
+    Lot étudiant de la session, tenu à jour par le flux des changements
+    (examens de ses modules, ses demandes) ; retourne (lot, abonnement)
+    """
+    modules = load_student_bundle(student_id)['modules']
+    sub = subscribe_session(
+        "etudiant",
+        ("examens", "demandes_modification_examens"),
+        [f"m:{m['id']}" for m in modules] + [f"e:{student_id}"],
+    )
+    bundle = live_data(
+        "etudiant", sub,
+        load=lambda readonly: build_student_bundle(student_id, readonly=readonly),
+        patch=lambda bundle, changes: patch_student_bundle(student_id, bundle, changes),
+        max_age=STUDENT_BUNDLE_TTL,
+    )
+    return bundle, sub
+
+
+def student_conflicts(exams: pd.DataFrame) -> list:
+    """
+    Conflits personnels (mêmes règles que StudentRequests.detect_student_conflicts) :
+    plusieurs examens le même jour, moins de 2h entre deux examens
+    """
+    if exams.empty:
+        return []
+    
+    by_day = exams.groupby(exams['date_heure'].dt.date, sort=True)
+    conflicts = [
+        {
+            'type_conflit': 'Conflit horaire',
+            'details': f"Vous avez {len(day_exams)} examens le {day}",
+            'severite': 'CRITIQUE',
+            'examens_ids': day_exams['id'].tolist(),
+        }
+        for day, day_exams in by_day if len(day_exams) > 1
+    ]
+    
+    for _, day_exams in by_day:
+        rows = day_exams.sort_values('date_heure').to_dict('records')
+        for i, first in enumerate(rows):
+            for second in rows[i + 1:]:
+                gap = second['date_heure'] - first['date_heure']
+                if gap > timedelta(minutes=120):
+                    break
+                conflicts.append({
+                    'type_conflit': 'Intervalle trop court',
+                    'details': f"Seulement {gap.seconds // 3600}h entre {first['module_nom']} et {second['module_nom']}",
+                    'severite': 'ÉLEVÉ',
+                    'examens_ids': [first['id'], second['id']],
+                })
+    
+    return conflicts
+
 
 def get_student_exams_simple(student_id: int, start_date=None, end_date=None):
     """
     Fonction simple pour récupérer les examens d'un étudiant
     """
     try:
-        query = """
-        SELECT 
-            e.id,
-            e.date_heure,
-            e.duree_minutes,
-            e.type_examen,
-            e.statut,
-            m.nom as module_nom,
-            l.nom as salle_nom,
-            l.batiment,
-            l.capacite,
-            CONCAT(p.nom, ' ', p.prenom) as professeur_nom,
-            d.nom as departement_nom
-        FROM inscriptions i
-        JOIN examens e ON i.module_id = e.module_id
-        JOIN modules m ON e.module_id = m.id
-        JOIN lieux_examen l ON e.salle_id = l.id
-        JOIN professeurs p ON e.professeur_id = p.id
-        JOIN formations f ON m.formation_id = f.id
-        JOIN departements d ON f.departement_id = d.id
-        WHERE i.etudiant_id = %s
-            AND i.statut = 'Inscrit'
-            AND e.statut IN ('Planifie', 'Confirme')
-        """
-        
-        params = [student_id]
-        
-        if start_date:
-            query += " AND e.date_heure::date >= %s"
-            params.append(start_date)
-        
-        if end_date:
-            query += " AND e.date_heure::date <= %s"
-            params.append(end_date)
-        
-        query += " ORDER BY e.date_heure"
-        
-        return execute_query(query, tuple(params)) or []
+        # student_timetable : parcours d'intervalle sur (etudiant_id, date_heure)
+        return ExamQueries.get_student_exams(student_id, start_date, end_date)
         
     except Exception as e:
         st.error(f"Erreur récupération examens: {e}")
         return []
 
-def render_personal_schedule(student_id: int):
+def render_personal_schedule(student_id: int, bundle: dict = None):
     """
     Affiche le planning personnel de l'étudiant
     """
+    bundle = bundle or load_student_bundle(student_id)
     st.subheader("📅 Mon planning personnel")
     
     # Filtrage des dates
@@ -70,16 +154,15 @@ def render_personal_schedule(student_id: int):
     with col2:
         end_date = st.date_input("Date de fin", datetime.now().date() + timedelta(days=30))
     
-    # Récupération des examens
-    exams = get_student_exams_simple(student_id, start_date, end_date)
+    # Examens de la période (filtrés dans le lot déjà chargé)
+    exams = bundle['exams']
+    days = exams['date_heure'].dt.date if not exams.empty else exams['date_heure']
+    df = exams[(days >= start_date) & (days <= end_date)].copy()
     
-    if not exams:
+    if df.empty:
         st.info("🎉 Aucun examen prévu pour cette période")
         return
     
-    # Conversion en DataFrame
-    df = pd.DataFrame(exams)
-    
     # Affichage
     if not df.empty:
         # Tableau simple
@@ -91,9 +174,6 @@ def render_personal_schedule(student_id: int):
         
         # Graphique simple
         try:
-            df['date_heure'] = pd.to_datetime(df['date_heure'])
-            df['date_fin'] = df['date_heure'] + pd.to_timedelta(df['duree_minutes'], unit='m')
-            
             if len(df) > 1:
                 fig = px.timeline(
                     df,
@@ -107,21 +187,18 @@ def render_personal_schedule(student_id: int):
         except:
             pass
 
-def render_room_view(student_id: int):
+def render_room_view(student_id: int, bundle: dict = None):
     """
     Affiche les informations sur les salles
     """
     st.subheader("🗺️ Vue des salles")
     
-    # Données simples
-    exams = get_student_exams_simple(student_id)
+    df = (bundle or load_student_bundle(student_id))['exams']
     
-    if not exams:
+    if df.empty:
         st.info("Aucun examen trouvé")
         return
     
-    df = pd.DataFrame(exams)
-    
     # Afficher les salles
     if 'salle_nom' in df.columns and 'batiment' in df.columns:
         st.write("**Vos salles d'examen:**")
@@ -130,20 +207,18 @@ def render_room_view(student_id: int):
     else:
         st.info("Informations sur les salles non disponibles")
 
-def render_student_statistics(student_id: int):
+def render_student_statistics(student_id: int, bundle: dict = None):
     """
     Affiche les statistiques de l'étudiant
     """
     st.subheader("📊 Mes statistiques")
     
-    exams = get_student_exams_simple(student_id)
+    df = (bundle or load_student_bundle(student_id))['exams']
     
-    if not exams:
+    if df.empty:
         st.info("Aucune donnée disponible")
         return
     
-    df = pd.DataFrame(exams)
-    
     # Statistiques simples
     col1, col2, col3, col4 = st.columns(4)
     
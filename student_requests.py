@@ -27,6 +27,8 @@ class StudentRequests:
             JOIN examens e ON i.module_id = e.module_id
             WHERE i.etudiant_id = %s
                 AND e.statut IN ('Planifie', 'Confirme')
+                AND e.date_heure >= debut_annees_actives()
+                AND i.annee_academique >= premiere_annee_active()
             GROUP BY DATE(e.date_heure)
             HAVING COUNT(DISTINCT e.id) > 1
             
@@ -79,7 +81,7 @@ class StudentRequests:
             AND i.statut = 'Inscrit'
         ORDER BY m.semestre, m.code
         """
-        return execute_query(query, (student_id,)) or []
+        return execute_query(query, (student_id,), readonly=True) or []
     
     @staticmethod
     def create_modification_request(student_id: int, exam_id: int, 
@@ -192,14 +194,7 @@ class StudentRequests:
             
             # Trouver des créneaux disponibles dans les 7 jours suivants
             query = """
-            WITH examens_futurs AS (
-                SELECT date_heure, duree_minutes
-                FROM examens 
-                WHERE statut IN ('Planifie', 'Confirme')
-                    AND date_heure >= %s
-                    AND date_heure <= %s + INTERVAL '7 days'
-            ),
-            creneaux AS (
+            WITH creneaux AS (
                 SELECT 
                     %s + (n || ' hours')::INTERVAL as debut_creneau,
                     %s + (n || ' hours')::INTERVAL + (%s || ' minutes')::INTERVAL as fin_creneau
@@ -217,9 +212,11 @@ class StudentRequests:
                 sd.id as salle_id,
                 sd.capacite,
                 NOT EXISTS (
-                    SELECT 1 FROM examens_futurs ef
-                    WHERE NOT (ef.date_heure + (ef.duree_minutes || ' minutes')::INTERVAL <= c.debut_creneau
-                           OR ef.date_heure >= c.fin_creneau)
+                    SELECT 1 FROM examens e
+                    WHERE e.salle_id = sd.id
+                        AND e.statut IN ('Planifie', 'Confirme')
+                        AND e.creneau && tsrange(c.debut_creneau, c.fin_creneau)
+                        AND e.date_heure >= debut_annees_actives()
                 ) as creneau_libre
             FROM creneaux c
             CROSS JOIN salles_disponibles sd
@@ -231,8 +228,7 @@ class StudentRequests:
             
             return execute_query(
                 query, 
-                (exam['date_heure'], exam['date_heure'], 
-                 exam['date_heure'].date(), exam['date_heure'].date(),
+                (exam['date_heure'].date(), exam['date_heure'].date(),
                  exam['duree_minutes'])
             )
             
@@ -199,6 +199,16 @@ def kpi_card(title: str, value: str, sub: str = "", tone: str = "ok"):
     )
 
 
+def freshness_caption(freshness: dict):
+    """Légende sous une vue matérialisée : heure du calcul, mise à jour en attente"""
+    if not freshness or not freshness.get("rafraichi_at"):
+        return
+    text = f"🕒 Données calculées le {freshness['rafraichi_at'].strftime('%d/%m/%Y à %H:%M:%S')}"
+    if freshness.get("en_attente"):
+        text += " · mise à jour en cours"
+    st.caption(text)
+
+
 def hero_header(title: str, subtitle: str, pills=None):
     pills = pills or []
     pills_html = "".join([f'<span class="pill">{p}</span>' for p in pills])
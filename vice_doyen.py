@@ -2,7 +2,7 @@
 import streamlit as st
 import pandas as pd
 
-from ui_theme import section_header, kpi_card, hero_header
+from ui_theme import section_header, kpi_card, hero_header, freshness_caption
 from connection import execute_query
 from queries import (
     get_occupation_salles,
@@ -10,11 +10,13 @@ from queries import (
     detecter_tous_les_conflits,
     get_planning_examens,
     valider_tout_le_planning,
+    fetch_kpis,
+    get_fraicheur_vues,
 )
 
 # -------- Helpers robustes ----------
 def q_scalar(sql: str, params=None, key: str = None, default=0):
-    rows = execute_query(sql, params or ())
+    rows = execute_query(sql, params or (), readonly=True)
     if not rows:
         return default
     row = rows[0] or {}
@@ -27,7 +29,7 @@ def q_scalar(sql: str, params=None, key: str = None, default=0):
 def df_query(sql: str, params=None) -> pd.DataFrame:
     """Retourne un DataFrame (jamais plante)."""
     try:
-        rows = execute_query(sql, params or ())
+        rows = execute_query(sql, params or (), readonly=True)
         return pd.DataFrame(rows) if rows else pd.DataFrame()
     except Exception:
         return pd.DataFrame()
@@ -71,6 +73,7 @@ def get_planning_examens_fallback() -> pd.DataFrame:
         JOIN professeurs p ON p.id = e.professeur_id
         JOIN lieux_examen l ON l.id = e.salle_id
         WHERE e.statut IN ('Planifie','Confirme')
+          AND e.date_heure >= debut_annees_actives()
         ORDER BY e.date_heure DESC
         """
     )
@@ -104,33 +107,35 @@ def vice_doyen_dashboard():
     if page == "🏠 Vue Globale & KPIs":
         section_header("📌 Indicateurs clés", "Suivi global du planning.")
 
-        total_examens = q_scalar(
-            "SELECT COUNT(*) FROM examens WHERE statut IN ('Planifie','Confirme')"
-        )
-
-        taux_salles = q_scalar(
-            """
-            SELECT ROUND(
-                (SELECT COUNT(DISTINCT salle_id)
-                 FROM examens
-                 WHERE statut IN ('Planifie','Confirme')
-                ) * 100.0 /
-                NULLIF((SELECT COUNT(*) FROM lieux_examen WHERE is_disponible = TRUE),0),
-                2
-            )
-            """
-        ) or 0
-
-        conflits = q_scalar("SELECT COUNT(*) FROM detecter_conflits()") or 0
-
-        taux_confirmes = q_scalar(
-            """
-            SELECT ROUND(
-                COUNT() FILTER (WHERE statut='Confirme') * 100.0 / NULLIF(COUNT(),0),
-                2
-            ) FROM examens
-            """
-        ) or 0
+        kpis = fetch_kpis({
+            "total_examens": """
+                SELECT COUNT(*) FROM examens
+                WHERE statut IN ('Planifie','Confirme') AND date_heure >= debut_annees_actives()
+            """,
+            "taux_salles": """
+                SELECT ROUND(
+                    (SELECT COUNT(DISTINCT salle_id)
+                     FROM examens
+                     WHERE statut IN ('Planifie','Confirme')
+                       AND date_heure >= debut_annees_actives()
+                    ) * 100.0 /
+                    NULLIF((SELECT COUNT(*) FROM lieux_examen WHERE is_disponible = TRUE),0),
+                    2
+                )
+            """,
+            "conflits": "SELECT COUNT(*) FROM conflits_actifs",
+            "taux_confirmes": """
+                SELECT ROUND(
+                    COUNT(*) FILTER (WHERE statut='Confirme') * 100.0 / NULLIF(COUNT(*),0),
+                    2
+                ) FROM examens WHERE date_heure >= debut_annees_actives()
+            """,
+        })
+
+        total_examens = kpis["total_examens"]
+        taux_salles = kpis["taux_salles"]
+        conflits = kpis["conflits"]
+        taux_confirmes = kpis["taux_confirmes"]
 
         c1, c2, c3, c4 = st.columns(4)
         with c1: kpi_card("📝 Examens planifiés", int(total_examens), "Planifie / Confirme", "ok")
@@ -139,11 +144,13 @@ def vice_doyen_dashboard():
         with c4: kpi_card("✅ Taux confirmés", f"{float(taux_confirmes):.1f}%", "Objectif ≥ 60%", "warn" if float(taux_confirmes) < 60 else "ok")
 
         section_header("🏢 Occupation des salles", "Analyse de charge")
+        fraicheur = get_fraicheur_vues()
         occ = get_occupation_salles()
         if occ is None or occ.empty:
             st.info("Aucune donnée.")
         else:
             st.dataframe(occ, use_container_width=True, height=300 if not compact else 200)
+            freshness_caption(fraicheur.get("mv_occupation_salles"))
 
         section_header("📈 Statistiques par département", "Vue académique")
         stats = get_stats_departement()
@@ -151,6 +158,7 @@ def vice_doyen_dashboard():
             st.info("Aucune statistique.")
         else:
             st.dataframe(stats, use_container_width=True, height=300 if not compact else 200)
+            freshness_caption(fraicheur.get("mv_stats_departement"))
 
     # =========================================================
     # PAGE 2 : Conflits par sévérité
@@ -188,7 +196,7 @@ def vice_doyen_dashboard():
     elif page == "✅ Validation finale EDT":
         section_header("✅ Validation finale du planning", "Décision institutionnelle")
 
-        conflits_val = int(q_scalar("SELECT COUNT(*) FROM detecter_conflits()") or 0)
+        conflits_val = int(q_scalar("SELECT COUNT(*) FROM conflits_actifs") or 0)
 
         # 1) Essai via queries.py
         planning = get_planning_examens()
@@ -236,7 +244,11 @@ def vice_doyen_dashboard():
         else:
             confirm = st.checkbox("Je confirme la validation globale")
             if st.button("🚀 Valider tout", type="primary", disabled=not confirm):
-                if valider_tout_le_planning():
+                barre = st.progress(0, text="Validation par lots...")
+                if valider_tout_le_planning(
+                    lambda faits, total: barre.progress(faits / total, text=f"✅ {faits:,} / {total:,} examens confirmés"),
+                    st.session_state.get("user", {}).get("id")
+                ):
                     st.success("Planning officiellement validé ✅")
                     st.rerun()
                 else:
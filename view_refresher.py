@@ -0,0 +1,72 @@
+"""
+view_refresher.py - Rafraîchissement en tâche de fond des vues matérialisées
+Un thread par processus appelle rafraichir_vues_en_attente() (bdd.sql,
+PARTIE 13) à intervalle régulier. Paramètres optionnels dans
+st.secrets["postgres"] :
+    views_refresh_interval   secondes entre deux passages (2)
+    views_quiet_period       secondes sans changement avant rafraîchissement (2)
+    views_max_wait           attente maximum d'une demande sous écritures continues (30)
+"""
+
+import threading
+from datetime import timedelta
+
+import streamlit as st
+
+from connection import get_pool
+
+
+class ViewRefresher(threading.Thread):
+    """Thread démon : vide la file de rafraîchissement des vues matérialisées"""
+
+    def __init__(self, pool, interval=2.0, quiet_period=2.0, max_wait=30.0):
+        super().__init__(name="view-refresher", daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.quiet_period = timedelta(seconds=quiet_period)
+        self.max_wait = timedelta(seconds=max_wait)
+        self.refreshed = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.refresh_once()
+
+    def refresh_once(self) -> int:
+        """Un passage ; retourne le nombre de vues rafraîchies"""
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT rafraichir_vues_en_attente(%s, %s)",
+                        (self.quiet_period, self.max_wait)
+                    )
+                    count = cur.fetchone()[0]
+                conn.commit()
+        except Exception as e:
+            # Pas d'affichage Streamlit hors du thread de rendu
+            self.errors += 1
+            self.last_error = str(e)
+            return 0
+
+        self.refreshed += count
+        return count
+
+    def stop(self):
+        self._stop_event.set()
+
+
+@st.cache_resource(show_spinner=False)
+def start_view_refresher() -> ViewRefresher:
+    """Démarre le thread une seule fois par processus (toutes sessions confondues)"""
+    cfg = st.secrets["postgres"]
+    refresher = ViewRefresher(
+        get_pool(),
+        interval=float(cfg.get("views_refresh_interval", 2)),
+        quiet_period=float(cfg.get("views_quiet_period", 2)),
+        max_wait=float(cfg.get("views_max_wait", 30)),
+    )
+    refresher.start()
+    return refresher
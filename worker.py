@@ -0,0 +1,284 @@
+"""
+worker.py - Exécution des travaux en file (jobs.py, bdd.sql PARTIE 16)
+    python worker.py                          # tous les types, en boucle
+    python worker.py --types generation       # worker spécialisé
+    python worker.py --once                   # au plus un travail puis sortie
+Autant de workers que voulu, sur une ou plusieurs machines : chaque travail
+est réservé par reserver_job() (FOR UPDATE SKIP LOCKED). En attente, le
+worker dort sur LISTEN jobs et se réveille dès qu'un travail est soumis.
+Un thread publie heartbeat_at ; un worker arrêté brutalement voit son
+travail remis en file par recuperer_jobs_abandonnes().
+Identifiants : st.secrets["postgres"], comme l'application.
+"""
+
+import argparse
+import os
+import select
+import signal
+import socket
+import threading
+import time
+from datetime import date
+
+import psycopg2
+import psycopg2.extras
+
+from admin_examens import ExamScheduleOptimizer
+from conflict_analysis import ConflictAnalyzer
+from connection import SimpleConnection, load_dataframe
+from jobs import TYPES, to_json
+from queries import CONFLITS_QUERY
+
+
+class JobCancelled(Exception):
+    """Le travail a été annulé (ou repris par un autre worker) en cours d'exécution"""
+
+
+class JobContext:
+    """
+    Publication de la progression d'un travail en cours. Les appels trop
+    rapprochés sont regroupés (au plus un UPDATE par min_interval secondes).
+    """
+
+    def __init__(self, conn, job_id, min_interval=1.0):
+        self.conn = conn
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._last = 0.0
+
+    def _update(self, sql, params):
+        """UPDATE sur le travail tant qu'il est EN_COURS ; False sinon"""
+        with self._lock, self.conn.cursor() as cur:
+            cur.execute(sql + " WHERE id = %s AND statut = 'EN_COURS' RETURNING id", params + (self.job_id,))
+            return cur.fetchone() is not None
+
+    def progress(self, percent, message):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        now = time.monotonic()
+        if percent < 100 and now - self._last < self.min_interval:
+            return
+        self._last = now
+        if not self._update(
+            "UPDATE jobs SET progression = %s, message = %s, heartbeat_at = clock_timestamp()",
+            (max(0, min(100, int(percent))), message)
+        ):
+            self.cancelled.set()
+            raise JobCancelled()
+
+    def heartbeat(self):
+        if not self._update("UPDATE jobs SET heartbeat_at = clock_timestamp()", ()):
+            self.cancelled.set()
+
+
+def run_generation(params, ctx):
+    """Génération du planning ; le résultat se recharge dans ExamScheduleOptimizer.from_job_result"""
+    start_date = date.fromisoformat(params["date_debut"])
+    end_date = date.fromisoformat(params["date_fin"])
+    engine = params.get("engine", "coloration")
+    budget = float(params.get("budget", 0))
+    started = time.perf_counter()
+
+    ctx.progress(0, "📥 Chargement des données...")
+    optimizer = ExamScheduleOptimizer(start_date, end_date, params.get("departement_id"), engine=engine)
+    if not optimizer.load_data(verbose=False):
+        return {"schedule": [], "conflicts": [], "modules": 0, "stats": {}, "duree": time.perf_counter() - started}
+
+    stats = {}
+    if params.get("parallele"):
+        from parallel_scheduler import generate_parallel
+
+        restarts = int(params.get("redemarrages", 4))
+        optimizer = generate_parallel(
+            optimizer.modules_data, optimizer.rooms, start_date, end_date,
+            existing_exams=optimizer.existing_exams, engine=engine, restarts=restarts, budget_seconds=budget,
+            on_progress=lambda done, total: ctx.progress(
+                5 + done * 90 // total, f"⚡ {done}/{total} tâches terminées"
+            )
+        )
+        stats = dict(optimizer.parallel_stats, restarts=restarts)
+    else:
+        # Sans amélioration, la construction occupe toute la barre
+        share = 40 if budget > 0 else 95
+        optimizer.build_schedule(lambda percent, message: ctx.progress(5 + percent * share // 100, message))
+        if budget > 0:
+            optimizer.improve_schedule(
+                budget,
+                lambda elapsed, cost, best: ctx.progress(
+                    45 + int(50 * min(elapsed / budget, 1.0)), f"📉 {elapsed:.0f}s / {budget:.0f}s — meilleur coût : {best:,.1f}"
+                ),
+                weights=params.get("weights") or None
+            )
+            search = optimizer.search
+            stats = {"initial_cost": search.initial_cost, "best_cost": search.best_cost, "iterations": search.iterations}
+
+    # Planning candidat confronté aux examens et inscriptions en base, en mémoire
+    ctx.progress(97, "🧮 Validation du planning...")
+    validation = ConflictAnalyzer.from_db().with_schedule(optimizer.generated_schedule).counts()
+
+    return {
+        "schedule": optimizer.generated_schedule,
+        "validation": validation,
+        "conflicts": optimizer.conflicts,
+        "modules": len(optimizer.modules_data or []),
+        "edges": optimizer.graph.n_edges if optimizer.graph is not None else None,
+        "stats": stats,
+        "duree": time.perf_counter() - started,
+    }
+
+
+def run_conflits(params, ctx):
+    """Analyse des conflits du planning en base (detecter_conflits())"""
+    ctx.progress(0, "🔍 Détection des conflits...")
+    conflits = load_dataframe(CONFLITS_QUERY)
+    par_severite = conflits["severite"].value_counts().to_dict() if "severite" in conflits.columns else {}
+    return {"conflits": conflits.to_dict("records"), "total": len(conflits), "par_severite": par_severite}
+
+
+HANDLERS = {
+    "generation": run_generation,
+    "conflits": run_conflits,
+}
+
+
+class Worker:
+    """Boucle de réservation / exécution sur une connexion dédiée (autocommit)"""
+
+    def __init__(self, name, types=TYPES, poll_interval=10.0, heartbeat_interval=15.0, stale_after=120.0):
+        self.name = name
+        self.types = list(types)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.conn = None
+        self.current = None
+        self.done = 0
+        self._stop_event = threading.Event()
+
+    def _connect(self):
+        self.conn = SimpleConnection.connect()
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute("LISTEN jobs")
+
+    def _claim(self):
+        with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("SELECT recuperer_jobs_abandonnes(%s * INTERVAL '1 second')", (self.stale_after,))
+            recovered = cur.fetchone()["recuperer_jobs_abandonnes"]
+            if recovered:
+                print(f"[{self.name}] {recovered} travail(aux) abandonné(s) récupéré(s)", flush=True)
+            cur.execute("SELECT * FROM reserver_job(%s, %s)", (self.name, self.types))
+            return cur.fetchone()
+
+    def _wait(self):
+        """Attend une notification (ou poll_interval) ; les notifications reçues sont consommées"""
+        if select.select([self.conn], [], [], self.poll_interval) != ([], [], []):
+            self.conn.poll()
+        self.conn.notifies.clear()
+
+    def _finish(self, job_id, sql, params):
+        with self.conn.cursor() as cur:
+            cur.execute(sql + ", finished_at = clock_timestamp() WHERE id = %s AND statut = 'EN_COURS'", params + (job_id,))
+
+    def execute(self, job):
+        ctx = JobContext(self.conn, job["id"])
+        self.current = job["id"]
+        stop_heartbeat = threading.Event()
+
+        def beat():
+            while not stop_heartbeat.wait(self.heartbeat_interval):
+                try:
+                    ctx.heartbeat()
+                except Exception:
+                    pass
+
+        heartbeat = threading.Thread(target=beat, name=f"heartbeat-{job['id']}", daemon=True)
+        heartbeat.start()
+        started = time.perf_counter()
+        print(f"[{self.name}] travail {job['id']} ({job['type']}) démarré", flush=True)
+        try:
+            result = HANDLERS[job["type"]](job["parametres"] or {}, ctx)
+            self._finish(job["id"], "UPDATE jobs SET statut = 'TERMINE', progression = 100, "
+                                    "message = %s, resultat = %s",
+                         ("✅ Terminé", to_json(result)))
+            print(f"[{self.name}] travail {job['id']} terminé en {time.perf_counter() - started:.1f}s", flush=True)
+        except JobCancelled:
+            print(f"[{self.name}] travail {job['id']} annulé", flush=True)
+        except (KeyboardInterrupt, SystemExit):
+            # Arrêt du worker : le travail repart en file pour un autre worker
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE jobs SET statut = 'EN_ATTENTE', message = %s, worker = NULL, tentatives = tentatives - 1
+                    WHERE id = %s AND statut = 'EN_COURS'
+                """, ("Worker arrêté, travail remis en file", job["id"]))
+            raise
+        except Exception as e:
+            self._finish(job["id"], "UPDATE jobs SET statut = 'ECHOUE', erreur = %s", (f"{type(e).__name__}: {e}",))
+            print(f"[{self.name}] travail {job['id']} en échec : {e}", flush=True)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+            self.current = None
+        self.done += 1
+
+    def run(self, once=False):
+        delay = 1.0
+        while not self._stop_event.is_set():
+            try:
+                if self.conn is None or self.conn.closed:
+                    self._connect()
+                    delay = 1.0
+                job = self._claim()
+                if job is not None:
+                    self.execute(job)
+                    if once:
+                        return
+                elif once:
+                    return
+                else:
+                    self._wait()
+            except psycopg2.OperationalError as e:
+                # Base injoignable : reconnexion avec attente croissante
+                print(f"[{self.name}] connexion perdue ({e}), nouvel essai dans {delay:.0f}s", flush=True)
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                if self._stop_event.wait(delay):
+                    break
+                delay = min(delay * 2, 60.0)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _terminate(signum, frame):
+    # SIGTERM (arrêt du service) : même traitement que Ctrl+C
+    raise SystemExit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", nargs="+", choices=TYPES, default=list(TYPES))
+    parser.add_argument("--once", action="store_true", help="au plus un travail puis sortie")
+    parser.add_argument("--poll", type=float, default=10.0, help="secondes entre deux vérifications sans notification")
+    parser.add_argument("--name", default=f"{socket.gethostname()}:{os.getpid()}")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _terminate)
+
+    worker = Worker(args.name, types=args.types, poll_interval=args.poll)
+    print(f"[{worker.name}] en attente de travaux : {', '.join(worker.types)}", flush=True)
+    try:
+        worker.run(once=args.once)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if worker.conn is not None and not worker.conn.closed:
+            worker.conn.close()
+    print(f"[{worker.name}] arrêt après {worker.done} travail(aux)", flush=True)
+
+
+if __name__ == "__main__":
+    main()